@@ -0,0 +1,117 @@
+"""IVF 近似検索 (core/ann.py) と全件検索の recall / レイテンシ比較。
+
+クラスタ構造を持つ合成ベクトル（``--clusters`` 個の中心 + ノイズ、正規化済み）を
+``--sizes`` の各件数でベクトルファイルに書き、IVF インデックスを作成して
+``--queries`` 件のクエリについて
+
+- exact: VectorStore の全件内積 + argpartition
+- ivf(nprobe=N): 近傍 N リストのみ
+
+の平均 / p95 レイテンシと、exact に対する recall@k を表示する。
+
+使い方 (backend/ で実行):
+    python benchmarks/bench_ann.py --sizes 10000,100000,1000000 --dim 384
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lecture_system.test_settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from core import ann  # noqa: E402
+from core.rag import VectorStore, normalize  # noqa: E402
+
+BATCH = 50_000
+
+
+def write_dataset(store: VectorStore, rows: int, centers, noise: float, rng) -> None:
+    dim = centers.shape[1]
+    for start in range(0, rows, BATCH):
+        n = min(BATCH, rows - start)
+        labels = rng.integers(len(centers), size=n)
+        x = centers[labels] + rng.standard_normal((n, dim), dtype=np.float32) * (
+            noise / np.sqrt(dim)
+        )
+        store.append(normalize(x), "bench")
+
+
+def timed(fn, queries):
+    samples, results = [], []
+    for q in queries:
+        started = time.perf_counter()
+        results.append(fn(q))
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.95) - 1], results
+
+
+def recall(exact, approx) -> float:
+    hits = sum(
+        len({i for i, _ in e} & {i for i, _ in a}) for e, a in zip(exact, approx)
+    )
+    return hits / sum(len(e) for e in exact)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--nprobe", default="8,16,32")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = normalize(rng.standard_normal((args.clusters, args.dim)))
+    nprobes = [int(n) for n in args.nprobe.split(",")]
+    for rows in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = VectorStore("bench", tmp)
+            write_dataset(store, rows, centers, args.noise, rng)
+            matrix = store.matrix()
+            # クエリはデータ点にノイズを加えたもの（言い換えられた質問に相当）
+            picks = rng.choice(rows, args.queries, replace=False)
+            queries = normalize(
+                matrix[np.sort(picks)]
+                + rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+                * (0.3 / np.sqrt(args.dim))
+            )
+
+            started = time.perf_counter()
+            index = ann.IVFIndex.build(store.index_base, matrix)
+            build_s = time.perf_counter() - started
+
+            exact_fn = lambda q: ann.top_k(matrix @ q, args.top_k)  # noqa: E731
+            exact_fn(queries[0])
+            mean, p95, exact = timed(exact_fn, queries)
+            print(
+                f"rows={rows} dim={args.dim} nlist={len(index.centroids)} "
+                f"build={build_s:.1f}s"
+            )
+            print(f"  exact          mean={mean:7.2f}ms p95={p95:7.2f}ms")
+            for nprobe in nprobes:
+                fn = lambda q: index.search(q, args.top_k, nprobe=nprobe)  # noqa
+                fn(queries[0])
+                mean, p95, approx = timed(fn, queries)
+                print(
+                    f"  ivf nprobe={nprobe:<3} mean={mean:7.2f}ms p95={p95:7.2f}ms "
+                    f"recall@{args.top_k}={recall(exact, approx):.3f}"
+                )
+            del matrix, index
+
+
+if __name__ == "__main__":
+    main()
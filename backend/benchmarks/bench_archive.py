@@ -0,0 +1,161 @@
+"""メッセージのアーカイブ (core/archive.py) 前後の Message テーブル / インデックスの
+サイズと、読まれるセッションのクエリのレイテンシ比較。
+
+一時ファイルの SQLite に ``--sessions`` 件 × ``--messages`` 件のメッセージを作り、
+``--cold`` の割合のセッションの最終活動を 1 年前にして
+
+1. Message テーブルと ``(session, created_at)`` インデックスのサイズ（dbstat）
+2. 最近のセッションの最新 50 件の取得（``/messages/?limit=50`` と同じクエリ）
+3. セッションのメッセージ全件の取得（``/messages/`` と同じクエリ）
+
+を測る。次に ``archive_sessions`` + ``VACUUM`` を実行して同じ値を測り、
+アーカイブ済みセッションの読み出し（展開）時間も表示する。
+PostgreSQL ではページキャッシュや VACUUM の挙動が異なるため絶対値は参考。
+
+使い方 (backend/ で実行):
+    python benchmarks/bench_archive.py --sessions 2000 --messages 100 --cold 0.9
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lecture_system.test_settings")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+
+def setup(tmp: str) -> None:
+    settings.DATABASES["default"]["NAME"] = os.path.join(tmp, "bench.sqlite3")
+    django.setup()
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def create_data(sessions: int, messages: int, cold: float, chars: int, rng):
+    from django.utils import timezone
+
+    from core.models import LLM, ChatSession, Message
+
+    llm = LLM.objects.create(name="bench", model="bench")
+    rows = ChatSession.objects.bulk_create(
+        ChatSession(llm=llm, title=f"bench {i}") for i in range(sessions)
+    )
+    words = ["講義", "課題", "質問", "answer", "python", "django", "レポート"]
+    for start in range(0, sessions, 50):
+        Message.objects.bulk_create(
+            Message(
+                session=s,
+                role="user" if j % 2 == 0 else "assistant",
+                content=" ".join(rng.choices(words, k=chars // 6)),
+                usage={"eval_count": 10},
+            )
+            for s in rows[start : start + 50]
+            for j in range(messages)
+        )
+    rng.shuffle(rows)
+    n_cold = int(sessions * cold)
+    ChatSession.objects.filter(pk__in=[s.pk for s in rows[:n_cold]]).update(
+        last_activity_at=timezone.now() - timedelta(days=365)
+    )
+    return [s.pk for s in rows[n_cold:]], [s.pk for s in rows[:n_cold]]
+
+
+def sizes() -> dict:
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE tbl_name='core_message'")
+        names = [r[0] for r in cursor.fetchall()]
+        result = {}
+        for name in names:
+            cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name=%s", [name])
+            result[name] = cursor.fetchone()[0] or 0
+    return result
+
+
+def measure(fn, ids, repeat: int) -> dict:
+    samples = []
+    for pk in ids[:repeat]:
+        started = time.perf_counter()
+        fn(pk)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def report(label: str, hot: list, repeat: int) -> None:
+    from core.models import Message
+
+    def latest(pk):
+        list(Message.objects.filter(session_id=pk).order_by("-created_at", "-id")[:50])
+
+    def full(pk):
+        list(Message.objects.filter(session_id=pk))
+
+    print(f"[{label}]")
+    for name, size in sizes().items():
+        print(f"  {name:45s} {size / 1e6:8.2f} MB")
+    for name, fn in (("latest 50", latest), ("full history", full)):
+        r = measure(fn, hot, repeat)
+        print(f"  {name:14s} mean {r['mean']:.3f} ms  p95 {r['p95']:.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--cold", type=float, default=0.9)
+    parser.add_argument("--chars", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(tmp)
+        from django.core.management import call_command
+        from django.db import connection
+
+        from core import archive
+        from core.models import ChatSession
+
+        hot, cold = create_data(
+            args.sessions, args.messages, args.cold, args.chars, rng
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM")
+        rng.shuffle(hot)
+        report("before", hot, args.repeat)
+
+        started = time.perf_counter()
+        out = StringIO()
+        call_command("archive_sessions", "--vacuum", stdout=out)
+        elapsed = time.perf_counter() - started
+        print(out.getvalue().strip().splitlines()[-2], f"in {elapsed:.1f} s")
+        report("after", hot, args.repeat)
+
+        def read_archived(pk):
+            archive.messages(ChatSession.objects.get(pk=pk))
+
+        r = measure(read_archived, cold, args.repeat)
+        print(
+            f"  archived read  mean {r['mean']:.3f} ms  p95 {r['p95']:.3f} ms"
+            " (read-through)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""バックエンド自身のオーバーヘッドを測るチャット負荷ベンチマーク（ローカル完結）。
+
+ダミー Ollama (benchmarks/fake_ollama.py) と Django の WSGI アプリ（``--asgi`` なら
+``ASYNC_CHAT=true`` の ASGI アプリを uvicorn で）を同じプロセスで起動し、実際の ``POST /api/sessions/{uuid}/chat/``（``--stream`` なら
+``chat/stream/``）を ``--concurrency`` 並列で ``--requests`` 回送る。各リクエストは
+``--history`` 件の過去メッセージを持つ別々のセッションに送るため、履歴長は一定。
+
+表示 / 保存する値:
+- レイテンシ p50 / p95 / p99（stream では最初のバイトまでの時間も）、スループット
+- 1 リクエストあたりの DB クエリ数（リクエストを処理したスレッドの接続で数える）
+- プロセスの最大 RSS と計測中の増加量
+- エラー数（ダミー Ollama の ``--error-rate`` で失敗を注入できる）
+
+``--output`` で結果を JSON に保存し、``--compare`` に別のコミットで保存した JSON を
+渡すと差分を表示する。DB は既定で一時ファイルの SQLite（``--settings`` で
+PostgreSQL の設定も指定できる。その場合はマイグレーション済みの DB を使う）。
+WSGI の HTTP サーバは wsgiref のため、gunicorn 配下の値とは絶対値が異なる。
+``--asgi --stream`` は async の SSE ビュー（最初のバイトまでの時間が生成時間に
+比例していないか）の確認に使う。多数の待機中チャットの比較は bench_concurrency.py。
+
+使い方 (backend/ で実行):
+    python benchmarks/bench_chat.py --requests 500 --concurrency 8 --history 40 \\
+        --output before.json
+    python benchmarks/bench_chat.py --requests 500 --concurrency 8 --history 40 \\
+        --compare before.json
+    python benchmarks/bench_chat.py --asgi --stream --tokens-per-second 50
+"""
+
+import argparse
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import httpx
+
+from fake_ollama import FakeOllama
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class QueryCounter:
+    """リクエスト処理中に実行された SQL の数（全スレッド合計）"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def setup_django(settings_module: str | None, tmp: str, asgi: bool = False) -> None:
+    if settings_module:
+        os.environ["DJANGO_SETTINGS_MODULE"] = settings_module
+    else:
+        os.environ["DJANGO_SETTINGS_MODULE"] = "lecture_system.test_settings"
+    import django
+    from django.conf import settings
+
+    if not settings_module:
+        # インメモリ SQLite はスレッド間で共有できないためファイルにする
+        settings.DATABASES["default"].update(
+            NAME=os.path.join(tmp, "bench.sqlite3"), OPTIONS={"timeout": 30}
+        )
+    # core/urls.py は最初のリクエストで読まれるため setup 前に切り替えればよい
+    settings.ASYNC_CHAT = asgi
+    django.setup()
+    if not settings_module:
+        from django.core.management import call_command
+
+        call_command("migrate", verbosity=0)
+
+
+def make_app(counter: QueryCounter):
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connection
+
+    wsgi = get_wsgi_application()
+
+    def app(environ, start_response):
+        # stream の本文生成中のクエリも数えるため、反復が終わるまで包む
+        with connection.execute_wrapper(counter):
+            result = wsgi(environ, start_response)
+            try:
+                yield from result
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+    return app
+
+
+def start_asgi_server(counter: QueryCounter) -> tuple:
+    """uvicorn で ASGI アプリを別スレッドで起動し (server, port) を返す"""
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+    from django.db.backends.signals import connection_created
+
+    def count_queries(sender, connection, **kwargs):
+        # ASGI ではリクエストごとのスレッドで接続が作られるため、作成時に包む
+        if counter not in connection.execute_wrappers:
+            connection.execute_wrappers.append(counter)
+
+    connection_created.connect(count_queries, weak=False)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(
+        get_asgi_application(),
+        host="127.0.0.1",
+        port=port,
+        log_level="warning",
+        lifespan="off",
+        backlog=1024,
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, port
+
+
+def create_sessions(fake_url: str, count: int, history: int, chars: int):
+    from core.models import LLM, ChatSession, Message
+
+    llm = LLM.objects.create(
+        name="bench", provider="OLLAMA", model="bench", base_url=fake_url
+    )
+    sessions = ChatSession.objects.bulk_create(
+        ChatSession(llm=llm, title=f"bench {i}") for i in range(count)
+    )
+    text = ("x" * chars)[:chars]
+    for start in range(0, count, 100):
+        Message.objects.bulk_create(
+            Message(
+                session=s,
+                role="user" if j % 2 == 0 else "assistant",
+                content=text,
+            )
+            for s in sessions[start : start + 100]
+            for j in range(history)
+        )
+    return [str(s.uuid) for s in sessions]
+
+
+def one_request(client: httpx.Client, url: str, stream: bool):
+    """(成功, レイテンシ秒, 最初のバイトまでの秒)"""
+    started = time.perf_counter()
+    first = None
+    try:
+        if stream:
+            with client.stream("POST", url, json={"message": "Hi"}) as r:
+                failed = False
+                for line in r.iter_lines():
+                    if first is None:
+                        first = time.perf_counter() - started
+                    # 生成の失敗は 200 のまま error イベントで返る
+                    failed = failed or line == "event: error"
+                ok = r.status_code == 200 and not failed
+        else:
+            r = client.post(url, json={"message": "Hi"})
+            ok = r.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return ok, time.perf_counter() - started, first
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ms = sorted(s * 1000 for s in samples)
+    q = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return {
+        "mean": round(statistics.mean(ms), 2),
+        "p50": round(q[49], 2),
+        "p95": round(q[94], 2),
+        "p99": round(q[98], 2),
+        "max": round(ms[-1], 2),
+    }
+
+
+def _rss_mb() -> float:
+    # Linux の ru_maxrss は KiB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    fake = FakeOllama(
+        args.latency, args.tokens_per_second, args.tokens, args.error_rate
+    ).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(args.settings, tmp, args.asgi)
+        counter = QueryCounter()
+        if args.asgi:
+            server, port = start_asgi_server(counter)
+        else:
+            server = make_server(
+                "127.0.0.1",
+                0,
+                make_app(counter),
+                server_class=_ThreadingWSGIServer,
+                handler_class=_QuietHandler,
+            )
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            port = server.server_port
+        base = f"http://127.0.0.1:{port}/api/sessions"
+        suffix = "chat/stream/" if args.stream else "chat/"
+
+        total = args.warmup + args.requests
+        sessions = create_sessions(fake.url, total, args.history, args.message_chars)
+        urls = [f"{base}/{uuid}/{suffix}" for uuid in sessions]
+        limits = httpx.Limits(max_connections=args.concurrency)
+        with httpx.Client(timeout=args.timeout, limits=limits) as client:
+            for url in urls[: args.warmup]:
+                one_request(client, url, args.stream)
+            counter.count = 0
+            rss_before = _rss_mb()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                results = list(
+                    pool.map(
+                        lambda url: one_request(client, url, args.stream),
+                        urls[args.warmup :],
+                    )
+                )
+            wall = time.perf_counter() - started
+        if args.asgi:
+            server.should_exit = True
+        else:
+            server.shutdown()
+    fake.stop()
+
+    ok = [r for r in results if r[0]]
+    report = {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+        "latency_ms": _percentiles([r[1] for r in ok]),
+        "db_queries_per_request": round(counter.count / len(results), 2),
+        "rss_peak_mb": round(_rss_mb(), 1),
+        "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+    }
+    if args.stream:
+        report["first_byte_ms"] = _percentiles([r[2] for r in ok if r[2] is not None])
+    return {
+        "benchmark": "chat",
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": {
+            k: v for k, v in vars(args).items() if k not in ("output", "compare")
+        },
+        "results": report,
+    }
+
+
+def _flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict) -> None:
+    before, after = _flatten(baseline["results"]), _flatten(current["results"])
+    print(f"\ncompare: {baseline.get('commit')} -> {current.get('commit')}")
+    for key, new in after.items():
+        old = before.get(key)
+        if old is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else ""
+        print(f"  {key:32} {old:>10} -> {new:>10} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--history", type=int, default=20, help="セッションの過去件数")
+    parser.add_argument("--message-chars", type=int, default=200)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="ASYNC_CHAT=true の ASGI アプリ（uvicorn）で測る",
+    )
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="ダミーの TTFT 秒")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument(
+        "--settings", default=None, help="DJANGO_SETTINGS_MODULE（既定 SQLite）"
+    )
+    parser.add_argument("--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--compare", help="比較する以前の結果 JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result["results"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
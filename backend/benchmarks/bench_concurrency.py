@@ -0,0 +1,83 @@
+"""同時チャット数に対する sync (WSGI) / async (ASGI) モードの処理能力比較。
+
+起動済みのバックエンドに対し、応答に ``--latency`` 秒かかるダミー Ollama
+(fake_ollama.py) を向けた LLM / セッションを API で作成し、``--concurrency`` 件の /chat/ を同時に
+送って完了数・エラー数・レイテンシ分布を表示する。同期ワーカーでは同時に処理
+できるチャット数がワーカー数で頭打ちになり、レイテンシが階段状に伸びる。
+
+使い方 (backend/ で実行。ダミー Ollama はこのスクリプトが 127.0.0.1 で起動する):
+    # sync: gunicorn lecture_system.wsgi:application -w 4 --timeout 600
+    # async: ASYNC_CHAT=true uvicorn lecture_system.asgi:application --workers 4
+    python benchmarks/bench_concurrency.py --base-url http://127.0.0.1:8000 \\
+        --concurrency 200 --latency 2
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from fake_ollama import FakeOllama
+
+
+async def one_chat(client: httpx.AsyncClient, url: str) -> tuple[bool, float]:
+    start = time.perf_counter()
+    try:
+        r = await client.post(url, json={"message": "Hi"})
+        ok = r.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+async def run(args) -> None:
+    fake = FakeOllama(args.latency, tokens=1).start()
+    fake_url = fake.url
+    api = args.base_url.rstrip("/") + "/api"
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        llm = (
+            await client.post(
+                f"{api}/llms/",
+                json={"name": "bench", "model": "bench", "base_url": fake_url},
+            )
+        ).json()
+        sessions = [
+            (await client.post(f"{api}/sessions/", json={"llm": llm["id"]})).json()
+            for _ in range(args.concurrency)
+        ]
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(one_chat(client, f"{api}/sessions/{s['uuid']}/chat/") for s in sessions)
+        )
+        wall = time.perf_counter() - started
+    fake.stop()
+
+    latencies = sorted(t for ok, t in results if ok)
+    errors = sum(1 for ok, _ in results if not ok)
+    print(f"concurrency={args.concurrency} llm_latency={args.latency}s")
+    print(f"completed={len(latencies)} errors={errors} wall={wall:.2f}s")
+    if latencies:
+        q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies
+        print(
+            f"p50={statistics.median(latencies):.2f}s p95={q[94 if len(q) > 1 else 0]:.2f}s "
+            f"max={latencies[-1]:.2f}s"
+        )
+        # LLM レイテンシの 1.5 倍以内に返ったもの = 待たされずに同時処理できた数
+        capacity = sum(1 for t in latencies if t <= args.latency * 1.5)
+        print(f"served_concurrently={capacity}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=600)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
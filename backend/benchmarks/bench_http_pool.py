@@ -0,0 +1,85 @@
+"""OllamaClient の HTTP 接続プール有無による 1 リクエストあたりのオーバーヘッド比較。
+
+ローカルに即応答するダミー /api/chat サーバを立て、
+- before: 毎回 ``requests.post``（接続を都度確立）
+- after:  ``get_http_session`` の keep-alive セッション
+で同じ payload を N 回送り、平均 / p95 レイテンシを表示する。
+
+使い方 (backend/ で実行):
+    python benchmarks/bench_http_pool.py --requests 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.llm_clients import get_http_session  # noqa: E402
+
+BODY = json.dumps({"message": {"content": "ok"}, "done": True, "eval_count": 1})
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にする
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = BODY.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(post, url: str, n: int) -> list[float]:
+    payload = {"model": "bench", "messages": [{"role": "user", "content": "Hi"}]}
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        r = post(url, json=payload, timeout=(5, 120))
+        r.raise_for_status()
+        r.json()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]) -> None:
+    p95 = statistics.quantiles(samples, n=20)[-1]
+    print(
+        f"{label:<8} mean={statistics.mean(samples):.3f}ms "
+        f"p50={statistics.median(samples):.3f}ms p95={p95:.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    url = base_url + "/api/chat"
+
+    try:
+        report("before", measure(requests.post, url, args.requests))
+        report("after", measure(get_http_session(base_url).post, url, args.requests))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""RAG のベクトル検索 (VectorStore.search) のレイテンシ計測。
+
+ランダムな正規化ベクトルを ``--chunks`` 行 × ``--dim`` 次元でベクトルファイルに
+書き出し、メモリマップ経由の全件内積 + 上位 k 抽出を ``--queries`` 回行って
+平均 / p95 を表示する（埋め込み・DB 参照は含まない）。
+
+使い方 (backend/ で実行):
+    python benchmarks/bench_rag_retrieval.py --chunks 100000 --dim 768
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lecture_system.test_settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from core.rag import VectorStore, normalize  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore("bench", tmp)
+        for start in range(0, args.chunks, 10_000):
+            n = min(10_000, args.chunks - start)
+            store.append(normalize(rng.standard_normal((n, args.dim))), "bench")
+
+        queries = normalize(rng.standard_normal((args.queries, args.dim)))
+        store.search(queries[0], args.top_k)  # ページキャッシュに載せる
+        samples = []
+        for q in queries:
+            started = time.perf_counter()
+            store.search(q, args.top_k)
+            samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    print(
+        f"chunks={args.chunks} dim={args.dim} "
+        f"mean={statistics.mean(samples):.2f}ms "
+        f"p95={samples[int(len(samples) * 0.95) - 1]:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""ベンチマーク用のダミー Ollama サーバ。
+
+``/api/chat``（stream / 非 stream）、``/api/embed``、``/api/tags`` に応答する。
+応答までの遅延（``latency``、TTFT 相当）、生成速度（``tokens_per_second``）、
+トークン数（``tokens``）、エラー率（``error_rate``、HTTP 500 を返す）を指定できる。
+stream では 1 トークンずつ NDJSON を送る。
+
+ほかのベンチマークからは ``FakeOllama(...).start()`` で使う。単体でも起動でき、
+手元のバックエンドの ``OLLAMA_BASE_URL`` をここに向けて負荷試験ができる:
+    python benchmarks/fake_ollama.py --port 11434 --latency 0.2 --tokens-per-second 50
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 8
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # 既定の 5 では同時接続が SYN 再送で遅延する
+
+
+class FakeOllama:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        tokens: int = 20,
+        error_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def _final(self, prompt_tokens: int) -> dict:
+        eval_seconds = (
+            self.tokens / self.tokens_per_second if self.tokens_per_second else 0
+        )
+        return {
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_count": self.tokens,
+            "eval_duration": int(eval_seconds * 1e9) or 1,
+            "load_duration": 0,
+            "total_duration": int((self.latency + eval_seconds) * 1e9),
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _json(self, status: int, data: dict) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json(200, {"models": []})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if fake._fail():
+                    self._json(500, {"error": "injected failure"})
+                    return
+                if self.path == "/api/embed":
+                    texts = payload.get("input") or []
+                    texts = [texts] if isinstance(texts, str) else texts
+                    vectors = [
+                        [
+                            float((zlib.crc32(t.encode()) >> i) % 7 + 1)
+                            for i in range(EMBEDDING_DIM)
+                        ]
+                        for t in texts
+                    ]
+                    self._json(200, {"embeddings": vectors})
+                elif self.path == "/api/chat":
+                    self._chat(payload)
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def _chat(self, payload: dict) -> None:
+                messages = payload.get("messages") or []
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                time.sleep(fake.latency)
+                delay = 1 / fake.tokens_per_second if fake.tokens_per_second else 0
+                if not payload.get("stream", True):
+                    time.sleep(delay * fake.tokens)
+                    self._json(
+                        200,
+                        {
+                            "message": {
+                                "role": "assistant",
+                                "content": "ok " * fake.tokens,
+                            },
+                            **fake._final(prompt_tokens),
+                        },
+                    )
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for _ in range(fake.tokens):
+                    time.sleep(delay)
+                    self._chunk({"message": {"content": "ok "}, "done": False})
+                self._chunk({"message": {"content": ""}, **fake._final(prompt_tokens)})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data: dict) -> None:
+                line = json.dumps(data).encode() + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeOllama(
+        args.latency,
+        args.tokens_per_second,
+        args.tokens,
+        args.error_rate,
+        args.host,
+        args.port,
+    )
+    print(f"fake ollama listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
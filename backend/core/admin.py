@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
 
+from . import export, response_cache
 from .models import ChatSession, LLM, Message
 
 
@@ -8,6 +10,12 @@ class LLMAdmin(admin.ModelAdmin):
     list_display = ("name", "provider", "model", "is_active")
     list_filter = ("provider", "is_active")
     search_fields = ("name", "model")
+    actions = ["clear_response_cache"]
+
+    @admin.action(description="応答キャッシュを削除")
+    def clear_response_cache(self, request, queryset):
+        deleted = sum(response_cache.invalidate(llm) for llm in queryset)
+        self.message_user(request, f"{deleted} 件のキャッシュを削除しました")
 
 
 class MessageInline(admin.TabularInline):
@@ -23,6 +31,16 @@ class ChatSessionAdmin(admin.ModelAdmin):
     list_filter = ("is_active", "llm")
     search_fields = ("uuid", "title")
     inlines = [MessageInline]
+    actions = ["export_csv"]
+
+    @admin.action(description="メッセージを CSV でエクスポート")
+    def export_csv(self, request, queryset):
+        rows = export.rows(sessions=list(queryset.values_list("uuid", flat=True)))
+        response = StreamingHttpResponse(
+            export.render(rows, "csv"), content_type=export.CONTENT_TYPES["csv"]
+        )
+        response["Content-Disposition"] = 'attachment; filename="chats.csv"'
+        return response
 
 
 @admin.register(Message)
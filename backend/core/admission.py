@@ -0,0 +1,329 @@
+"""LLM ごとの同時生成数制限（アドミッション制御）。
+
+``LLM.extra["max_concurrency"]`` を設定すると、その LLM への生成は同時に
+``max_concurrency`` 件までに制限される。空きが無いリクエストは最大
+``max_queue`` 件まで ``queue_timeout`` 秒待ち、
+
+- 待ち行列も満杯なら即座に 429
+- 待ち時間が期限を超えたら 503
+
+として ``LLMBusyError`` を送出する（ビューが ``Retry-After`` 付きで返す）。
+
+PostgreSQL ではスロット / 待ち行列を advisory lock で表すため gunicorn の
+複数ワーカープロセスをまたいで制限される。ロックはプロセスで 1 本の専用 DB 接続に
+結びつき、プロセスが落ちても接続切断で解放される。それ以外の DB（テストの SQLite
+など）ではプロセス内のセマフォで制限する。
+"""
+
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import DatabaseError, connection, connections
+
+from .metrics import registry
+
+DEFAULT_QUEUE_TIMEOUT = 30.0
+DEFAULT_RETRY_AFTER = 5.0
+# 他プロセスの解放を待つポーリング間隔（待機中は 2 倍ずつ MAX_POLL_INTERVAL まで延ばす）
+POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 1.0
+MAX_SLOTS = 1024
+# advisory lock の名前空間（2 引数版の第 1 キー）
+SLOT_LOCK_NAMESPACE = 0x4C4C4D01
+QUEUE_LOCK_NAMESPACE = 0x4C4C4D02
+
+admission_in_flight = registry.gauge(
+    "llm_admission_in_flight", "Admitted generations in this process"
+)
+admission_queue_depth = registry.gauge(
+    "llm_admission_queue_depth", "Requests waiting for a generation slot"
+)
+admission_wait = registry.histogram(
+    "llm_admission_wait_seconds",
+    "Time spent waiting for a generation slot",
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf),
+)
+admission_rejected = registry.counter(
+    "llm_admission_rejected_total", "Requests rejected by admission control"
+)
+
+
+class LLMBusyError(Exception):
+    """同時生成数の上限により受け付けられなかった"""
+
+    def __init__(self, detail: str, status_code: int, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Limiter:
+    """待ち行列付きセマフォの共通部分（メトリクスと Retry-After の推定）"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        # 1 生成あたりの保持時間の移動平均（Retry-After の目安）
+        self._avg_hold = DEFAULT_RETRY_AFTER
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_hold))
+
+    def _reject(self, reason: str, status_code: int, detail: str):
+        admission_rejected.inc(llm=self.name, reason=reason)
+        return LLMBusyError(detail, status_code, self._retry_after())
+
+    def _queue_full(self):
+        return self._reject("queue_full", 429, "too many requests for this LLM")
+
+    def _timed_out(self):
+        return self._reject("timeout", 503, "timed out waiting for a generation slot")
+
+    def _update(self, in_flight: int = 0, waiting: int = 0) -> None:
+        with self._stats_lock:
+            self._in_flight += in_flight
+            self._waiting += waiting
+            admission_in_flight.set(self._in_flight, llm=self.name)
+            admission_queue_depth.set(self._waiting, llm=self.name)
+
+    def _observe_hold(self, seconds: float) -> None:
+        with self._stats_lock:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * seconds
+
+
+class LocalLimiter(_Limiter):
+    """プロセス内のセマフォ（PostgreSQL 以外の DB 用）"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._cond = threading.Condition()
+        self._slots_used = 0
+        self._queued = 0
+
+    def acquire(self) -> "Slot":
+        started = time.monotonic()
+        with self._cond:
+            if self._slots_used >= self.limit or self._queued:
+                if self._queued >= self.max_queue:
+                    raise self._queue_full()
+                self._queued += 1
+                self._update(waiting=1)
+                try:
+                    deadline = started + self.timeout
+                    while self._slots_used >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            if self._slots_used >= self.limit:
+                                raise self._timed_out()
+                finally:
+                    self._queued -= 1
+                    self._update(waiting=-1)
+            self._slots_used += 1
+        admission_wait.observe(time.monotonic() - started, llm=self.name)
+        self._update(in_flight=1)
+        return Slot(self, None)
+
+    def release(self, slot: "Slot") -> None:
+        with self._cond:
+            self._slots_used -= 1
+            self._cond.notify()
+
+
+class _LockConnection:
+    """advisory lock を保持するプロセス共有の DB 接続。
+
+    セッションレベルの advisory lock は同じ接続からなら何度でも取れてしまうため、
+    このプロセスが保持しているキーを ``_held`` で管理し、取得済みのキーは試さない。
+    接続はスレッド間で共有し、クエリは ``_mutex`` で直列化する（1 回は数百 µs）。
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._held: set[tuple[int, int]] = set()
+
+    def _cursor(self):
+        if self._conn is None or self._pid != os.getpid():
+            # fork 後の子プロセスは親の接続を閉じずに（親のロックを残して）作り直す
+            self._conn = connections.create_connection("default")
+            self._conn.inc_thread_sharing()
+            self._pid = os.getpid()
+            self._held.clear()
+        return self._conn.cursor()
+
+    def _query(self, sql: str, params: list):
+        try:
+            with self._cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchone()[0]
+        except DatabaseError:
+            # 切断されていればロックも解放されている。次回は接続し直す
+            conn, self._conn = self._conn, None
+            self._held.clear()
+            if conn is not None:
+                conn.dec_thread_sharing()
+                conn.close()
+            raise
+
+    def try_lock(self, namespace: int, keys) -> int | None:
+        """``keys`` のうち最初に取れたキー（どれも取れなければ None）"""
+        with self._mutex:
+            for key in keys:
+                if (namespace, key) in self._held:
+                    continue
+                if self._query("SELECT pg_try_advisory_lock(%s, %s)", [namespace, key]):
+                    self._held.add((namespace, key))
+                    return key
+        return None
+
+    def unlock(self, namespace: int, key: int) -> None:
+        with self._mutex:
+            if (namespace, key) not in self._held:
+                return  # 再接続で既に解放されている
+            self._held.discard((namespace, key))
+            self._query("SELECT pg_advisory_unlock(%s, %s)", [namespace, key])
+
+
+_lock_connection = _LockConnection()
+
+
+class PostgresLimiter(_Limiter):
+    """advisory lock によるプロセス横断のセマフォ。
+
+    スロット i は ``pg_try_advisory_lock(SLOT_LOCK_NAMESPACE, llm_id * MAX_SLOTS + i)``、
+    待ち行列の枠も同様に ``QUEUE_LOCK_NAMESPACE`` で表す。ロックはプロセス共有の
+    1 本の接続（``_LockConnection``）で保持する。待機中は同じプロセスの解放なら
+    即座に、他プロセスの解放は ``POLL_INTERVAL`` から倍々に延ばす（ジッター付き）
+    間隔のポーリングで検知する。
+    """
+
+    def __init__(self, llm_id: int, *args):
+        super().__init__(*args)
+        self.llm_id = llm_id
+        self._released = threading.Condition()
+
+    def _try_lock(self, namespace: int, count: int) -> int | None:
+        base = self.llm_id * MAX_SLOTS
+        # 複数プロセスが同じ順で試して同じキーを取り合わないよう開始位置をずらす
+        offset = random.randrange(count) if count else 0
+        keys = [base + (offset + i) % count for i in range(count)]
+        return _lock_connection.try_lock(namespace, keys)
+
+    def acquire(self) -> "Slot":
+        started = time.monotonic()
+        key = self._try_lock(SLOT_LOCK_NAMESPACE, self.limit)
+        if key is None:
+            key = self._wait(started)
+        admission_wait.observe(time.monotonic() - started, llm=self.name)
+        self._update(in_flight=1)
+        return Slot(self, key)
+
+    def _wait(self, started: float) -> int:
+        queue_key = self._try_lock(QUEUE_LOCK_NAMESPACE, self.max_queue)
+        if queue_key is None:
+            raise self._queue_full()
+        self._update(waiting=1)
+        try:
+            deadline = started + self.timeout
+            interval = POLL_INTERVAL
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timed_out()
+                with self._released:
+                    self._released.wait(
+                        min(remaining, interval * random.uniform(0.5, 1.0))
+                    )
+                key = self._try_lock(SLOT_LOCK_NAMESPACE, self.limit)
+                if key is not None:
+                    return key
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+        finally:
+            self._update(waiting=-1)
+            _lock_connection.unlock(QUEUE_LOCK_NAMESPACE, queue_key)
+
+    def release(self, slot: "Slot") -> None:
+        try:
+            _lock_connection.unlock(SLOT_LOCK_NAMESPACE, slot.handle)
+        finally:
+            with self._released:
+                self._released.notify()
+
+
+class Slot:
+    """取得したスロット。release() で返却する（2 回目以降は何もしない）"""
+
+    def __init__(self, limiter: _Limiter | None, handle):
+        self.limiter = limiter
+        self.handle = handle
+        self.acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released or self.limiter is None:
+            return
+        self._released = True
+        try:
+            self.limiter.release(self)
+        finally:
+            self.limiter._update(in_flight=-1)
+            self.limiter._observe_hold(time.monotonic() - self.acquired_at)
+
+
+_limiters: dict[tuple, _Limiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _settings(llm) -> tuple[int, int, float] | None:
+    extra = llm.extra or {}
+    limit = extra.get("max_concurrency")
+    if not limit:
+        return None
+    limit = min(int(limit), MAX_SLOTS)
+    max_queue = min(int(extra.get("max_queue", limit * 2)), MAX_SLOTS)
+    timeout = float(extra.get("queue_timeout", DEFAULT_QUEUE_TIMEOUT))
+    return limit, max_queue, timeout
+
+
+def get_limiter(llm) -> _Limiter | None:
+    """LLM の設定に対応するリミッタ（設定が無ければ None）。設定ごとに共有。"""
+    settings = _settings(llm)
+    if settings is None:
+        return None
+    key = (llm.pk, connection.vendor) + settings
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            if connection.vendor == "postgresql":
+                limiter = PostgresLimiter(llm.pk, llm.name, *settings)
+            else:
+                limiter = LocalLimiter(llm.name, *settings)
+            _limiters[key] = limiter
+        return limiter
+
+
+def acquire_slot(llm) -> Slot:
+    """生成スロットを 1 つ取得する。満杯なら LLMBusyError。"""
+    limiter = get_limiter(llm)
+    if limiter is None:
+        return Slot(None, None)
+    return limiter.acquire()
+
+
+@contextmanager
+def admit(llm):
+    slot = acquire_slot(llm)
+    try:
+        yield slot
+    finally:
+        slot.release()
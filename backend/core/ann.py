@@ -0,0 +1,248 @@
+"""RAG ベクトル検索用の IVF（転置ファイル）近似最近傍インデックス。
+
+学習:
+    行列 (rows, dim) のサンプルを球面 k-means で ``nlist`` 個のセントロイドに
+    クラスタリングし、全行を最も近いセントロイドのリストに割り当てる。
+    ベクトルはリスト順に並べ替えた ``<collection>.ivf.<世代>.f32`` に、セントロイド /
+    リスト境界 / 並べ替え後の位置 → 元の行番号を ``<collection>.ivf.<世代>.npz`` に
+    保存し、最後に ``<collection>.ivf.json`` の世代番号を置き換えて切り替える
+    （読み込み側は常に同じ世代の 2 ファイルを組にして開く）。
+
+検索:
+    クエリに近い ``nprobe`` 個のリストだけを連続領域として内積を取り、
+    ``argpartition`` で上位 k を選ぶ。インデックス作成後に追記された行（末尾）は
+    ``merge`` されるまで全件内積で検索するため、追記直後でも取りこぼさない。
+
+``merge`` は再学習せずに末尾の行を既存のセントロイドへ割り当てる（k-means は
+やり直さない）が、並べ替えファイルは全行で書き直すため取り込みごとに O(N) の
+書き込みになる。データの分布が大きく変わったら ``build`` し直す。
+
+``build`` / ``merge`` に ``dead``（行番号 → 削除済みの真偽）を渡すと、その行は
+どのリストにも入れない（ラベル -1）。再取り込みで参照されなくなった行はここで
+インデックスから消える。
+"""
+
+import glob
+import json
+import math
+import os
+
+import numpy as np
+
+KMEANS_ITERATIONS = 10
+SAMPLES_PER_LIST = 64
+MAX_TRAIN_SAMPLES = 200_000
+ASSIGN_BATCH = 65_536
+DEFAULT_NPROBE = 16
+
+
+def default_nlist(rows: int) -> int:
+    return max(1, int(math.sqrt(rows)))
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1, norms)
+
+
+def train_centroids(
+    sample: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0
+) -> np.ndarray:
+    """正規化済みベクトルの球面 k-means（内積で割り当て、平均を正規化）"""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        # 空のクラスタはランダムな点で埋め直す
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def assign(matrix, centroids: np.ndarray, start: int = 0, stop: int | None = None):
+    """matrix[start:stop] の各行に最も近いセントロイド番号"""
+    stop = len(matrix) if stop is None else stop
+    labels = np.empty(stop - start, dtype=np.int32)
+    for i in range(start, stop, ASSIGN_BATCH):
+        j = min(i + ASSIGN_BATCH, stop)
+        labels[i - start : j - start] = np.argmax(
+            np.asarray(matrix[i:j]) @ centroids.T, axis=1
+        )
+    return labels
+
+
+def top_k(scores: np.ndarray, k: int, ids=None) -> list[tuple[int, float]]:
+    """scores の上位 k 件を ``argpartition`` で取り出し、(id, score) の降順で返す。
+
+    全件ソートしないため O(N)。ids を省略すると scores の添字を id とする。
+    """
+    k = min(k, len(scores))
+    if k == 0:
+        return []
+    top = np.argpartition(scores, -k)[-k:]
+    top = top[np.argsort(-scores[top])]
+    if ids is None:
+        return [(int(i), float(scores[i])) for i in top]
+    return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def _drop(labels: np.ndarray, dead: np.ndarray | None) -> np.ndarray:
+    if dead is not None:
+        labels = labels.copy()
+        n = min(len(labels), len(dead))
+        labels[:n][dead[:n]] = -1
+    return labels
+
+
+class IVFIndex:
+    def __init__(self, centroids, offsets, order, labels, vectors, generation=0):
+        self.centroids = centroids  # (nlist, dim)
+        self.offsets = offsets  # リスト i は並べ替え後の [offsets[i], offsets[i+1])
+        self.order = order  # 並べ替え後の位置 → 元の行番号
+        self.labels = labels  # 元の行番号 → リスト番号（-1 は削除済み。merge 用）
+        self.vectors = vectors  # 並べ替え済みベクトル（メモリマップ）
+        self.generation = generation
+
+    @property
+    def rows(self) -> int:
+        """インデックス済みの行数（これ以降の行は末尾として全件検索）"""
+        return len(self.labels)
+
+    @staticmethod
+    def pointer_path(base: str) -> str:
+        """現在の世代番号を持つファイル（置き換えで切り替わる）"""
+        return base + ".ivf.json"
+
+    @staticmethod
+    def paths(base: str, generation: int) -> tuple[str, str]:
+        return f"{base}.ivf.{generation}.npz", f"{base}.ivf.{generation}.f32"
+
+    @staticmethod
+    def all_paths(base: str) -> list[str]:
+        """ポインタと全世代のファイル（削除用）"""
+        return glob.glob(glob.escape(base) + ".ivf.*")
+
+    @classmethod
+    def _generation(cls, base: str) -> int | None:
+        try:
+            with open(cls.pointer_path(base)) as f:
+                return json.load(f)["generation"]
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, base: str, retries: int = 3) -> "IVFIndex | None":
+        for _ in range(retries):
+            generation = cls._generation(base)
+            if generation is None:
+                return None
+            meta_path, vec_path = cls.paths(base, generation)
+            try:
+                with np.load(meta_path) as data:
+                    centroids, offsets = data["centroids"], data["offsets"]
+                    order, labels = data["order"], data["labels"]
+                vectors = np.memmap(
+                    vec_path,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(len(order), centroids.shape[1]),
+                )
+            except FileNotFoundError:
+                # ポインタを読んだ後に次の世代へ切り替わり、旧世代が消された
+                continue
+            return cls(centroids, offsets, order, labels, vectors, generation)
+        return None
+
+    @classmethod
+    def _write(cls, base: str, matrix, centroids: np.ndarray, labels: np.ndarray):
+        previous = cls._generation(base)
+        generation = 0 if previous is None else previous + 1
+        meta_path, vec_path = cls.paths(base, generation)
+        live = np.flatnonzero(labels >= 0)
+        order = live[np.argsort(labels[live], kind="stable")].astype(np.int64)
+        counts = np.bincount(labels[live], minlength=len(centroids))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        # 新しい世代のファイルを書き終えてからポインタを置き換える
+        # （検索中のプロセスは旧世代の組を読み続ける）
+        with open(vec_path, "wb") as f:
+            for i in range(0, len(order), ASSIGN_BATCH):
+                rows = order[i : i + ASSIGN_BATCH]
+                f.write(np.ascontiguousarray(matrix[rows], dtype=np.float32).tobytes())
+        with open(meta_path, "wb") as f:
+            np.savez(
+                f, centroids=centroids, offsets=offsets, order=order, labels=labels
+            )
+        pointer = cls.pointer_path(base)
+        with open(pointer + ".tmp", "w") as f:
+            json.dump({"generation": generation}, f)
+        os.replace(pointer + ".tmp", pointer)
+        if previous is not None:
+            for path in cls.paths(base, previous):
+                try:
+                    # POSIX ではメモリマップ中のプロセスは削除後も読める
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def build(
+        cls,
+        base: str,
+        matrix,
+        nlist: int | None = None,
+        seed: int = 0,
+        dead: np.ndarray | None = None,
+    ):
+        """生きている行で k-means を学習してインデックスを作る"""
+        live = np.arange(len(matrix)) if dead is None else np.flatnonzero(~dead)
+        if not len(live):
+            live = np.arange(len(matrix))
+        nlist = nlist or default_nlist(len(live))
+        rng = np.random.default_rng(seed)
+        n_sample = min(len(live), nlist * SAMPLES_PER_LIST, MAX_TRAIN_SAMPLES)
+        sample_rows = np.sort(rng.choice(live, n_sample, replace=False))
+        centroids = train_centroids(
+            np.asarray(matrix[sample_rows], dtype=np.float32), nlist, seed=seed
+        )
+        labels = _drop(assign(matrix, centroids), dead)
+        cls._write(base, matrix, centroids, labels)
+        return cls.load(base)
+
+    def merge(self, base: str, matrix, dead: np.ndarray | None = None) -> "IVFIndex":
+        """追記された行を既存のセントロイドに割り当て、削除済みの行を外す"""
+        tail = assign(matrix, self.centroids, self.rows)
+        labels = _drop(np.concatenate([self.labels, tail]), dead)
+        self._write(base, matrix, self.centroids, labels)
+        return self.load(base)
+
+    def stale(self, dead: np.ndarray | None) -> bool:
+        """インデックスに削除済みの行が残っているか"""
+        if dead is None:
+            return False
+        n = min(self.rows, len(dead))
+        return bool((dead[:n] & (self.labels[:n] >= 0)).any())
+
+    def search(
+        self, query: np.ndarray, k: int, matrix=None, nprobe: int = DEFAULT_NPROBE
+    ) -> list[tuple[int, float]]:
+        """近い nprobe 個のリスト + 未インデックスの末尾行から上位 k 件"""
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+        scores, ids = [], []
+        for c in probe:
+            start, stop = self.offsets[c], self.offsets[c + 1]
+            if start == stop:
+                continue
+            scores.append(self.vectors[start:stop] @ query)
+            ids.append(self.order[start:stop])
+        if matrix is not None and len(matrix) > self.rows:
+            scores.append(matrix[self.rows :] @ query)
+            ids.append(np.arange(self.rows, len(matrix)))
+        if not scores:
+            return []
+        return top_k(np.concatenate(scores), k, np.concatenate(ids))
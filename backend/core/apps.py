@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        # LLM の保存 / 削除でクライアントキャッシュを無効化するシグナル
+        from . import llm_cache  # noqa: F401
+
+        # Message の作成でセッションの集計値を更新するシグナル
+        from . import session_stats  # noqa: F401
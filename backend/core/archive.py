@@ -0,0 +1,112 @@
+"""古いセッションのメッセージのアーカイブ（コールドストレージ）。
+
+``archive_session`` はセッションの全メッセージを JSONL にして zlib で圧縮し、
+``MessageArchive`` の 1 行に保存してから ``Message`` の行を削除する（1 セッション
+1 トランザクション）。``Message`` テーブルと ``(session, created_at)``
+インデックスには読まれるセッションの行だけが残る。
+
+読み出しは ``messages(session)`` が透過的に行う（アーカイブ分 + アーカイブ後に
+増えた行を時刻順にまとめた未保存の Message のリスト）。アーカイブ済みの
+セッションでチャットすると ``restore_session`` で元のテーブルに戻す
+（id / created_at は元の値）。
+
+セッションの集計値（core/session_stats.py）はアーカイブ / 復元で変わらない。
+"""
+
+import json
+import zlib
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatSession, Message, MessageArchive
+
+COMPRESSION_LEVEL = 6
+FIELDS = ("id", "role", "content", "name", "status", "usage", "metadata", "created_at")
+RESTORE_BATCH = 500
+
+
+def encode(rows: list[dict]) -> bytes:
+    # DjangoJSONEncoder はミリ秒に丸めるため created_at は isoformat で保存する
+    lines = (
+        json.dumps({**r, "created_at": r["created_at"].isoformat()}, ensure_ascii=False)
+        for r in rows
+    )
+    return "\n".join(lines).encode()
+
+
+def decode(raw: bytes) -> list[dict]:
+    rows = []
+    # splitlines は U+2028 なども区切りにするため "\n" だけで分ける
+    for line in filter(None, raw.decode().split("\n")):
+        row = json.loads(line)
+        row["created_at"] = parse_datetime(row["created_at"])
+        rows.append(row)
+    return rows
+
+
+def archive_session(session: ChatSession) -> MessageArchive | None:
+    """メッセージをアーカイブに移す。生成中（pending）なら何もせず None"""
+    with transaction.atomic():
+        # メッセージ追加時の集計値更新（session_stats）と直列化する
+        locked = ChatSession.objects.select_for_update().get(pk=session.pk)
+        if locked.archived_at is not None:
+            return None
+        messages = Message.objects.filter(session_id=session.pk)
+        rows = list(messages.order_by("created_at", "id").values(*FIELDS))
+        if any(r["status"] == "pending" for r in rows):
+            return None
+        raw = encode(rows)
+        archive = MessageArchive.objects.create(
+            session_id=session.pk,
+            message_count=len(rows),
+            raw_bytes=len(raw),
+            data=zlib.compress(raw, COMPRESSION_LEVEL),
+        )
+        # 追加中のメッセージは session 行のロック待ちでコミットできないため、
+        # ここで見える行は rows と一致する
+        messages.delete()
+        now = timezone.now()
+        ChatSession.objects.filter(pk=session.pk).update(archived_at=now)
+        session.archived_at = now
+        return archive
+
+
+def _archived_rows(session: ChatSession) -> list[dict]:
+    try:
+        archive = MessageArchive.objects.get(session_id=session.pk)
+    except MessageArchive.DoesNotExist:
+        return []
+    return decode(zlib.decompress(archive.data))
+
+
+def messages(session: ChatSession) -> list[Message]:
+    """アーカイブ済みセッションのメッセージ（古い順）"""
+    archived = [Message(session_id=session.pk, **r) for r in _archived_rows(session)]
+    live = list(Message.objects.filter(session_id=session.pk))
+    return sorted(archived + live, key=lambda m: (m.created_at, m.id))
+
+
+def restore_session(session: ChatSession) -> int:
+    """アーカイブを Message テーブルに戻し、戻した件数を返す"""
+    with transaction.atomic():
+        locked = ChatSession.objects.select_for_update().get(pk=session.pk)
+        if locked.archived_at is None:
+            session.archived_at = None
+            return 0
+        restored = [
+            Message(session_id=session.pk, **r) for r in _archived_rows(session)
+        ]
+        for start in range(0, len(restored), RESTORE_BATCH):
+            batch = restored[start : start + RESTORE_BATCH]
+            created_at = [m.created_at for m in batch]
+            # bulk_create は auto_now_add で created_at を上書きするため元に戻す
+            Message.objects.bulk_create(batch)
+            for m, value in zip(batch, created_at):
+                m.created_at = value
+            Message.objects.bulk_update(batch, ["created_at"])
+        MessageArchive.objects.filter(session_id=session.pk).delete()
+        ChatSession.objects.filter(pk=session.pk).update(archived_at=None)
+        session.archived_at = None
+        return len(restored)
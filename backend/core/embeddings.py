@@ -0,0 +1,247 @@
+"""埋め込みサービス（RAG の取り込み / 検索クエリ、セマンティックキャッシュ用）。
+
+``EmbeddingService(client, model).embed(texts)`` は入力順の (n, dim) 行列を返す。
+
+- キャッシュ: キーは sha256(model, 本文)。プロセス内 LRU
+  （``EMBEDDING_CACHE_MEMORY_SIZE`` 件）の後に DB の ``EmbeddingCacheEntry``
+  を引くため、内容が変わっていないチャンクは再取り込み（``--rebuild`` 含む）
+  でも埋め込み直さない。同じ呼び出し内の重複も 1 回だけ埋め込む。
+  ``persist=False``（検索クエリなど）はメモリ層だけを使う。
+- バッチ: 1 リクエストの所要時間が ``TARGET_BATCH_SECONDS`` 付近になるよう
+  件数を倍 / 半分に調整し（``AdaptiveBatchSize``）、タイムアウトや HTTP
+  エラーのバッチは半分に分けて再試行する。
+- 並列: ``workers`` 個のバッチを同時に送る（Ollama の ``OLLAMA_NUM_PARALLEL``
+  や複数バックエンドを使い切るため）。
+- ``embed_iter`` は任意の iterable を ``window`` 件ずつ処理して行列を yield
+  するため、メモリに載らない量の本文でも一定のメモリで流せる。
+
+ワーカースレッドは HTTP だけを行い、DB アクセスは呼び出し元のスレッドで行う。
+"""
+
+import hashlib
+import itertools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - requirements.txt には含まれる
+    np = None
+
+import httpx
+import requests
+
+from .metrics import registry
+from .models import EmbeddingCacheEntry
+
+DEFAULT_BATCH_SIZE = 32
+MAX_BATCH_SIZE = 512
+TARGET_BATCH_SECONDS = 2.0
+DEFAULT_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "4096"))
+DEFAULT_WINDOW = 1024
+# DB の IN 句 1 回あたりのキー数
+DB_CHUNK = 500
+
+# 分割すれば通る可能性がある失敗（大きすぎるバッチのタイムアウト / 413 / 500 など）。
+# OllamaClient は requests、AsyncOllamaClient は httpx の例外を送出する
+SPLITTABLE_ERRORS = (
+    requests.Timeout,
+    requests.HTTPError,
+    httpx.TimeoutException,
+    httpx.HTTPStatusError,
+)
+
+embedding_cache_requests = registry.counter(
+    "embedding_cache_requests_total", "Embedding cache lookups per text by result"
+)
+embedding_batch_seconds = registry.histogram(
+    "embedding_batch_seconds",
+    "Embedding backend request time per batch",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf),
+)
+embedding_batch_size = registry.gauge(
+    "embedding_batch_size", "Current adaptive embedding batch size"
+)
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+
+class AdaptiveBatchSize:
+    """1 バッチの所要時間が target_seconds 付近になるよう件数を増減する"""
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_BATCH_SIZE,
+        maximum: int = MAX_BATCH_SIZE,
+        target_seconds: float = TARGET_BATCH_SECONDS,
+    ):
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.value = max(1, min(initial, maximum))
+        self._lock = threading.Lock()
+
+    def record(self, size: int, seconds: float) -> None:
+        with self._lock:
+            if seconds > self.target_seconds * 1.5:
+                self.value = max(1, min(self.value, size) // 2)
+            elif seconds < self.target_seconds / 2 and size >= self.value:
+                # 現在の件数で速かった場合だけ増やす（端数のバッチでは判断しない）
+                self.value = min(self.maximum, self.value * 2)
+
+    def shrink(self) -> None:
+        with self._lock:
+            self.value = max(1, self.value // 2)
+
+
+class _MemoryCache:
+    def __init__(self, size: int):
+        self.size = size
+        self._items: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+            return vector
+
+    def put(self, key: str, vector) -> None:
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+_memory = _MemoryCache(MEMORY_SIZE)
+
+
+class EmbeddingService:
+    """client（OllamaClient / OllamaRouter など ``embed`` を持つもの）の前段"""
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        *,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        persist: bool = True,
+    ):
+        self.client = client
+        self.model = model
+        self.workers = max(1, workers)
+        self.persist = persist
+        self.batch_size = AdaptiveBatchSize(batch_size)
+
+    def embed(self, texts: Sequence[str]):
+        """texts の埋め込み（正規化しない float32 の (n, dim) 行列）"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [cache_key(self.model, t) for t in texts]
+        found = {}
+        for key in set(keys):
+            vector = _memory.get(key)
+            if vector is not None:
+                found[key] = vector
+        labels = {"model": self.model}
+        embedding_cache_requests.inc(len(found), result="hit_memory", **labels)
+
+        todo = {k: t for k, t in zip(keys, texts) if k not in found}
+        if todo and self.persist:
+            stored = self._load(list(todo))
+            for key, vector in stored.items():
+                _memory.put(key, vector)
+                del todo[key]
+            found.update(stored)
+            embedding_cache_requests.inc(len(stored), result="hit_db", **labels)
+
+        if todo:
+            embedding_cache_requests.inc(len(todo), result="miss", **labels)
+            vectors = self._compute(list(todo.values()))
+            computed = dict(zip(todo, vectors))
+            for key, vector in computed.items():
+                _memory.put(key, vector)
+            if self.persist:
+                self._save(computed)
+            found.update(computed)
+        return np.vstack([found[k] for k in keys])
+
+    def embed_iter(
+        self, texts: Iterable[str], window: int = DEFAULT_WINDOW
+    ) -> Iterator:
+        """texts を window 件ずつ埋め込み、(<=window, dim) の行列を順に yield する"""
+        it = iter(texts)
+        while batch := list(itertools.islice(it, window)):
+            yield self.embed(batch)
+
+    def _load(self, keys: list[str]) -> dict:
+        found = {}
+        for i in range(0, len(keys), DB_CHUNK):
+            rows = EmbeddingCacheEntry.objects.filter(
+                key__in=keys[i : i + DB_CHUNK]
+            ).values_list("key", "vector")
+            for key, vector in rows:
+                found[key] = np.frombuffer(bytes(vector), dtype=np.float32)
+        return found
+
+    def _save(self, vectors: dict) -> None:
+        EmbeddingCacheEntry.objects.bulk_create(
+            (
+                EmbeddingCacheEntry(key=k, model=self.model, vector=v.tobytes())
+                for k, v in vectors.items()
+            ),
+            batch_size=DB_CHUNK,
+            ignore_conflicts=True,
+        )
+
+    def _compute(self, texts: list[str]) -> list:
+        """texts を適応的な件数のバッチに分けて最大 workers 並列で埋め込む"""
+        if len(texts) <= self.batch_size.value or self.workers == 1:
+            vectors, pos = [], 0
+            while pos < len(texts):
+                size = self.batch_size.value
+                vectors.extend(self._embed_batch(texts[pos : pos + size]))
+                pos += size
+            return vectors
+
+        results: dict[int, list] = {}
+        pending = {}
+        pos = 0
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="embed") as pool:
+            while pos < len(texts) or pending:
+                # 次のバッチは送る時点の件数で切る（完了ごとに調整が効く）
+                while pos < len(texts) and len(pending) < self.workers:
+                    size = self.batch_size.value
+                    batch = texts[pos : pos + size]
+                    pending[pool.submit(self._embed_batch, batch)] = pos
+                    pos += size
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        return [v for start in sorted(results) for v in results[start]]
+
+    def _embed_batch(self, texts: list[str]) -> list:
+        started = time.perf_counter()
+        try:
+            raw = self.client.embed(texts, model=self.model)
+        except SPLITTABLE_ERRORS:
+            if len(texts) == 1:
+                raise
+            self.batch_size.shrink()
+            mid = len(texts) // 2
+            return self._embed_batch(texts[:mid]) + self._embed_batch(texts[mid:])
+        elapsed = time.perf_counter() - started
+        self.batch_size.record(len(texts), elapsed)
+        embedding_batch_seconds.observe(elapsed, model=self.model)
+        embedding_batch_size.set(self.batch_size.value, model=self.model)
+        return list(np.asarray(raw, dtype=np.float32))
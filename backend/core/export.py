@@ -0,0 +1,151 @@
+"""採点用のチャット一括エクスポート（NDJSON / CSV）。
+
+``rows()`` は Message を ``(session, created_at)`` インデックスの順に
+``.iterator(chunk_size=...)`` で読む（PostgreSQL ではサーバサイドカーソル）ため、
+件数によらずメモリは一定。アーカイブ済みのセッション（core/archive.py）は
+その後に 1 セッションずつ展開して出力する。
+
+``GET /api/exports/messages/`` と ``manage.py export_chats`` が使う。
+"""
+
+import csv
+import json
+from collections.abc import Iterable, Iterator
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import archive
+from .models import ChatSession, Message
+
+CHUNK_SIZE = 2000
+# 1 回の書き込みにまとめる行数（WSGI サーバへの細かい write を避ける）
+LINES_PER_WRITE = 500
+FIELDS = (
+    "session_uuid",
+    "session_title",
+    "llm",
+    "message_id",
+    "role",
+    "status",
+    "content",
+    "created_at",
+)
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def parse_bound(value: str | None, end: bool = False) -> datetime | None:
+    """ISO 日時または日付。日付だけの ``end`` はその日の終わりまでを含める"""
+    if not value:
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"invalid date: {value}")
+        dt = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def rows(
+    llm: int | None = None,
+    sessions: list | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[dict]:
+    """条件に合うメッセージをセッションごと・古い順に返す（until は含まない）"""
+    session_qs = ChatSession.objects.all()
+    if llm is not None:
+        session_qs = session_qs.filter(llm_id=llm)
+    if sessions:
+        session_qs = session_qs.filter(uuid__in=sessions)
+
+    messages = Message.objects.filter(
+        session__in=session_qs.filter(archived_at__isnull=True)
+    )
+    if since is not None:
+        messages = messages.filter(created_at__gte=since)
+    if until is not None:
+        messages = messages.filter(created_at__lt=until)
+    values = messages.order_by("session_id", "created_at", "id").values_list(
+        "session_id",
+        "session__title",
+        "session__llm__name",
+        "id",
+        "role",
+        "status",
+        "content",
+        "created_at",
+    )
+    for row in values.iterator(chunk_size=chunk_size):
+        yield _row(*row)
+
+    archived = session_qs.filter(archived_at__isnull=False).select_related("llm")
+    for session in archived.order_by("uuid").iterator(chunk_size=100):
+        for m in archive.messages(session):
+            if since is not None and m.created_at < since:
+                continue
+            if until is not None and m.created_at >= until:
+                continue
+            yield _row(
+                session.uuid,
+                session.title,
+                session.llm.name,
+                m.id,
+                m.role,
+                m.status,
+                m.content,
+                m.created_at,
+            )
+
+
+def _row(session_uuid, title, llm, pk, role, status, content, created_at) -> dict:
+    return {
+        "session_uuid": str(session_uuid),
+        "session_title": title,
+        "llm": llm,
+        "message_id": pk,
+        "role": role,
+        "status": status,
+        "content": content,
+        "created_at": created_at.isoformat(),
+    }
+
+
+class _Echo:
+    """csv.writer の書き込み先（書いた文字列をそのまま返す）"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _ndjson(items: Iterable[dict]) -> Iterator[str]:
+    for item in items:
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+
+def _csv(items: Iterable[dict]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for item in items:
+        yield writer.writerow([item[f] for f in FIELDS])
+
+
+def render(items: Iterable[dict], fmt: str) -> Iterator[str]:
+    """``fmt`` ("ndjson" / "csv") の文字列を数百行ずつまとめて返す"""
+    lines = _ndjson(items) if fmt == "ndjson" else _csv(items)
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= LINES_PER_WRITE:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,114 @@
+"""LLM に送る会話履歴の選択（コンテキストウィンドウの予算管理）。
+
+ChatInSessionUsecase は HistorySelector を通して履歴を取得する。
+既定の TokenBudgetHistorySelector は system メッセージ（とセッション要約）を
+常に先頭に固定し、残りの予算に収まる直近のターンだけを
+``(session, created_at)`` インデックスに沿った降順・件数制限付きクエリで取得する。
+"""
+
+from abc import ABC, abstractmethod
+
+from django.db.models import Q
+
+from .models import Message
+from .summarization import get_summary, summary_message
+
+# num_ctx も history_token_budget も指定が無い場合の既定値
+# (Ollama の既定 num_ctx 4096 から応答分 1024 を差し引いた値)
+DEFAULT_HISTORY_TOKEN_BUDGET = 3072
+DEFAULT_RESPONSE_RESERVE_TOKENS = 1024
+# 1 メッセージあたりのロール等のオーバーヘッド（概算）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算。ASCII は約 4 文字 / token、それ以外（日本語等）は 1 文字 / token。"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def message_tokens(m: Message) -> int:
+    return estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_token_budget(llm) -> int:
+    """LLM.extra から履歴に使えるトークン予算を求める。
+
+    優先順: ``history_token_budget`` > ``num_ctx`` - 応答予約 (``num_predict``) > 既定値
+    """
+    extra = llm.extra or {}
+    if extra.get("history_token_budget"):
+        return int(extra["history_token_budget"])
+    if extra.get("num_ctx"):
+        reserve = extra.get("num_predict") or DEFAULT_RESPONSE_RESERVE_TOKENS
+        if reserve < 0:  # num_predict=-1 は無制限
+            reserve = DEFAULT_RESPONSE_RESERVE_TOKENS
+        return max(int(extra["num_ctx"]) - int(reserve), 0)
+    return DEFAULT_HISTORY_TOKEN_BUDGET
+
+
+class HistorySelector(ABC):
+    """履歴選択ステージの基底クラス。
+
+    ``select`` は LLM に送る Message を時系列順で返す。``current`` は今回の
+    user メッセージ（pending、キャッシュ参照前は未保存）で、必ず末尾に含める。
+    """
+
+    @abstractmethod
+    def select(self, session, current: Message) -> list[Message]: ...
+
+    @staticmethod
+    def _queryset(session):
+        return session.messages.filter(status="completed")
+
+
+class TokenBudgetHistorySelector(HistorySelector):
+    """system を固定し、予算内に収まる直近ターンを選ぶ。
+
+    セッションに要約 (core/summarization.py) があれば system の直後に置き、
+    要約済み (``until_id`` 以前) のメッセージは送らない。
+    """
+
+    batch_size = 50
+
+    def __init__(self, budget: int):
+        self.budget = budget
+
+    def select(self, session, current: Message) -> list[Message]:
+        qs = self._queryset(session)
+        pinned = list(qs.filter(role="system"))
+        rest = qs.exclude(role="system").order_by("-created_at", "-id")
+        summary = get_summary(session)
+        if summary:
+            pinned.append(Message(session=session, **summary_message(summary)))
+            rest = rest.filter(id__gt=summary["until_id"])
+        # 今回の user メッセージは予算超過でも必ず送る
+        remaining = (
+            self.budget
+            - sum(message_tokens(m) for m in pinned)
+            - message_tokens(current)
+        )
+
+        recent: list[Message] = []
+        cursor = None
+        while True:
+            page = rest
+            if cursor is not None:
+                page = rest.filter(
+                    Q(created_at__lt=cursor.created_at)
+                    | Q(created_at=cursor.created_at, id__lt=cursor.id)
+                )
+            batch = list(page[: self.batch_size])
+            for m in batch:
+                cost = message_tokens(m)
+                if cost > remaining:
+                    return pinned + recent[::-1] + [current]
+                remaining -= cost
+                recent.append(m)
+            if len(batch) < self.batch_size:
+                return pinned + recent[::-1] + [current]
+            cursor = batch[-1]
+
+
+def build_history_selector(llm) -> HistorySelector:
+    return TokenBudgetHistorySelector(history_token_budget(llm))
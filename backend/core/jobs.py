@@ -0,0 +1,87 @@
+"""チャット生成のバックグラウンドジョブキュー（Postgres テーブル ``ChatJob``）。
+
+``POST /chat/`` に ``"background": true`` を付けるとジョブを登録して即座に返し、
+``manage.py run_chat_worker`` のワーカープールが ``SELECT ... FOR UPDATE SKIP LOCKED``
+で 1 件ずつ取り出して ChatInSessionUsecase.run を実行する。生成の同時実行数は
+Web ワーカー数ではなくワーカープールのサイズで決まる。
+"""
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import ChatJob, ChatSession
+from .usecases import ChatInSessionUsecase
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_chat_job(
+    session: ChatSession, message: str, options: dict | None = None
+) -> ChatJob:
+    return ChatJob.objects.create(session=session, message=message, options=options)
+
+
+def claim_next_job() -> ChatJob | None:
+    """queued のジョブを 1 件 running にして返す（他ワーカーがロック中の行は飛ばす）"""
+    with transaction.atomic():
+        job = (
+            ChatJob.objects.select_for_update(skip_locked=True)
+            .filter(status="queued")
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "running"
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+    return job
+
+
+def process_job(job: ChatJob) -> ChatJob:
+    try:
+        uc = ChatInSessionUsecase(job.session_id)
+        job.result = uc.run(user_text=job.message, options=job.options)
+        job.status = "completed"
+    except Exception as e:
+        logger.exception("chat job failed: %s", job.uuid)
+        job.status = "failed"
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "error", "finished_at"])
+    return job
+
+
+def fail_stale_jobs(stale_after: timedelta) -> int:
+    """ワーカー停止などで running のまま残ったジョブを failed にする"""
+    return ChatJob.objects.filter(
+        status="running", started_at__lt=timezone.now() - stale_after
+    ).update(status="failed", error="worker lost", finished_at=timezone.now())
+
+
+def run_worker_loop(
+    stop: threading.Event, poll_interval: float = 1.0, once: bool = False
+) -> int:
+    """ジョブを取り出して処理し続ける（ワーカープールの 1 スレッド分）。
+
+    ``once`` の場合はキューが空になった時点で終了する。処理件数を返す。
+    """
+    processed = 0
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if once:
+                    break
+                stop.wait(poll_interval)
+                continue
+            process_job(job)
+            processed += 1
+    finally:
+        connections.close_all()
+    return processed
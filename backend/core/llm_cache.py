@@ -0,0 +1,168 @@
+"""LLM 設定と構築済みクライアントのプロセス内キャッシュ。
+
+チャットのたびに LLM を JOIN して読み、``llm.extra`` をマージしてクライアントを
+作り直さないよう、LLM id ごとに ``(世代, LLM, クライアント)`` を保持する。
+クライアントは生成関数ごとに持つ（同期版と ASGI 用の async 版が同じ無効化に従う）。
+
+無効化:
+- 同じプロセス: ``LLM`` の ``post_save`` / ``post_delete`` シグナルで世代を進める
+- 他のワーカー: コミット後に PostgreSQL の ``NOTIFY core_llm_changed, '<id>'`` を送り、
+  各プロセスの ``LISTEN`` スレッドが受けて無効化する（SQLite では送らない）
+- 取りこぼし対策: エントリは ``LLM_CACHE_TTL`` 秒（既定 60）で期限切れ。
+  LISTEN 接続が切れた場合は再接続時に全件を無効化する
+
+``QuerySet.update()`` はシグナルを送らないため、LLM の更新には ``save()`` を使うか
+``invalidate()`` を呼ぶ（他のワーカーには TTL 後に反映）。
+"""
+
+import copy
+import logging
+import os
+import select
+import threading
+import time
+
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import LLM
+
+logger = logging.getLogger(__name__)
+
+TTL = float(os.getenv("LLM_CACHE_TTL", "60"))
+CHANNEL = "core_llm_changed"
+LISTEN_TIMEOUT = 5.0
+RECONNECT_DELAY = 5.0
+
+
+class _Entry:
+    __slots__ = ("generation", "expires_at", "llm", "clients")
+
+    def __init__(self, generation: tuple, llm: LLM):
+        self.generation = generation
+        self.expires_at = time.monotonic() + TTL
+        self.llm = llm
+        self.clients = {}
+
+
+_entries: dict[int, _Entry] = {}
+_generations: dict[int, int] = {}
+_epoch = 0  # 全件無効化の回数
+_lock = threading.Lock()
+_listener: threading.Thread | None = None
+
+
+def _generation(llm_id: int) -> tuple:
+    return _epoch, _generations.get(llm_id, 0)
+
+
+def _fresh(llm_id: int) -> _Entry | None:
+    entry = _entries.get(llm_id)
+    if entry is None or entry.expires_at <= time.monotonic():
+        return None
+    if entry.generation != _generation(llm_id):
+        return None
+    return entry
+
+
+def _store(llm: LLM, generation: tuple) -> _Entry:
+    # generation は読み込み前の値（読み込み中に無効化されたら次回読み直す）
+    with _lock:
+        entry = _Entry(generation, llm)
+        _entries[llm.pk] = entry
+        return entry
+
+
+def get_llm(llm_id: int) -> LLM:
+    """LLM（キャッシュに無ければ DB から読む）。存在しなければ DoesNotExist"""
+    _ensure_listener()
+    entry = _fresh(llm_id)
+    if entry is None:
+        generation = _generation(llm_id)
+        entry = _store(LLM.objects.get(pk=llm_id), generation)
+    return entry.llm
+
+
+def get_client(llm: LLM, build, affinity_key: str | None = None):
+    """``build(llm)`` で作ったクライアントを LLM と build の組ごとに使い回す。
+
+    affinity_key を持つクライアント（OllamaRouter）は浅いコピーに
+    affinity_key を設定して返す（バックエンドプールは共有）。
+    """
+    if llm.pk is None:
+        return build(llm, affinity_key)
+    _ensure_listener()
+    entry = _fresh(llm.pk)
+    if entry is None:
+        entry = _store(llm, _generation(llm.pk))
+    client = entry.clients.get(build)
+    if client is None:
+        client = entry.clients[build] = build(entry.llm, None)
+    if affinity_key is not None and hasattr(client, "affinity_key"):
+        client = copy.copy(client)
+        client.affinity_key = affinity_key
+    return client
+
+
+def invalidate(llm_id: int | None = None) -> None:
+    """このプロセスのキャッシュを無効化する（None なら全件）"""
+    global _epoch
+    with _lock:
+        if llm_id is None:
+            _epoch += 1
+            _entries.clear()
+        else:
+            _generations[llm_id] = _generations.get(llm_id, 0) + 1
+            _entries.pop(llm_id, None)
+
+
+@receiver(post_save, sender=LLM)
+@receiver(post_delete, sender=LLM)
+def _llm_changed(sender, instance, using, **kwargs):
+    invalidate(instance.pk)
+    if connections[using].vendor == "postgresql":
+        transaction.on_commit(lambda: _notify(using, instance.pk), using=using)
+
+
+def _notify(using: str, llm_id: int) -> None:
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, str(llm_id)])
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if _listener is not None or connection.vendor != "postgresql":
+        return
+    with _lock:
+        if _listener is None:
+            _listener = threading.Thread(
+                target=_listen, name="llm-cache-listener", daemon=True
+            )
+            _listener.start()
+
+
+def _listen() -> None:
+    """他のワーカーからの NOTIFY を受けてキャッシュを無効化し続ける"""
+    while True:
+        conn = connections.create_connection("default")
+        try:
+            conn.ensure_connection()
+            raw = conn.connection
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            # 接続していない間の変更は分からないため全件を捨てる
+            invalidate()
+            while True:
+                if select.select([raw], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    payload = raw.notifies.pop(0).payload
+                    invalidate(int(payload) if payload.isdigit() else None)
+        except Exception:
+            logger.warning("llm cache listener disconnected", exc_info=True)
+        finally:
+            conn.close()
+        time.sleep(RECONNECT_DELAY)
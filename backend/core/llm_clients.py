@@ -1,12 +1,181 @@
 import os
+import json
+import asyncio
+import logging
+import threading
+import time
+import httpx
 import requests
-from dataclasses import dataclass
+from collections.abc import AsyncIterator, Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import cached_property
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# HTTP 接続設定（env で上書き可）。connect と read のタイムアウトを分離し、
+# 接続不能な backend は素早く失敗させつつ長い生成は待てるようにする。
+HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "120"))
+# ASGI モードでは多数の待機中チャットを 1 プロセスで抱えるため上限を大きめにする
+ASYNC_HTTP_POOL_SIZE = int(os.getenv("LLM_ASYNC_HTTP_POOL_SIZE", "200"))
+
+# LLM.extra のうち Ollama options として送らず、バックエンド側の設定として扱うキー
+EXTRA_SETTING_KEYS = {
+    "history_token_budget",
+    "summary_trigger_messages",
+    "summary_keep_messages",
+    "keep_alive",
+    "backends",
+    "max_concurrency",
+    "max_queue",
+    "queue_timeout",
+    "response_cache_ttl",
+    "response_cache_max_entries",
+    "embedding_model",
+    "semantic_cache_threshold",
+    "semantic_cache_max_entries",
+    "first_token_deadline",
+    "fallback_llm",
+    "breaker_failures",
+    "breaker_reset_seconds",
+    "breaker_slow_seconds",
+}
+
+# Ollama の最終レスポンスから Message.usage に保存する項目
+OLLAMA_USAGE_KEYS = (
+    "eval_count",
+    "prompt_eval_count",
+    "total_duration",
+    "load_duration",
+    "prompt_eval_duration",
+    "eval_duration",
+)
+
+_http_sessions: dict[str, requests.Session] = {}
+_async_http_clients: dict[str, tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+_http_sessions_lock = threading.Lock()
+
+
+def get_http_session(base_url: str) -> requests.Session:
+    """base_url ごとにプロセス内で共有する keep-alive 付き HTTP セッションを返す。
+
+    同じ Ollama ホストへの連続したチャットで TCP/TLS 接続を再利用する。
+    """
+    key = base_url.rstrip("/")
+    session = _http_sessions.get(key)
+    if session is not None:
+        return session
+    with _http_sessions_lock:
+        session = _http_sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=HTTP_POOL_SIZE,
+                pool_block=False,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_sessions[key] = session
+        return session
+
+
+def get_async_http_client(base_url: str) -> httpx.AsyncClient:
+    """get_http_session の async 版。httpx.AsyncClient はイベントループに
+    紐づくため、実行中のループが変わった場合は作り直す。"""
+    key = base_url.rstrip("/")
+    loop = asyncio.get_running_loop()
+    with _http_sessions_lock:
+        entry = _async_http_clients.get(key)
+        if entry is None or entry[0] is not loop:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=ASYNC_HTTP_POOL_SIZE,
+                    max_keepalive_connections=ASYNC_HTTP_POOL_SIZE,
+                ),
+                timeout=httpx.Timeout(
+                    HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=None
+                ),
+            )
+            entry = (loop, client)
+            _async_http_clients[key] = entry
+        return entry[1]
+
+
+def close_http_sessions() -> None:
+    """登録済みの HTTP セッションをすべて閉じる（テスト / 終了処理用）"""
+    with _http_sessions_lock:
+        for session in _http_sessions.values():
+            session.close()
+        _http_sessions.clear()
+        # AsyncClient は紐づくループ上でしか閉じられないため参照だけ破棄する
+        _async_http_clients.clear()
+
+
+class StreamCancel:
+    """別スレッドから stream_chat の HTTP 応答を打ち切るハンドル。
+
+    ``stream_cancel`` に設定したスレッドで ``stream_chat`` を読むと、開いた
+    応答がここに登録される。``cancel()`` はブロック中の読み取りも解除して
+    接続を閉じるため、Ollama 側の生成もすぐに止まる。
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._responses: list[requests.Response] = []
+        self._lock = threading.Lock()
+
+    def attach(self, response: requests.Response) -> None:
+        with self._lock:
+            self._responses.append(response)
+            cancelled = self.cancelled
+        if cancelled:
+            _abort(response)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            responses = list(self._responses)
+        for response in responses:
+            _abort(response)
+
+
+def _abort(response: requests.Response) -> None:
+    # urllib3 2.3+ の shutdown は他スレッドでブロック中の recv も解除する
+    shutdown = getattr(response.raw, "shutdown", None)
+    try:
+        if shutdown is not None:
+            shutdown()
+        else:  # pragma: no cover - 古い urllib3
+            response.close()
+    except OSError:
+        pass
+
+
+stream_cancel: ContextVar[StreamCancel | None] = ContextVar(
+    "stream_cancel", default=None
+)
 
 
 @dataclass
 class ChatResult:
     content: str
     usage: dict
+    # Message.metadata に加える情報（フォールバック時の応答元など）
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class ChatChunk:
+    """stream_chat が返す 1 チャンク（content は差分テキスト）"""
+
+    content: str
+    done: bool = False
+    usage: dict = field(default_factory=dict)
+    metadata: dict = field(default_factory=dict)
 
 
 class OllamaClient:
@@ -15,32 +184,289 @@ class OllamaClient:
         base_url: str | None,
         model: str,
         default_params: dict | None = None,
+        keep_alive: str | int | None = None,
     ):
         default_url = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
         self.base_url = base_url or default_url
         self.model = model
         self.default_params = default_params or {}
+        # モデルをメモリに保持する時間 (例: "30m", -1 で無期限)。
+        # 保持中は共通プレフィックスの KV キャッシュが再利用される。
+        self.keep_alive = keep_alive
+        self.timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
 
-    def chat(
-        self,
-        messages: list[dict],
-        options: dict | None = None,
-    ) -> ChatResult:
-        url = self.base_url.rstrip("/") + "/api/chat"
+    @cached_property
+    def http(self) -> requests.Session:
+        return get_http_session(self.base_url)
+
+    def _url(self, path: str) -> str:
+        return self.base_url.rstrip("/") + path
+
+    def _chat_url(self) -> str:
+        return self._url("/api/chat")
+
+    def _payload(
+        self, messages: list[dict], options: dict | None, stream: bool
+    ) -> dict:
         payload = {
             "model": self.model,
             "messages": messages,
             "options": {**self.default_params, **(options or {})},
-            "stream": False,
+            "stream": stream,
         }
-        r = requests.post(url, json=payload, timeout=120)
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _usage(self, data: dict, ttft_ms: float | None = None) -> dict:
+        """Ollama の最終レスポンスから usage を組み立てる。
+
+        duration 系は Ollama と同じナノ秒。派生値として tokens_per_second と
+        time_to_first_token_ms を加える（TTFT は stream 時は実測、
+        非 stream 時は load_duration + prompt_eval_duration からの推定）。
+        """
+        usage = {key: data.get(key) for key in OLLAMA_USAGE_KEYS}
+        eval_count = usage["eval_count"]
+        eval_ns = usage["eval_duration"]
+        if eval_count is not None and eval_ns:
+            usage["tokens_per_second"] = round(eval_count / (eval_ns / 1e9), 2)
+        if ttft_ms is None and usage["prompt_eval_duration"] is not None:
+            ttft_ms = (
+                (usage["load_duration"] or 0) + usage["prompt_eval_duration"]
+            ) / 1e6
+        if ttft_ms is not None:
+            usage["time_to_first_token_ms"] = round(ttft_ms, 1)
+        # prompt_eval_count が履歴全体より小さければ KV キャッシュが効いている
+        logger.info(
+            "ollama chat model=%s prompt_eval_count=%s prompt_eval_duration=%s",
+            self.model,
+            usage["prompt_eval_count"],
+            usage["prompt_eval_duration"],
+        )
+        return usage
+
+    def preload(self) -> None:
+        """モデルを Ollama にロードする（messages 空の /api/chat）"""
+        payload = {"model": self.model, "messages": []}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        r = self.http.post(self._chat_url(), json=payload, timeout=self.timeout)
+        r.raise_for_status()
+
+    def chat(
+        self,
+        messages: list[dict],
+        options: dict | None = None,
+    ) -> ChatResult:
+        payload = self._payload(messages, options, stream=False)
+        r = self.http.post(self._chat_url(), json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
+        content = data.get("message", {}).get("content", "")
+        return ChatResult(content=content, usage=self._usage(data))
+
+    def stream_chat(
+        self,
+        messages: list[dict],
+        options: dict | None = None,
+    ) -> Iterator[ChatChunk]:
+        """Ollama の stream モード (NDJSON) をチャンク単位で返すジェネレータ。
+
+        呼び出し側がジェネレータを close した場合はレスポンスも閉じ、
+        Ollama 側の生成を打ち切る。
+        """
+        payload = self._payload(messages, options, stream=True)
+        started = time.perf_counter()
+        ttft_ms = None
+        with self.http.post(
+            self._chat_url(), json=payload, stream=True, timeout=self.timeout
+        ) as r:
+            cancel = stream_cancel.get()
+            if cancel is not None:
+                cancel.attach(r)
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                content = data.get("message", {}).get("content", "")
+                if content and ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                if data.get("done"):
+                    usage = self._usage(data, ttft_ms)
+                    yield ChatChunk(content=content, done=True, usage=usage)
+                    return
+                if content:
+                    yield ChatChunk(content=content)
+
+    def embed(self, texts: list[str], model: str | None = None) -> list[list[float]]:
+        """Ollama の /api/embed で texts を埋め込む（入力順のベクトルを返す）"""
+        payload = {"model": model or self.model, "input": texts}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        r = self.http.post(self._url("/api/embed"), json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()["embeddings"]
+
+
+class AsyncOllamaClient(OllamaClient):
+    """httpx による OllamaClient の async 版（ASGI モード用）。
+
+    payload / usage の組み立ては OllamaClient と共通で、chat / stream_chat は
+    コルーチン / async ジェネレータになる。
+    """
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return get_async_http_client(self.base_url)
+
+    async def chat(
+        self,
+        messages: list[dict],
+        options: dict | None = None,
+    ) -> ChatResult:
+        payload = self._payload(messages, options, stream=False)
+        r = await self.http.post(self._chat_url(), json=payload)
         r.raise_for_status()
         data = r.json()
         content = data.get("message", {}).get("content", "")
-        usage = {"eval_count": data.get("eval_count")}
-        return ChatResult(content=content, usage=usage)
+        return ChatResult(content=content, usage=self._usage(data))
+
+    async def stream_chat(
+        self,
+        messages: list[dict],
+        options: dict | None = None,
+    ) -> AsyncIterator[ChatChunk]:
+        payload = self._payload(messages, options, stream=True)
+        started = time.perf_counter()
+        ttft_ms = None
+        async with self.http.stream("POST", self._chat_url(), json=payload) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                content = data.get("message", {}).get("content", "")
+                if content and ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                if data.get("done"):
+                    usage = self._usage(data, ttft_ms)
+                    yield ChatChunk(content=content, done=True, usage=usage)
+                    return
+                if content:
+                    yield ChatChunk(content=content)
+
+    async def preload(self) -> None:
+        payload = {"model": self.model, "messages": []}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        r = await self.http.post(self._chat_url(), json=payload)
+        r.raise_for_status()
+
+
+def llm_options(extra: dict | None) -> dict:
+    """LLM.extra から Ollama options として送る項目だけを取り出す"""
+    return {k: v for k, v in (extra or {}).items() if k not in EXTRA_SETTING_KEYS}
+
+
+def build_llm_client(llm, affinity_key: str | None = None) -> OllamaClient:
+    """LLM 設定に対応するクライアント。
+
+    保存済みの LLM は構築済みのクライアントをプロセス内で使い回す
+    （core/llm_cache.py。LLM の保存 / 削除で無効化）。
+    """
+    from .llm_cache import get_client
+    from .resilience import wrap
 
+    # ブレーカー / ヘッジの設定があれば ResilientClient で包む（core/resilience.py）
+    return wrap(llm, get_client(llm, create_llm_client, affinity_key), affinity_key)
 
-def build_llm_client(llm) -> OllamaClient:
+
+def create_llm_client(llm, affinity_key: str | None = None) -> OllamaClient:
+    """LLM 設定からクライアントを作る。
+
+    ``extra["backends"]`` があれば複数バックエンドに振り分ける OllamaRouter を返す。
+    ``affinity_key``（通常はセッション UUID）は同じバックエンドを優先するために使う。
+    """
     # 今回はOllamaのみ対応（拡張余地あり）
-    return OllamaClient(llm.base_url, llm.model, llm.extra)
+    extra = llm.extra or {}
+    if extra.get("backends"):
+        from .routing import OllamaRouter, get_backend_pool
+
+        return OllamaRouter(
+            get_backend_pool(extra["backends"]),
+            llm.model,
+            llm_options(extra),
+            keep_alive=extra.get("keep_alive"),
+            affinity_key=affinity_key,
+        )
+    return OllamaClient(
+        llm.base_url,
+        llm.model,
+        llm_options(extra),
+        keep_alive=extra.get("keep_alive"),
+    )
+
+
+class ThreadedAsyncClient:
+    """同期クライアントを ``await`` で呼べるようにするラッパー（ASGI モード用）。
+
+    複数バックエンドへの振り分け (OllamaRouter) とブレーカー / ヘッジ
+    (ResilientClient) は同期実装のため、それらを設定した LLM ではワーカースレッドで
+    生成を待つ。イベントループは止めないが、待機中はスレッドを 1 本使う。
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def chat(self, messages: list[dict], options: dict | None = None):
+        from asgiref.sync import sync_to_async
+
+        chat = sync_to_async(self.client.chat, thread_sensitive=False)
+        return await chat(messages, options=options)
+
+    async def stream_chat(
+        self, messages: list[dict], options: dict | None = None
+    ) -> AsyncIterator[ChatChunk]:
+        from asgiref.sync import sync_to_async
+
+        chunks = self.client.stream_chat(messages, options=options)
+        pull = sync_to_async(next, thread_sensitive=False)
+        try:
+            while (chunk := await pull(chunks, None)) is not None:
+                yield chunk
+        finally:
+            # 打ち切り時も同期ジェネレータを閉じて接続を返す
+            await sync_to_async(chunks.close, thread_sensitive=False)()
+
+
+def build_async_llm_client(
+    llm, affinity_key: str | None = None
+) -> "AsyncOllamaClient | ThreadedAsyncClient":
+    """ASGI モード用のクライアント。
+
+    保存済みの LLM は build_llm_client と同じく構築済みのものを使い回す。
+    ルーター / レジリエンス設定がある場合はキャッシュ済みの同期クライアントを
+    ThreadedAsyncClient で包む（affinity_key を持つのは中身の方なので包みは毎回作る）。
+    """
+    from .llm_cache import get_client
+    from .resilience import SETTING_KEYS
+
+    extra = llm.extra or {}
+    if extra.get("backends") or any(extra.get(key) for key in SETTING_KEYS):
+        return ThreadedAsyncClient(build_llm_client(llm, affinity_key))
+    return get_client(llm, create_async_llm_client, affinity_key)
+
+
+def create_async_llm_client(llm, affinity_key: str | None = None) -> AsyncOllamaClient:
+    """LLM 設定から AsyncOllamaClient を作る（接続は base_url ごとに共有）"""
+    return AsyncOllamaClient(
+        llm.base_url,
+        llm.model,
+        llm_options(llm.extra),
+        keep_alive=(llm.extra or {}).get("keep_alive"),
+    )
@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from core import archive
+from core.models import ChatSession
+
+
+class Command(BaseCommand):
+    help = (
+        "無効化されたセッションと最終活動が古いセッションのメッセージを"
+        "圧縮アーカイブ (MessageArchive) に移す"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=180,
+            help="最終活動がこの日数より前のセッションを対象にする",
+        )
+        parser.add_argument(
+            "--inactive-only",
+            action="store_true",
+            help="is_active=False のセッションだけを対象にする",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="1 回に取り出すセッション数（アーカイブは 1 セッションずつコミット）",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="処理するセッション数の上限"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="対象の件数だけを表示する"
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="終了後に Message テーブルを VACUUM する（SQLite は DB 全体）",
+        )
+        parser.add_argument(
+            "--restore",
+            nargs="+",
+            metavar="UUID",
+            help="指定したセッションをアーカイブから戻す",
+        )
+
+    def _candidates(self, options):
+        qs = ChatSession.objects.filter(archived_at__isnull=True)
+        if options["inactive_only"]:
+            qs = qs.filter(is_active=False)
+        else:
+            cutoff = timezone.now() - timedelta(days=options["older_than"])
+            qs = qs.filter(Q(is_active=False) | Q(last_activity_at__lt=cutoff))
+        return qs.order_by("last_activity_at", "uuid")
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            return self._restore(options["restore"])
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        qs = self._candidates(options)
+        if options["dry_run"]:
+            count = qs.count()
+            self.stdout.write(f"{count} sessions would be archived")
+            return
+
+        limit = options["limit"]
+        sessions = messages = raw_bytes = stored_bytes = skipped = 0
+        last = None
+        while limit is None or sessions + skipped < limit:
+            batch = qs
+            if last is not None:
+                # 処理済み（スキップを含む）の続きから取り出す
+                batch = batch.filter(
+                    Q(last_activity_at__gt=last[0])
+                    | Q(last_activity_at=last[0], uuid__gt=last[1])
+                )
+            size = options["batch_size"]
+            if limit is not None:
+                size = min(size, limit - sessions - skipped)
+            rows = list(batch[:size])
+            if not rows:
+                break
+            for session in rows:
+                result = archive.archive_session(session)
+                if result is None:
+                    skipped += 1
+                    continue
+                sessions += 1
+                messages += result.message_count
+                raw_bytes += result.raw_bytes
+                stored_bytes += len(result.data)
+            last = (rows[-1].last_activity_at, rows[-1].uuid)
+            self.stdout.write(f"archived {sessions} sessions ({messages} messages)")
+
+        ratio = raw_bytes / stored_bytes if stored_bytes else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"archived {sessions} sessions, {messages} messages, "
+                f"{raw_bytes / 1e6:.1f} MB -> {stored_bytes / 1e6:.1f} MB "
+                f"(x{ratio:.1f}), skipped {skipped} with pending turns"
+            )
+        )
+        if options["vacuum"]:
+            self._vacuum()
+
+    def _vacuum(self) -> None:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("VACUUM (ANALYZE) core_message")
+            elif connection.vendor == "sqlite":
+                cursor.execute("VACUUM")
+        self.stdout.write("vacuumed")
+
+    def _restore(self, uuids) -> None:
+        for value in uuids:
+            try:
+                session = ChatSession.objects.get(uuid=value)
+            except (ChatSession.DoesNotExist, ValidationError):
+                raise CommandError(f"session not found: {value}")
+            count = archive.restore_session(session)
+            self.stdout.write(f"restored {value}: {count} messages")
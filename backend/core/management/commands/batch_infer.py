@@ -0,0 +1,226 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.llm_clients import build_llm_client
+from core.models import LLM
+
+
+def _percentiles(samples: list[float]) -> str:
+    if not samples:
+        return "-"
+    ms = sorted(s * 1000 for s in samples)
+    q = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return f"p50 {q[49]:.0f} ms / p95 {q[94]:.0f} ms / p99 {q[98]:.0f} ms"
+
+
+class Command(BaseCommand):
+    help = (
+        "JSONL のプロンプト集を LLM（複数可）に並列で送り、結果を JSONL に書く。"
+        "出力済みの (id, LLM) は再実行時にスキップする"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input",
+            help='1 行 1 件の JSONL（{"id", "prompt" | "messages", "system", "options"}）',
+        )
+        parser.add_argument(
+            "--llm",
+            action="append",
+            required=True,
+            help="LLM の id または name（複数指定で同じプロンプトを各 LLM に送る）",
+        )
+        parser.add_argument(
+            "--output",
+            "-o",
+            required=True,
+            help="結果の JSONL（追記。チェックポイントを兼ねる）",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="同時リクエスト数"
+        )
+        parser.add_argument(
+            "--options",
+            default=None,
+            help="全件に適用する options（JSON。行の options が優先）",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="前回 error になった (id, LLM) も再実行する",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="実行する件数の上限"
+        )
+
+    def _llms(self, values) -> list[LLM]:
+        llms = []
+        for value in values:
+            qs = (
+                LLM.objects.filter(pk=value)
+                if value.isdigit()
+                else LLM.objects.filter(name=value)
+            )
+            llm = qs.first()
+            if llm is None:
+                raise CommandError(f"LLM not found: {value}")
+            llms.append(llm)
+        return llms
+
+    def _prompts(self, path: str, options: dict) -> list[dict]:
+        prompts, seen = [], set()
+        try:
+            lines = Path(path).read_text(encoding="utf-8").splitlines()
+        except OSError as e:
+            raise CommandError(str(e))
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise CommandError(f"{path}:{number}: invalid JSON")
+            messages = item.get("messages")
+            if messages is None:
+                if "prompt" not in item:
+                    raise CommandError(
+                        f"{path}:{number}: prompt or messages is required"
+                    )
+                messages = [{"role": "user", "content": item["prompt"]}]
+            if item.get("system"):
+                messages = [{"role": "system", "content": item["system"]}] + messages
+            prompt_id = str(item.get("id", number))
+            if prompt_id in seen:
+                raise CommandError(f"{path}:{number}: duplicate id {prompt_id}")
+            seen.add(prompt_id)
+            prompts.append(
+                {
+                    "id": prompt_id,
+                    "messages": messages,
+                    "options": {**options, **(item.get("options") or {})} or None,
+                }
+            )
+        return prompts
+
+    def _done(self, path: str, retry_failed: bool) -> set[tuple[str, int]]:
+        """出力済みの (id, llm_id)。中断で途中まで書かれた最終行は無視する"""
+        done = set()
+        try:
+            f = open(path, "r+", encoding="utf-8")
+        except FileNotFoundError:
+            return done
+        with f:
+            line = ""
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if retry_failed and row.get("error"):
+                    continue
+                done.add((row["id"], row["llm_id"]))
+            if line and not line.endswith("\n"):
+                # 途中までの行の後ろに追記しないよう改行しておく
+                f.write("\n")
+        return done
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be positive")
+        try:
+            base_options = json.loads(options["options"]) if options["options"] else {}
+        except ValueError:
+            raise CommandError("--options must be JSON")
+
+        llms = self._llms(options["llm"])
+        prompts = self._prompts(options["input"], base_options)
+        done = self._done(options["output"], options["retry_failed"])
+        tasks = [
+            (prompt, llm)
+            for prompt in prompts
+            for llm in llms
+            if (prompt["id"], llm.pk) not in done
+        ]
+        if options["limit"] is not None:
+            tasks = tasks[: options["limit"]]
+        skipped = len(prompts) * len(llms) - len(tasks)
+        self.stdout.write(f"{len(tasks)} requests to run ({skipped} already done)")
+        if not tasks:
+            return
+
+        clients = {llm.pk: build_llm_client(llm) for llm in llms}
+        stats = {
+            llm.pk: {"ok": 0, "failed": 0, "latency": [], "tokens": 0} for llm in llms
+        }
+        write_lock = threading.Lock()
+
+        def infer(prompt: dict, llm: LLM, out) -> None:
+            started = time.perf_counter()
+            row = {
+                "id": prompt["id"],
+                "llm_id": llm.pk,
+                "llm": llm.name,
+                "model": llm.model,
+            }
+            try:
+                result = clients[llm.pk].chat(
+                    prompt["messages"], options=prompt["options"]
+                )
+            except Exception as e:
+                row["error"] = str(e) or type(e).__name__
+            else:
+                row.update(content=result.content, usage=result.usage)
+            elapsed = time.perf_counter() - started
+            row["latency_ms"] = round(elapsed * 1000, 1)
+            line = json.dumps(row, ensure_ascii=False)
+            with write_lock:
+                # 1 件ごとに flush して中断されても書いた分は再実行しない
+                out.write(line + "\n")
+                out.flush()
+                s = stats[llm.pk]
+                if "error" in row:
+                    s["failed"] += 1
+                    return
+                s["ok"] += 1
+                s["latency"].append(elapsed)
+                s["tokens"] += result.usage.get("eval_count") or 0
+
+        started = time.perf_counter()
+        with open(options["output"], "a", encoding="utf-8") as out:
+            executor = ThreadPoolExecutor(max_workers=options["concurrency"])
+            pending = set()
+            try:
+                # 投入は同時実行数の 2 倍まで（中断時にキャンセルする未実行分を少なくする）
+                for prompt, llm in tasks:
+                    if len(pending) >= options["concurrency"] * 2:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            future.result()
+                    pending.add(executor.submit(infer, prompt, llm, out))
+                for future in pending:
+                    future.result()
+            except KeyboardInterrupt:
+                self.stderr.write("interrupted; rerun the same command to resume")
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            executor.shutdown()
+        elapsed = time.perf_counter() - started
+
+        total_ok = sum(s["ok"] for s in stats.values())
+        self.stdout.write(
+            f"{len(tasks)} requests in {elapsed:.1f} s "
+            f"({len(tasks) / elapsed:.2f} req/s, {total_ok} ok)"
+        )
+        for llm in llms:
+            s = stats[llm.pk]
+            tokens_per_second = s["tokens"] / elapsed if elapsed else 0
+            self.stdout.write(
+                f"  {llm.name}: {s['ok']} ok, {s['failed']} failed, "
+                f"{tokens_per_second:.1f} tokens/s, latency {_percentiles(s['latency'])}"
+            )
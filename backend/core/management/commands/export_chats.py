@@ -0,0 +1,55 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import export
+
+
+class Command(BaseCommand):
+    help = "セッションのメッセージを NDJSON / CSV で書き出す（採点用、件数によらず定メモリ）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=sorted(export.CONTENT_TYPES), default="ndjson"
+        )
+        parser.add_argument("--llm", type=int, default=None, help="LLM id")
+        parser.add_argument(
+            "--session",
+            action="append",
+            default=[],
+            metavar="UUID",
+            help="セッション（複数指定可）",
+        )
+        parser.add_argument("--since", default=None, help="ISO 日付 / 日時（含む）")
+        parser.add_argument(
+            "--until", default=None, help="ISO 日付（その日を含む）/ 日時（含まない）"
+        )
+        parser.add_argument(
+            "--output", "-o", default="-", help="出力ファイル（既定は標準出力）"
+        )
+        parser.add_argument("--chunk-size", type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = export.parse_bound(options["since"])
+            until = export.parse_bound(options["until"], end=True)
+            sessions = [uuid.UUID(v) for v in options["session"]]
+        except ValueError as e:
+            raise CommandError(str(e))
+        rows = export.rows(
+            llm=options["llm"],
+            sessions=sessions,
+            since=since,
+            until=until,
+            chunk_size=options["chunk_size"],
+        )
+        chunks = export.render(rows, options["format"])
+        if options["output"] == "-":
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+        # CSV の改行は csv.writer が書くため newline="" で開く
+        with open(options["output"], "w", encoding="utf-8", newline="") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stderr.write(f"wrote {options['output']}")
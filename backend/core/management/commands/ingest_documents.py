@@ -0,0 +1,138 @@
+import hashlib
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import embeddings, rag
+from core.llm_clients import OllamaClient
+from core.models import Document, DocumentChunk
+
+TEXT_SUFFIXES = {".md", ".txt", ".rst"}
+
+
+class Command(BaseCommand):
+    help = "講義資料をチャンク化・埋め込みして RAG のコレクションに取り込む"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="ファイルまたはディレクトリ")
+        parser.add_argument("--collection", default="default")
+        parser.add_argument(
+            "--model",
+            default=rag.DEFAULT_EMBEDDING_MODEL,
+            help="Ollama の埋め込みモデル（env RAG_EMBEDDING_MODEL）",
+        )
+        parser.add_argument(
+            "--base-url", default=None, help="Ollama の URL（既定 OLLAMA_BASE_URL）"
+        )
+        parser.add_argument("--chunk-size", type=int, default=rag.DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--overlap", type=int, default=rag.DEFAULT_CHUNK_OVERLAP)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=embeddings.DEFAULT_BATCH_SIZE,
+            help="埋め込みバッチの初期件数（所要時間に応じて自動調整）",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=embeddings.DEFAULT_WORKERS,
+            help="同時に送る埋め込みバッチ数（env EMBEDDING_WORKERS）",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="コレクションを削除して作り直す（モデル変更時など）",
+        )
+        parser.add_argument(
+            "--rebuild-index",
+            action="store_true",
+            help="IVF インデックスを k-means から作り直す",
+        )
+        parser.add_argument(
+            "--nlist", type=int, default=None, help="IVF のリスト数（既定 √行数）"
+        )
+
+    def _files(self, paths):
+        for raw in paths:
+            path = Path(raw)
+            if path.is_dir():
+                yield from sorted(
+                    p for p in path.rglob("*") if p.suffix.lower() in TEXT_SUFFIXES
+                )
+            elif path.is_file():
+                yield path
+            else:
+                raise CommandError(f"not found: {raw}")
+
+    def handle(self, *args, **options):
+        if rag.np is None:
+            raise CommandError("numpy is required for ingest_documents")
+        collection = options["collection"]
+        model = options["model"]
+        store = rag.VectorStore(collection)
+        service = embeddings.EmbeddingService(
+            OllamaClient(options["base_url"], model),
+            model,
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+        )
+
+        if options["rebuild"]:
+            Document.objects.filter(collection=collection).delete()
+            store.reset()
+
+        added = skipped = 0
+        for path in self._files(options["paths"]):
+            text = path.read_text(encoding="utf-8")
+            content_hash = hashlib.sha256(text.encode()).hexdigest()
+            source = str(path)
+            doc = Document.objects.filter(collection=collection, source=source).first()
+            if doc and doc.content_hash == content_hash:
+                skipped += 1
+                continue
+
+            chunks = rag.chunk_text(text, options["chunk_size"], options["overlap"])
+            if not chunks:
+                continue
+            first = None
+            # ファイル単位 × window 件ずつ追記するため、全体の量によらずメモリは一定
+            for vectors in service.embed_iter(chunks):
+                try:
+                    row = store.append(rag.normalize(vectors), model)
+                except ValueError as e:
+                    raise CommandError(f"{e} (use --rebuild)")
+                first = row if first is None else first
+
+            stale = []
+            with transaction.atomic():
+                if doc is None:
+                    doc = Document(collection=collection, source=source)
+                else:
+                    stale = list(doc.chunks.values_list("row", flat=True))
+                    doc.chunks.all().delete()
+                doc.content_hash = content_hash
+                doc.save()
+                DocumentChunk.objects.bulk_create(
+                    DocumentChunk(
+                        document=doc,
+                        collection=collection,
+                        row=first + i,
+                        ordinal=i,
+                        content=chunk,
+                    )
+                    for i, chunk in enumerate(chunks)
+                )
+            # 古いチャンクの行はファイルに残るため削除済みとして記録する
+            # （検索から除き、次の update_index でインデックスからも外す）
+            store.tombstone(stale)
+            added += len(chunks)
+            self.stdout.write(f"ingested: {source} ({len(chunks)} chunks)")
+
+        index = store.update_index(options["nlist"], rebuild=options["rebuild_index"])
+        self.stdout.write(f"ivf index: {index}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{collection}: {added} chunks added, {skipped} files unchanged"
+            )
+        )
@@ -0,0 +1,51 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import fail_stale_jobs, run_worker_loop
+
+
+class Command(BaseCommand):
+    help = "バックグラウンドのチャット生成ジョブ (ChatJob) を処理するワーカープールを起動する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=4, help="同時に処理するジョブ数"
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="キューが空の時の待機秒数"
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=600,
+            help="起動時、この秒数以上 running のジョブを failed にする",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="キューが空になったら終了する"
+        )
+
+    def handle(self, *args, **options):
+        stale = fail_stale_jobs(timedelta(seconds=options["stale_after"]))
+        if stale:
+            self.stderr.write(f"marked {stale} stale job(s) as failed")
+
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, lambda *_: stop.set())
+
+        workers = options["workers"]
+        self.stdout.write(f"chat worker started (workers={workers})")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    run_worker_loop, stop, options["poll_interval"], options["once"]
+                )
+                for _ in range(workers)
+            ]
+            processed = sum(f.result() for f in futures)
+        self.stdout.write(f"chat worker stopped (processed={processed})")
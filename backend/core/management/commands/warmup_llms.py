@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.llm_clients import build_llm_client
+from core.models import LLM
+
+
+class Command(BaseCommand):
+    help = "有効な Ollama LLM のモデルを事前ロードする（keep_alive を適用）"
+
+    def handle(self, *args, **options):
+        for llm in LLM.objects.filter(is_active=True, provider="OLLAMA"):
+            try:
+                build_llm_client(llm).preload()
+            except Exception as e:
+                # 1 つのモデルが失敗しても他のモデルのロードは続ける
+                self.stderr.write(f"warmup failed: {llm} ({e})")
+            else:
+                self.stdout.write(f"warmed up: {llm}")
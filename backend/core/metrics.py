@@ -0,0 +1,197 @@
+"""プロセス内メトリクスと Prometheus テキスト形式での出力。
+
+外部ライブラリ / サービスに依存しない最小実装。値はプロセスごとに保持されるため、
+gunicorn の複数ワーカー構成では各ワーカーの値がスクレイプごとに入れ替わる点に注意。
+"""
+
+import math
+import threading
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: dict | None = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in items
+    )
+    return "{" + body + "}"
+
+
+def _format_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, key, None, v
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_labels_key(labels)] = value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+        # labels -> [bucket counts..., sum, count]
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels_key(labels)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels) -> int:
+        row = self._values.get(_labels_key(labels))
+        return row[-1] if row else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, row in items:
+            for bound, n in zip(self.buckets, row):
+                yield self.name + "_bucket", key, {"le": _format_value(bound)}, n
+            yield self.name + "_sum", key, None, row[-2]
+            yield self.name + "_count", key, None, row[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, extra, value in metric.samples():
+                lines.append(
+                    f"{name}{_format_labels(key, extra)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+chat_requests = registry.counter(
+    "llm_chat_requests_total", "Chat generations by LLM and status"
+)
+chat_duration = registry.histogram(
+    "llm_chat_duration_seconds", "Wall-clock chat generation latency"
+)
+time_to_first_token = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first generated token"
+)
+load_duration = registry.histogram(
+    "llm_load_duration_seconds", "Ollama model load time (load_duration)"
+)
+prompt_eval_duration = registry.histogram(
+    "llm_prompt_eval_duration_seconds", "Ollama prompt evaluation time"
+)
+eval_duration = registry.histogram(
+    "llm_eval_duration_seconds", "Ollama token generation time"
+)
+prompt_tokens = registry.counter(
+    "llm_prompt_tokens_total", "Prompt tokens evaluated (prompt_eval_count)"
+)
+completion_tokens = registry.counter(
+    "llm_completion_tokens_total", "Generated tokens (eval_count)"
+)
+tokens_per_second = registry.histogram(
+    "llm_tokens_per_second",
+    "Generation throughput per chat",
+    buckets=(1, 5, 10, 20, 40, 80, 160, math.inf),
+)
+
+
+def _seconds(ns) -> float | None:
+    return ns / 1e9 if ns is not None else None
+
+
+def record_chat(llm, usage: dict, elapsed: float, status: str = "completed") -> None:
+    """1 回のチャット生成の usage と経過時間 (秒) をメトリクスに記録する"""
+    labels = {"llm": llm.name, "model": llm.model}
+    chat_requests.inc(status=status, **labels)
+    if status != "completed":
+        return
+    chat_duration.observe(elapsed, **labels)
+    ttft = usage.get("time_to_first_token_ms")
+    if ttft is not None:
+        time_to_first_token.observe(ttft / 1000, **labels)
+    for histogram, key in (
+        (load_duration, "load_duration"),
+        (prompt_eval_duration, "prompt_eval_duration"),
+        (eval_duration, "eval_duration"),
+    ):
+        value = _seconds(usage.get(key))
+        if value is not None:
+            histogram.observe(value, **labels)
+    if usage.get("prompt_eval_count") is not None:
+        prompt_tokens.inc(usage["prompt_eval_count"], **labels)
+    if usage.get("eval_count") is not None:
+        completion_tokens.inc(usage["eval_count"], **labels)
+    if usage.get("tokens_per_second") is not None:
+        tokens_per_second.observe(usage["tokens_per_second"], **labels)
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "core",
+            "0002_rename_core_mess_session_3e15a5_idx_core_messag_session_567bd2_idx_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "pending"),
+                    ("completed", "completed"),
+                    ("failed", "failed"),
+                    ("aborted", "aborted"),
+                ],
+                default="completed",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_chatjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResponseCacheEntry",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("content", models.TextField()),
+                ("usage", models.JSONField(blank=True, default=dict)),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField()),
+                (
+                    "llm",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="response_cache",
+                        to="core.llm",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["llm", "created_at"],
+                        name="core_respon_llm_id_abae38_idx",
+                    ),
+                    models.Index(
+                        fields=["expires_at"], name="core_respon_expires_74bab8_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
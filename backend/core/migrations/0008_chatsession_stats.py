@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    """既存セッションの集計値をメッセージから計算する"""
+    ChatSession = apps.get_model("core", "ChatSession")
+    Message = apps.get_model("core", "Message")
+    for session in ChatSession.objects.iterator():
+        messages = Message.objects.filter(session=session).order_by("created_at", "id")
+        count = prompt = completion = 0
+        last = None
+        for m in messages.iterator():
+            count += 1
+            prompt += (m.usage or {}).get("prompt_eval_count") or 0
+            completion += (m.usage or {}).get("eval_count") or 0
+            last = m
+        ChatSession.objects.filter(pk=session.pk).update(
+            message_count=count,
+            last_activity_at=last.created_at if last else session.created_at,
+            last_message_preview=last.content[:100] if last else "",
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_embeddingcacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="completion_tokens",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="last_activity_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="last_message_preview",
+            field=models.CharField(blank=True, default="", max_length=200),
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="prompt_tokens",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="chatsession",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-last_activity_at", "-uuid"],
+                name="core_session_active_recent",
+            ),
+        ),
+    ]
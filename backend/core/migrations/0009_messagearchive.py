@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_chatsession_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageArchive",
+            fields=[
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="archive",
+                        serialize=False,
+                        to="core.chatsession",
+                    ),
+                ),
+                ("message_count", models.PositiveIntegerField()),
+                ("raw_bytes", models.PositiveBigIntegerField()),
+                ("data", models.BinaryField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="archived_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    """完了した user / assistant の件数をメッセージから数える"""
+    ChatSession = apps.get_model("core", "ChatSession")
+    Message = apps.get_model("core", "Message")
+    for session in ChatSession.objects.iterator():
+        count = (
+            Message.objects.filter(session=session, status="completed")
+            .exclude(role="system")
+            .count()
+        )
+        ChatSession.objects.filter(pk=session.pk).update(completed_message_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_messagearchive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="completed_message_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill(apps, schema_editor):
+    """既存エントリは作成日時を最終利用日時とする"""
+    ResponseCacheEntry = apps.get_model("core", "ResponseCacheEntry")
+    ResponseCacheEntry.objects.update(last_used_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_chatsession_completed_message_count"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="responsecacheentry",
+            name="core_respon_llm_id_abae38_idx",
+        ),
+        migrations.AddField(
+            model_name="responsecacheentry",
+            name="last_used_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="responsecacheentry",
+            index=models.Index(
+                fields=["llm", "last_used_at"], name="core_respon_llm_id_7f51fb_idx"
+            ),
+        ),
+    ]
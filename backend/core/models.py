@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 
 
 class LLM(models.Model):
@@ -43,6 +44,27 @@ class ChatSession(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # 一覧表示用の集計値。Message の作成と同じトランザクションで
+    # core/session_stats.py が更新する（bulk_create では更新されない）
+    message_count = models.PositiveIntegerField(default=0)
+    # 完了した user / assistant の件数（要約の対象になるメッセージ）
+    completed_message_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    last_message_preview = models.CharField(max_length=200, blank=True, default="")
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    # メッセージを MessageArchive に移した日時（core/archive.py）
+    archived_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # セッション一覧（有効なものを最近の活動順）用の部分インデックス
+            models.Index(
+                fields=["-last_activity_at", "-uuid"],
+                condition=models.Q(is_active=True),
+                name="core_session_active_recent",
+            )
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"{self.title} ({self.uuid})"
@@ -55,6 +77,14 @@ class Message(models.Model):
         ("assistant", "assistant"),
         ("tool", "tool"),
     ]
+    # 生成ターンの状態。pending は LLM 応答待ち、failed / aborted は
+    # 生成失敗・中断で、いずれも completed 以外は履歴として LLM に送らない。
+    STATUS_CHOICES = [
+        ("pending", "pending"),
+        ("completed", "completed"),
+        ("failed", "failed"),
+        ("aborted", "aborted"),
+    ]
 
     session = models.ForeignKey(
         ChatSession,
@@ -64,6 +94,11 @@ class Message(models.Model):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     content = models.TextField()
     name = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default="completed",
+    )
     usage = models.JSONField(default=dict, blank=True)
     metadata = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -74,3 +109,144 @@ class Message(models.Model):
 
     def __str__(self) -> str:  # pragma: no cover
         return f"{self.role}: {self.content[:30]}"
+
+
+class MessageArchive(models.Model):
+    """アーカイブしたセッションのメッセージ（core/archive.py）。zlib 圧縮した JSONL"""
+
+    session = models.OneToOneField(
+        ChatSession,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="archive",
+    )
+    message_count = models.PositiveIntegerField()
+    # 圧縮前のバイト数
+    raw_bytes = models.PositiveBigIntegerField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.session_id}: {self.message_count} messages"
+
+
+class ChatJob(models.Model):
+    """バックグラウンドで処理するチャット生成ジョブ（run_chat_worker が処理）"""
+
+    STATUS_CHOICES = [
+        ("queued", "queued"),
+        ("running", "running"),
+        ("completed", "completed"),
+        ("failed", "failed"),
+    ]
+
+    uuid = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+    )
+    session = models.ForeignKey(
+        ChatSession,
+        on_delete=models.CASCADE,
+        related_name="jobs",
+    )
+    message = models.TextField()
+    options = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+        ordering = ["created_at"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.status}: {self.uuid}"
+
+
+class ResponseCacheEntry(models.Model):
+    """決定的なチャットリクエストの応答キャッシュ（core/response_cache.py）"""
+
+    # sha256(LLM, model, 正規化した messages, 実効 options)
+    key = models.CharField(max_length=64, primary_key=True)
+    llm = models.ForeignKey(
+        LLM,
+        on_delete=models.CASCADE,
+        related_name="response_cache",
+    )
+    content = models.TextField()
+    usage = models.JSONField(default=dict, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # 上限件数を超えたときはこれが古いものから削除する（DB 層のヒットで更新）
+    last_used_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["llm", "last_used_at"]),
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.llm_id}: {self.key[:12]}"
+
+
+class Document(models.Model):
+    """RAG 用に取り込んだ資料（manage.py ingest_documents が作成）"""
+
+    collection = models.CharField(max_length=100, default="default")
+    source = models.CharField(max_length=500)
+    # 内容が変わっていなければ再取り込みしない
+    content_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["collection", "source"], name="uniq_document_source"
+            )
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.collection}: {self.source}"
+
+
+class DocumentChunk(models.Model):
+    """資料のチャンク。``row`` はベクトルファイル (core/rag.py) の行番号"""
+
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name="chunks",
+    )
+    collection = models.CharField(max_length=100)
+    row = models.PositiveIntegerField()
+    ordinal = models.PositiveIntegerField()
+    content = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["collection", "row"], name="uniq_chunk_row")
+        ]
+        ordering = ["document", "ordinal"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.document_id}#{self.ordinal}"
+
+
+class EmbeddingCacheEntry(models.Model):
+    """埋め込みベクトルのキャッシュ（core/embeddings.py）。キーは sha256(model, text)"""
+
+    key = models.CharField(max_length=64, primary_key=True)
+    model = models.CharField(max_length=100)
+    # float32 のバイト列
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.model}: {self.key[:12]}"
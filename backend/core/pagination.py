@@ -0,0 +1,165 @@
+"""Message / ChatSession のキーセット（カーソル）ページング。
+
+Message は ``(created_at, id)`` の順序で前後をたどるため、Message の
+``(session, created_at)`` インデックスに沿った LIMIT 付きクエリになり、
+OFFSET と違ってページが深くてもコストが増えない。
+カーソルは ``created_at`` と ``id`` を base64 化した不透明な文字列。
+
+アーカイブ済みセッションのメッセージ（core/archive.py）は展開したリストを
+``paginate_message_list`` で同じ仕様で切り出す。
+
+ChatSession は ``(last_activity_at, uuid)`` の新しい順で、部分インデックス
+``core_session_active_recent`` に沿う。
+"""
+
+import base64
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def _encode(dt: datetime, pk) -> str:
+    raw = f"{dt.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode(cursor: str, parse_pk) -> tuple[datetime, object]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        value, pk = raw.rsplit("|", 1)
+        dt = parse_datetime(value)
+        if dt is None:
+            raise ValueError
+        return dt, parse_pk(pk)
+    except ValueError:
+        raise ValueError("invalid cursor")
+
+
+def encode_cursor(m) -> str:
+    return _encode(m.created_at, m.id)
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    return _decode(cursor, int)
+
+
+def _limit(value) -> int:
+    if value in (None, ""):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+
+def paginate_messages(qs, params) -> dict:
+    """クエリパラメータ ``before`` / ``after`` / ``since`` / ``limit`` でページを切り出す。
+
+    - ``after``: カーソルより新しいメッセージを古い順に ``limit`` 件
+    - ``since``: ISO 日時より後のメッセージを古い順に ``limit`` 件（差分取得）
+    - ``before``: カーソルより古いメッセージのうち新しい ``limit`` 件
+    - いずれも無し: 最新 ``limit`` 件
+
+    results は常に古い順。``before`` / ``after`` は次に前後をたどるためのカーソル、
+    ``has_more`` は取得方向にまだメッセージが残っているか。
+    """
+    limit = _limit(params.get("limit"))
+    after = params.get("after")
+    since = params.get("since")
+    before = params.get("before")
+
+    if after or since:
+        if after:
+            created_at, pk = decode_cursor(after)
+            qs = qs.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            )
+        if since:
+            since_dt = parse_datetime(since)
+            if since_dt is None:
+                raise ValueError("invalid since")
+            qs = qs.filter(created_at__gt=since_dt)
+        rows = list(qs.order_by("created_at", "id")[: limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before:
+            created_at, pk = decode_cursor(before)
+            qs = qs.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        rows = list(qs.order_by("-created_at", "-id")[: limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+
+    return {
+        "results": rows,
+        "before": encode_cursor(rows[0]) if rows else before,
+        "after": encode_cursor(rows[-1]) if rows else after,
+        "has_more": has_more,
+    }
+
+
+def paginate_message_list(rows: list, params) -> dict:
+    """``paginate_messages`` と同じ仕様で、古い順に並んだ Message のリストから切り出す
+    （アーカイブ済みセッション用）"""
+    limit = _limit(params.get("limit"))
+    after = params.get("after")
+    since = params.get("since")
+    before = params.get("before")
+
+    if after or since:
+        if after:
+            key = decode_cursor(after)
+            rows = [m for m in rows if (m.created_at, m.id) > key]
+        if since:
+            since_dt = parse_datetime(since)
+            if since_dt is None:
+                raise ValueError("invalid since")
+            rows = [m for m in rows if m.created_at > since_dt]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before:
+            key = decode_cursor(before)
+            rows = [m for m in rows if (m.created_at, m.id) < key]
+        has_more = len(rows) > limit
+        rows = rows[-limit:]
+
+    return {
+        "results": rows,
+        "before": encode_cursor(rows[0]) if rows else before,
+        "after": encode_cursor(rows[-1]) if rows else after,
+        "has_more": has_more,
+    }
+
+
+def paginate_sessions(qs, params) -> dict:
+    """最近の活動順に ``limit`` 件。``before`` にはひとつ前の応答の ``before`` を渡す。
+
+    results は新しい順。``has_more`` はさらに古いセッションが残っているか。
+    """
+    limit = _limit(params.get("limit"))
+    before = params.get("before")
+    if before:
+        last_activity_at, pk = _decode(before, uuid.UUID)
+        qs = qs.filter(
+            Q(last_activity_at__lt=last_activity_at)
+            | Q(last_activity_at=last_activity_at, uuid__lt=pk)
+        )
+    rows = list(qs.order_by("-last_activity_at", "-uuid")[: limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "results": rows,
+        "before": _encode(rows[-1].last_activity_at, rows[-1].uuid) if rows else before,
+        "has_more": has_more,
+    }
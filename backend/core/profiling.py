@@ -0,0 +1,145 @@
+"""リクエスト単位のプロファイリング（SQL 数 / 時間、段階ごとの所要時間）。
+
+``ProfilingMiddleware``（env ``REQUEST_PROFILING=true`` で有効）がリクエストごとに
+``RequestProfile`` を作り、そのスレッドの DB 接続の SQL を数える。コード側は
+``with span("history"):`` で段階を計測する（プロファイル対象外のリクエストでは
+何もしない）。結果は ``Server-Timing`` ヘッダ（ブラウザの開発者ツールの
+Timing タブに表示される）と ``http_request_stage_seconds`` に出す。
+
+``REQUEST_PROFILING_SAMPLE_RATE``（0〜1）の割合のリクエストを cProfile 下で
+実行し、``REQUEST_PROFILING_SLOW_MS`` を超えたものだけ
+``REQUEST_PROFILING_DIR`` に ``.prof`` を保存する（``python -m pstats`` や
+snakeviz で読む）。cProfile は同時に 1 つしか動かせないため、計測中の
+リクエストがあれば他はサンプリングしない。
+
+ストリーミング応答では本文の生成前までの値だけがヘッダに入る。
+"""
+
+import cProfile
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+stage_seconds = registry.histogram(
+    "http_request_stage_seconds",
+    "Time spent per request stage (profiling middleware)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5, math.inf),
+)
+
+_current: ContextVar["RequestProfile | None"] = ContextVar(
+    "request_profile", default=None
+)
+_cprofile_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_seconds += time.perf_counter() - started
+
+    def server_timing(self) -> str:
+        total = time.perf_counter() - self.started
+        parts = [
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} queries"'
+        ]
+        parts += [f"{name};dur={s * 1000:.1f}" for name, s in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def span(stage: str):
+    """プロファイル中のリクエストなら stage の所要時間を記録する"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(stage, time.perf_counter() - started)
+
+
+def _dump_name(request, elapsed_ms: float) -> str:
+    path = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "root"
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return f"{stamp}-{request.method}-{path[:80]}-{elapsed_ms:.0f}ms.prof"
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        self.slow_ms = settings.REQUEST_PROFILING_SLOW_MS
+        self.directory = str(settings.REQUEST_PROFILING_DIR)
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        profiler = self._profiler()
+        try:
+            with connection.execute_wrapper(profile.execute_wrapper):
+                if profiler is None:
+                    response = self.get_response(request)
+                else:
+                    try:
+                        response = profiler.runcall(self.get_response, request)
+                    finally:
+                        _cprofile_lock.release()
+        finally:
+            _current.reset(token)
+
+        response["Server-Timing"] = profile.server_timing()
+        for name, seconds in profile.stages.items():
+            stage_seconds.observe(seconds, stage=name)
+        stage_seconds.observe(profile.sql_seconds, stage="db")
+        elapsed_ms = (time.perf_counter() - profile.started) * 1000
+        if profiler is not None and elapsed_ms >= self.slow_ms:
+            self._dump(profiler, request, elapsed_ms)
+        return response
+
+    def _profiler(self) -> cProfile.Profile | None:
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        if not _cprofile_lock.acquire(blocking=False):
+            return None
+        return cProfile.Profile()
+
+    def _dump(self, profiler, request, elapsed_ms: float) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, _dump_name(request, elapsed_ms))
+            profiler.dump_stats(path)
+            logger.info("slow request profile: %s", path)
+        except OSError:
+            logger.warning("could not write profile", exc_info=True)
@@ -0,0 +1,347 @@
+"""資料検索 (RAG)。
+
+``manage.py ingest_documents`` が資料をチャンクに分割して Ollama の埋め込み
+モデルでベクトル化し（core/embeddings.py）、コレクションごとに
+
+- ``<RAG_INDEX_DIR>/<collection>.f32``: 正規化済み float32 ベクトルを行として
+  連結したファイル（メモリマップで読む）
+- ``<RAG_INDEX_DIR>/<collection>.json``: ``{"model", "dim", "rows"}``
+- ``<RAG_INDEX_DIR>/<collection>.dead``: 再取り込みで参照されなくなった行番号
+  （int64 の追記。検索から除き、IVF インデックスの merge で取り除く）
+- ``DocumentChunk``: 行番号 → チャンク本文（DB）
+
+に保存する。``ChatSession.metadata["rag"] = {"collection": ..., "top_k": 4}``
+のセッションでは、ChatInSessionUsecase が今回の質問で検索した上位チャンクを
+system メッセージとして質問の直前に挿入する。
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+
+    from . import ann
+except ImportError:  # pragma: no cover - requirements.txt には含まれる
+    np = ann = None
+
+from django.conf import settings
+
+from .embeddings import EmbeddingService
+from .llm_clients import build_llm_client
+from .metrics import registry
+from .models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "nomic-embed-text")
+DEFAULT_TOP_K = 4
+DEFAULT_CHUNK_SIZE = 800
+DEFAULT_CHUNK_OVERLAP = 100
+# これ未満の行数なら全件検索で十分速いため IVF インデックスを作らない
+IVF_MIN_ROWS = 10_000
+
+CONTEXT_PROMPT = "以下の資料を参考に回答してください。\n"
+
+rag_search_seconds = registry.histogram(
+    "rag_search_seconds",
+    "Vector search time per query",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, math.inf),
+)
+rag_retrieval_seconds = registry.histogram(
+    "rag_retrieval_seconds",
+    "Retrieval stage time (query embedding + search + chunk lookup)",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, math.inf),
+)
+
+
+def chunk_text(
+    text: str, size: int = DEFAULT_CHUNK_SIZE, overlap: int = DEFAULT_CHUNK_OVERLAP
+) -> list[str]:
+    """段落（空行区切り）を size 文字以内にまとめてチャンクにする。
+
+    size を超える段落は size 文字ごとに切る。文脈が途切れないよう、2 つ目以降の
+    チャンクの先頭には直前のチャンクの末尾 overlap 文字を付ける。
+    """
+    pieces: list[str] = []
+    for p in text.replace("\r\n", "\n").split("\n\n"):
+        p = p.strip()
+        pieces.extend(p[i : i + size] for i in range(0, len(p), size))
+
+    packed: list[str] = []
+    for piece in pieces:
+        if packed and len(packed[-1]) + 2 + len(piece) <= size:
+            packed[-1] += "\n\n" + piece
+        else:
+            packed.append(piece)
+    if not overlap:
+        return packed
+    return packed[:1] + [
+        prev[-overlap:] + "\n" + chunk for prev, chunk in zip(packed, packed[1:])
+    ]
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _is_dead(dead, row: int) -> bool:
+    return dead is not None and row < len(dead) and bool(dead[row])
+
+
+class VectorStore:
+    """コレクションのベクトルファイル。追記とメモリマップでの検索を行う"""
+
+    def __init__(self, collection: str, directory: str | None = None):
+        self.collection = collection
+        self.directory = str(directory or settings.RAG_INDEX_DIR)
+        self.path = os.path.join(self.directory, f"{collection}.f32")
+        self.meta_path = os.path.join(self.directory, f"{collection}.json")
+        self.dead_path = os.path.join(self.directory, f"{collection}.dead")
+        # IVF インデックス (core/ann.py) のファイル名の接頭辞
+        self.index_base = os.path.join(self.directory, collection)
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        self._meta: dict | None = None
+        self._matrix = None
+        self._index_mtime = None
+        self._index = None
+        self._dead_version = None
+        self._dead_rows = None
+
+    def meta(self) -> dict | None:
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._meta_mtime:
+                with open(self.meta_path) as f:
+                    self._meta = json.load(f)
+                self._meta_mtime = mtime
+                self._matrix = None
+            return self._meta
+
+    def matrix(self):
+        """(rows, dim) の読み取り専用メモリマップ（行が増えたら開き直す）"""
+        meta = self.meta()
+        if not meta or not meta["rows"]:
+            return None
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.memmap(
+                    self.path,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(meta["rows"], meta["dim"]),
+                )
+            return self._matrix
+
+    def append(self, vectors, model: str) -> int:
+        """正規化済みベクトルを追記し、先頭の行番号を返す"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        meta = self.meta() or {"model": model, "dim": vectors.shape[1], "rows": 0}
+        if meta["model"] != model or meta["dim"] != vectors.shape[1]:
+            raise ValueError(
+                f"collection {self.collection!r} uses {meta['model']} "
+                f"(dim {meta['dim']}); rebuild it to change the model"
+            )
+        os.makedirs(self.directory, exist_ok=True)
+        first = meta["rows"]
+        with open(self.path, "r+b" if first else "wb") as f:
+            f.seek(first * meta["dim"] * 4)
+            f.write(vectors.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        meta = {**meta, "rows": first + len(vectors)}
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+        return first
+
+    def tombstone(self, rows) -> None:
+        """行を削除済みにする（ベクトルファイルには残る）"""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if not len(rows):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.dead_path, "ab") as f:
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def dead(self):
+        """行番号 → 削除済みか（行列と同じ長さ）。削除済みが無ければ None"""
+        try:
+            st = os.stat(self.dead_path)
+        except FileNotFoundError:
+            return None
+        meta = self.meta()
+        rows = meta["rows"] if meta else 0
+        version = (st.st_ino, st.st_size, st.st_mtime_ns, rows)
+        with self._lock:
+            if version != self._dead_version:
+                ids = np.fromfile(self.dead_path, dtype=np.int64)
+                mask = np.zeros(rows, dtype=bool)
+                mask[ids[ids < rows]] = True
+                self._dead_rows = mask
+                self._dead_version = version
+            return self._dead_rows
+
+    def index(self):
+        """IVF インデックス（未作成なら None。作り直されたら読み直す）"""
+        try:
+            st = os.stat(ann.IVFIndex.pointer_path(self.index_base))
+        except FileNotFoundError:
+            return None
+        # ポインタは置き換えで更新されるため inode も見る（同じ mtime の書き換え対策）
+        version = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            if version != self._index_mtime:
+                self._index = ann.IVFIndex.load(self.index_base)
+                self._index_mtime = version
+            return self._index
+
+    def update_index(self, nlist: int | None = None, rebuild: bool = False) -> str:
+        """IVF インデックスを作成 / 追記行の取り込み。行ったことを返す"""
+        matrix = self.matrix()
+        if matrix is None:
+            return "empty"
+        index = self.index()
+        dead = self.dead()
+        if rebuild or (index is None and len(matrix) >= IVF_MIN_ROWS):
+            ann.IVFIndex.build(self.index_base, matrix, nlist, dead=dead)
+            return "built"
+        if index is not None and (len(matrix) > index.rows or index.stale(dead)):
+            index.merge(self.index_base, matrix, dead)
+            return "merged"
+        return "unchanged"
+
+    def reset(self) -> None:
+        paths = [self.path, self.meta_path, self.dead_path]
+        paths += ann.IVFIndex.all_paths(self.index_base)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self._meta_mtime = self._meta = self._matrix = None
+            self._index_mtime = self._index = None
+            self._dead_version = self._dead_rows = None
+
+    def search(
+        self, query, k: int, nprobe: int | None = None
+    ) -> list[tuple[int, float]]:
+        """内積（= コサイン類似度）の上位 k 行を (行番号, 類似度) で返す。
+
+        IVF インデックスがあれば近傍 ``nprobe`` リストだけを調べる近似検索、
+        無ければ全件検索。削除済みの行は除く（インデックスに残っている分は
+        k 件そろうまで取得件数を倍にして取り直す）。
+        """
+        matrix = self.matrix()
+        if matrix is None:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        started = time.perf_counter()
+        index = self.index()
+        dead = self.dead()
+        if index is not None:
+            nprobe = nprobe or ann.DEFAULT_NPROBE
+            fetch = k
+            while True:
+                found = index.search(query, fetch, matrix, nprobe=nprobe)
+                hits = [h for h in found if not _is_dead(dead, h[0])][:k]
+                if len(hits) >= k or len(found) < fetch:
+                    break
+                fetch *= 2
+        else:
+            scores = matrix @ query
+            if dead is not None:
+                n = min(len(scores), len(dead))
+                scores[:n][dead[:n]] = -np.inf
+            hits = [h for h in ann.top_k(scores, k) if h[1] != -np.inf]
+        rag_search_seconds.observe(
+            time.perf_counter() - started, collection=self.collection
+        )
+        return hits
+
+
+_stores: dict[str, VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(collection: str) -> VectorStore:
+    with _stores_lock:
+        store = _stores.get(collection)
+        if store is None or store.directory != str(settings.RAG_INDEX_DIR):
+            store = VectorStore(collection)
+            _stores[collection] = store
+        return store
+
+
+def retrieve(
+    llm,
+    collection: str,
+    query: str,
+    top_k: int = DEFAULT_TOP_K,
+    nprobe: int | None = None,
+):
+    """質問に近いチャンクを [(DocumentChunk, 類似度)] で返す"""
+    store = get_store(collection)
+    meta = store.meta()
+    if meta is None:
+        return []
+    started = time.perf_counter()
+    # クエリの埋め込みはメモリ層だけにキャッシュする（DB に溜めない）
+    service = EmbeddingService(build_llm_client(llm), meta["model"], persist=False)
+    vector = normalize(service.embed([query])[0])
+    # 削除済みの行は store が除く。取り込み中（DB の反映と削除の記録の間）で
+    # DB に無い行が混じった場合だけ、top_k 件そろうまで取得件数を増やす
+    fetch = top_k
+    while True:
+        hits = store.search(vector, fetch, nprobe)
+        chunks = {
+            c.row: c
+            for c in DocumentChunk.objects.filter(
+                collection=collection, row__in=[row for row, _ in hits]
+            )
+        }
+        results = [(chunks[row], score) for row, score in hits if row in chunks]
+        if len(results) >= top_k or len(hits) < fetch:
+            break
+        fetch *= 2
+    results = results[:top_k]
+    rag_retrieval_seconds.observe(time.perf_counter() - started, collection=collection)
+    return results
+
+
+def augment(session, messages: list[dict]) -> list[dict]:
+    """セッションで RAG が有効なら、検索結果を質問の直前に system として挿入する"""
+    config = (session.metadata or {}).get("rag")
+    if not config or np is None or not messages:
+        return messages
+    try:
+        results = retrieve(
+            session.llm,
+            config.get("collection", "default"),
+            messages[-1]["content"],
+            int(config.get("top_k", DEFAULT_TOP_K)),
+            config.get("nprobe"),
+        )
+    except Exception:
+        # 検索できなくても回答は続ける
+        logger.warning("rag retrieval failed: %s", session.uuid, exc_info=True)
+        return messages
+    if not results:
+        return messages
+    context = CONTEXT_PROMPT + "\n\n".join(
+        f"[{i}] {chunk.content}" for i, (chunk, _) in enumerate(results, 1)
+    )
+    return messages[:-1] + [{"role": "system", "content": context}, messages[-1]]
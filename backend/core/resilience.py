@@ -0,0 +1,322 @@
+"""LLM 呼び出しのサーキットブレーカーとフォールバック LLM へのヘッジ。
+
+``LLM.extra`` の設定:
+
+- ``first_token_deadline``: 秒。この時間内に最初のトークンが来なければ
+  ``fallback_llm`` にも同じリクエストを送り（ヘッジ）、先に最初のトークンを
+  返した方を採用する。負けた方は HTTP 接続を閉じてすぐに打ち切る
+  （``StreamCancel``。応答待ちで止まっていても Ollama 側の生成が止まる）
+- ``fallback_llm``: フォールバック先の LLM id（小さいモデルなど）。主 LLM の
+  失敗時・ブレーカーが開いている時もこちらに送る
+- ``breaker_failures``: 連続でこの回数失敗（または遅延）するとブレーカーを開き、
+  ``breaker_reset_seconds``（既定 30）の間は主 LLM に送らない。期限後は
+  1 リクエストだけ試し（half-open）、成功すれば閉じる
+- ``breaker_slow_seconds``: 最初のトークンまでがこれを超えた呼び出しも失敗と数える
+  （既定は ``first_token_deadline``）
+
+非 stream の ``chat`` も内部では ``stream_chat`` で受け取って最初のトークンを
+検出する。どちらが応答したかは最後のチャンク / ChatResult の ``metadata``
+（``{"served_by": {...}}``）に入り、Message.metadata に保存される。
+ブレーカーの状態はプロセス内。
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections.abc import Iterator
+
+from .admission import LLMBusyError
+from .llm_clients import ChatChunk, ChatResult, StreamCancel, stream_cancel
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESET_SECONDS = 30.0
+SETTING_KEYS = ("first_token_deadline", "fallback_llm", "breaker_failures")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+circuit_state = registry.gauge(
+    "llm_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)"
+)
+hedge_outcomes = registry.counter(
+    "llm_hedge_total", "Requests served by primary / fallback LLM by reason"
+)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failures: int,
+        reset_seconds: float = DEFAULT_RESET_SECONDS,
+        slow_seconds: float | None = None,
+    ):
+        self.name = name
+        self.threshold = failures
+        self.reset_seconds = reset_seconds
+        self.slow_seconds = slow_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        circuit_state.set(_STATE_VALUES[state], llm=self.name)
+
+    def allow(self) -> bool:
+        """呼び出してよければ True（half-open では同時に 1 件だけ）"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() < self.opened_at + self.reset_seconds:
+                    return False
+                self._set(HALF_OPEN)
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._set(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._set(OPEN)
+
+    def retry_after(self) -> int:
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        return max(1, int(remaining + 0.999))
+
+
+_breakers: dict[tuple, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(llm) -> CircuitBreaker | None:
+    extra = llm.extra or {}
+    if not extra.get("breaker_failures"):
+        return None
+    deadline = extra.get("first_token_deadline")
+    slow = extra.get("breaker_slow_seconds", deadline)
+    settings = (
+        int(extra["breaker_failures"]),
+        float(extra.get("breaker_reset_seconds", DEFAULT_RESET_SECONDS)),
+        float(slow) if slow else None,
+    )
+    key = (llm.pk,) + settings
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(llm.name, *settings)
+            _breakers[key] = breaker
+        return breaker
+
+
+class _Runner:
+    """別スレッドで stream_chat を読み、(name, chunk, error) をキューに入れる"""
+
+    def __init__(self, name: str, llm, client, messages, options, out: queue.Queue):
+        self.name = name
+        self.llm = llm
+        self.breaker = get_breaker(llm)
+        self.started = time.monotonic()
+        self.first_token_at: float | None = None
+        self.finished = False
+        self._cancel = StreamCancel()
+        self._stream = client.stream_chat(messages, options=options)
+        self._out = out
+        threading.Thread(target=self._run, name=f"llm-{name}", daemon=True).start()
+
+    def _run(self) -> None:
+        # このスレッドで開いた HTTP 応答を cancel() から閉じられるようにする
+        stream_cancel.set(self._cancel)
+        try:
+            for chunk in self._stream:
+                if self._cancel.cancelled:
+                    return
+                self._out.put((self.name, chunk, None))
+                if chunk.done:
+                    return
+            raise RuntimeError("LLM stream ended before completion")
+        except Exception as e:
+            if not self._cancel.cancelled:
+                self._out.put((self.name, None, e))
+        finally:
+            self._stream.close()
+
+    def cancel(self) -> None:
+        """接続を閉じて生成を打ち切る（読み取り待ちのスレッドもすぐに終わる）"""
+        self._cancel.cancel()
+
+    def record(self, ok: bool) -> None:
+        """ブレーカーに結果を記録する（1 回だけ）"""
+        if self.finished:
+            return
+        self.finished = True
+        if self.breaker is None:
+            return
+        if ok and self.breaker.slow_seconds is not None:
+            waited = (self.first_token_at or time.monotonic()) - self.started
+            ok = waited <= self.breaker.slow_seconds
+        self.breaker.record(ok)
+
+
+class ResilientClient:
+    """OllamaClient / OllamaRouter を包み、ブレーカーとヘッジを行う"""
+
+    def __init__(self, llm, client, affinity_key: str | None = None):
+        self.llm = llm
+        self.client = client
+        self.affinity_key = affinity_key
+
+    def _fallback(self):
+        from .llm_cache import get_client, get_llm
+        from .llm_clients import create_llm_client
+
+        fallback_id = (self.llm.extra or {}).get("fallback_llm")
+        if not fallback_id:
+            return None
+        try:
+            llm = get_llm(int(fallback_id))
+        except Exception:
+            logger.warning("fallback llm %s not found", fallback_id)
+            return None
+        breaker = get_breaker(llm)
+        if not llm.is_active or (breaker is not None and breaker.state == OPEN):
+            return None
+        # フォールバック先自身のヘッジ設定は使わない（連鎖させない）
+        return llm, get_client(llm, create_llm_client, self.affinity_key)
+
+    def chat(self, messages: list[dict], options: dict | None = None) -> ChatResult:
+        parts, usage, metadata = [], {}, {}
+        for chunk in self.stream_chat(messages, options):
+            parts.append(chunk.content)
+            if chunk.done:
+                usage, metadata = chunk.usage, chunk.metadata
+        return ChatResult(content="".join(parts), usage=usage, metadata=metadata)
+
+    def stream_chat(
+        self, messages: list[dict], options: dict | None = None
+    ) -> Iterator[ChatChunk]:
+        out: queue.Queue = queue.Queue()
+        runners: dict[str, _Runner] = {}
+        fallback = self._fallback()
+        reason = None
+
+        def start(name: str, llm, client) -> None:
+            runners[name] = _Runner(name, llm, client, messages, options, out)
+
+        primary_breaker = get_breaker(self.llm)
+        if primary_breaker is None or primary_breaker.allow():
+            start("primary", self.llm, self.client)
+        elif fallback is not None:
+            reason = "circuit_open"
+            start("fallback", *fallback)
+        else:
+            raise LLMBusyError(
+                f"LLM {self.llm.name} is unavailable (circuit open)",
+                503,
+                primary_breaker.retry_after(),
+            )
+
+        deadline = (self.llm.extra or {}).get("first_token_deadline")
+        hedge_at = time.monotonic() + float(deadline) if deadline else None
+        winner = None
+        first = None
+        try:
+            while winner is None:
+                timeout = None
+                if hedge_at is not None and fallback and "fallback" not in runners:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                try:
+                    name, chunk, error = out.get(timeout=timeout)
+                except queue.Empty:
+                    reason = "hedge"
+                    start("fallback", *fallback)
+                    continue
+                runner = runners[name]
+                if error is not None:
+                    runner.record(False)
+                    live = [r for r in runners.values() if not r.finished]
+                    if live:
+                        continue
+                    if name == "primary" and fallback and "fallback" not in runners:
+                        reason = "primary_failed"
+                        start("fallback", *fallback)
+                        continue
+                    raise error
+                runner.first_token_at = time.monotonic()
+                winner, first = runner, chunk
+
+            for other in runners.values():
+                if other is not winner:
+                    other.cancel()
+                    if other.name == "primary":
+                        # 最初のトークンがフォールバックより遅かった = SLO 違反
+                        other.record(False)
+            self._count(winner, reason)
+
+            chunk = first
+            while True:
+                if chunk.done:
+                    winner.record(True)
+                    chunk.metadata = {
+                        **chunk.metadata,
+                        "served_by": self._served_by(winner, reason),
+                    }
+                    yield chunk
+                    return
+                yield chunk
+                name, chunk, error = out.get()
+                while name != winner.name:
+                    name, chunk, error = out.get()
+                if error is not None:
+                    winner.record(False)
+                    raise error
+        finally:
+            for runner in runners.values():
+                runner.cancel()
+            if winner is not None:
+                # 途中でクライアントが切断した場合など（最初のトークンは届いている）
+                winner.record(True)
+
+    def _served_by(self, runner: _Runner, reason: str | None) -> dict:
+        return {
+            "role": runner.name,
+            "llm_id": runner.llm.pk,
+            "llm": runner.llm.name,
+            "model": runner.llm.model,
+            "reason": reason,
+            "first_token_ms": round((runner.first_token_at - runner.started) * 1000),
+        }
+
+    def _count(self, winner: _Runner, reason: str | None) -> None:
+        hedge_outcomes.inc(
+            llm=self.llm.name, served_by=winner.name, reason=reason or ""
+        )
+
+    def preload(self) -> None:
+        self.client.preload()
+
+    def embed(self, texts: list[str], model: str | None = None):
+        return self.client.embed(texts, model=model)
+
+
+def wrap(llm, client, affinity_key: str | None = None):
+    """ブレーカー / ヘッジの設定がある LLM なら ResilientClient で包む"""
+    extra = llm.extra or {}
+    if not any(extra.get(key) for key in SETTING_KEYS):
+        return client
+    return ResilientClient(llm, client, affinity_key)
@@ -0,0 +1,194 @@
+"""決定的なチャットリクエストの完全一致応答キャッシュ。
+
+``LLM.extra["response_cache_ttl"]``（秒）を設定した LLM で、実効 options の
+``temperature`` が 0 のリクエストだけを対象にする。キーは
+(LLM id, model, 正規化した messages, 実効 options) の sha256。
+
+- メモリ層: プロセス内 LRU（``RESPONSE_CACHE_MEMORY_SIZE`` 件、最長
+  ``MEMORY_TTL`` 秒）
+- DB 層: ``ResponseCacheEntry``（プロセス間で共有、TTL と LLM ごとの
+  ``response_cache_max_entries`` 件で最終利用が古いものから削除）
+
+DB 層の掃除（期限切れと上限超過の削除）は書き込みのたびではなく、プロセスごと・
+LLM ごとに ``RESPONSE_CACHE_PRUNE_INTERVAL`` 秒（既定 60）に 1 回だけ行う。
+そのため件数は間隔内の書き込み分だけ一時的に上限を超えうる。最終利用日時は
+DB 層のヒットで更新する（メモリ層のヒットは最長 ``MEMORY_TTL`` 秒遅れて反映）。
+
+無効化（管理画面のアクション）は DB 層とそのプロセスのメモリ層を消す。
+他プロセスのメモリ層は最長 ``MEMORY_TTL`` 秒で期限切れになる。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .llm_clients import ChatResult, llm_options
+from .metrics import registry
+from .models import ResponseCacheEntry
+
+MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "1024"))
+MEMORY_TTL = 60.0
+DEFAULT_MAX_ENTRIES = 10_000
+PRUNE_INTERVAL = float(os.getenv("RESPONSE_CACHE_PRUNE_INTERVAL", "60"))
+
+cache_requests = registry.counter(
+    "llm_response_cache_requests_total", "Response cache lookups by result"
+)
+
+
+class _MemoryCache:
+    def __init__(self, size: int):
+        self.size = size
+        self._items: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[2]
+
+    def put(self, key: str, llm_id: int, value, ttl: float) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + min(ttl, MEMORY_TTL), llm_id, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, llm_id: int) -> None:
+        with self._lock:
+            for key in [k for k, v in self._items.items() if v[1] == llm_id]:
+                del self._items[key]
+
+
+_memory = _MemoryCache(MEMORY_SIZE)
+# LLM id → 前回 DB 層を掃除した時刻（time.monotonic）
+_pruned_at: dict[int, float] = {}
+_prune_lock = threading.Lock()
+
+
+def _ttl(llm) -> float | None:
+    ttl = (llm.extra or {}).get("response_cache_ttl")
+    return float(ttl) if ttl else None
+
+
+def _normalize(messages: list[dict]) -> list[dict]:
+    return [
+        {
+            "role": m["role"],
+            "content": m["content"].replace("\r\n", "\n").strip(),
+        }
+        for m in messages
+    ]
+
+
+def cache_key(llm, messages: list[dict], options: dict | None = None) -> str | None:
+    """キャッシュ対象ならキーを返す（無効な LLM / 非決定的な options は None）"""
+    if _ttl(llm) is None:
+        return None
+    effective = {**llm_options(llm.extra), **(options or {})}
+    # Ollama の既定 temperature は 0 ではないため明示された場合のみ
+    if effective.get("temperature") != 0:
+        return None
+    raw = json.dumps(
+        {
+            "llm": llm.pk,
+            "model": llm.model,
+            "messages": _normalize(messages),
+            "options": effective,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _hit(key: str, tier: str, created_at: str) -> dict:
+    return {"cache": {"hit": True, "tier": tier, "key": key, "created_at": created_at}}
+
+
+def get(llm, key: str) -> ChatResult | None:
+    """キャッシュ済みの応答。usage にはヒット情報だけを入れる"""
+    labels = {"llm": llm.name}
+    value = _memory.get(key)
+    if value is not None:
+        cache_requests.inc(result="hit_memory", **labels)
+        content, created_at = value
+        return ChatResult(content=content, usage=_hit(key, "memory", created_at))
+
+    entry = ResponseCacheEntry.objects.filter(
+        key=key, llm=llm, expires_at__gt=timezone.now()
+    ).first()
+    if entry is None:
+        cache_requests.inc(result="miss", **labels)
+        return None
+    ResponseCacheEntry.objects.filter(key=key).update(
+        hits=F("hits") + 1, last_used_at=timezone.now()
+    )
+    created_at = entry.created_at.isoformat()
+    remaining = (entry.expires_at - timezone.now()).total_seconds()
+    _memory.put(key, llm.pk, (entry.content, created_at), remaining)
+    cache_requests.inc(result="hit_db", **labels)
+    return ChatResult(content=entry.content, usage=_hit(key, "db", created_at))
+
+
+def put(llm, key: str, result: ChatResult) -> None:
+    ttl = _ttl(llm)
+    if ttl is None:
+        return
+    now = timezone.now()
+    ResponseCacheEntry.objects.update_or_create(
+        key=key,
+        defaults={
+            "llm": llm,
+            "content": result.content,
+            "usage": result.usage,
+            "hits": 0,
+            "last_used_at": now,
+            "expires_at": now + timedelta(seconds=ttl),
+        },
+    )
+    _memory.put(key, llm.pk, (result.content, now.isoformat()), ttl)
+    if _prune_due(llm.pk):
+        _prune(llm)
+
+
+def _prune_due(llm_id: int) -> bool:
+    now = time.monotonic()
+    with _prune_lock:
+        last = _pruned_at.get(llm_id)
+        if last is not None and now - last < PRUNE_INTERVAL:
+            return False
+        _pruned_at[llm_id] = now
+        return True
+
+
+def _prune(llm) -> None:
+    """期限切れと、LLM ごとの上限件数を超えた最終利用の古いエントリを削除する"""
+    qs = ResponseCacheEntry.objects.filter(llm=llm)
+    qs.filter(expires_at__lte=timezone.now()).delete()
+    limit = int(
+        (llm.extra or {}).get("response_cache_max_entries", DEFAULT_MAX_ENTRIES)
+    )
+    stale = list(qs.order_by("-last_used_at").values_list("key", flat=True)[limit:])
+    if stale:
+        ResponseCacheEntry.objects.filter(key__in=stale).delete()
+
+
+def invalidate(llm) -> int:
+    """LLM のキャッシュを削除する。削除した DB エントリ数を返す"""
+    _memory.invalidate(llm.pk)
+    deleted, _ = ResponseCacheEntry.objects.filter(llm=llm).delete()
+    return deleted
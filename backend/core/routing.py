@@ -0,0 +1,251 @@
+"""1 つの LLM を複数の Ollama バックエンドに振り分けるルーター。
+
+``LLM.extra["backends"]`` に URL のリストを設定すると build_llm_client が
+OllamaRouter を返す。ルーターはリクエストごとに
+
+1. セッションを前回処理したバックエンド（無ければ rendezvous hash で決まる
+   バックエンド）を優先し、KV キャッシュを再利用させる
+2. ただしその in-flight 数が最小値 + ``AFFINITY_SLACK`` を超える場合は
+   in-flight 最小のバックエンドへ逃がす
+3. 接続エラー / 5xx のバックエンドは ``EJECT_SECONDS`` の間外し、期限後に
+   ``/api/tags`` のヘルスチェックが通れば戻す（チェックはリクエストを待たせない
+   よう別スレッドで行い、通るまでは外したまま）
+
+を行う。in-flight 数・アフィニティはプロセス内の状態。
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+
+import requests
+
+from .llm_clients import ChatChunk, ChatResult, OllamaClient, get_http_session
+from .metrics import registry
+
+AFFINITY_SLACK = 2
+MAX_FAILURES = 1
+EJECT_SECONDS = 30.0
+HEALTH_CHECK_TIMEOUT = (1.0, 2.0)
+AFFINITY_CACHE_SIZE = 10_000
+
+backend_in_flight = registry.gauge(
+    "llm_backend_in_flight", "In-flight requests per Ollama backend"
+)
+backend_healthy = registry.gauge(
+    "llm_backend_healthy", "1 if the Ollama backend is in rotation"
+)
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.probing = False
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now and not self.probing
+
+
+def _is_backend_failure(exc: Exception) -> bool:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return False
+
+
+class BackendPool:
+    """バックエンド群の状態（in-flight / 障害 / アフィニティ）。URL の組ごとに共有。"""
+
+    def __init__(self, urls: list[str]):
+        self.backends = [Backend(u) for u in urls]
+        self._lock = threading.Lock()
+        self._affinity: OrderedDict[str, str] = OrderedDict()
+
+    def _rendezvous(self, key: str) -> list[Backend]:
+        def score(b: Backend) -> bytes:
+            return hashlib.sha1(f"{key}|{b.url}".encode()).digest()
+
+        return sorted(self.backends, key=score, reverse=True)
+
+    def _probe_expired(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                b
+                for b in self.backends
+                if b.ejected_until and b.ejected_until <= now and not b.probing
+            ]
+            for b in due:
+                b.probing = True
+        for b in due:
+            threading.Thread(
+                target=self._probe, args=(b,), name="llm-backend-probe", daemon=True
+            ).start()
+
+    def _probe(self, backend: Backend) -> None:
+        healthy = False
+        try:
+            healthy = self.check_health(backend)
+        finally:
+            with self._lock:
+                backend.probing = False
+                if healthy:
+                    backend.failures = 0
+                    backend.ejected_until = 0.0
+                else:
+                    backend.ejected_until = time.monotonic() + EJECT_SECONDS
+            backend_healthy.set(1 if healthy else 0, backend=backend.url)
+
+    def check_health(self, backend: Backend) -> bool:
+        try:
+            r = get_http_session(backend.url).get(
+                backend.url + "/api/tags", timeout=HEALTH_CHECK_TIMEOUT
+            )
+            return r.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def acquire(self, affinity_key: str | None = None, exclude: tuple = ()) -> Backend:
+        self._probe_expired()
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                b for b in self.backends if b.available(now) and b not in exclude
+            ]
+            if not candidates:
+                # 全滅時は除外期限が最も早いものに賭ける
+                remaining = [b for b in self.backends if b not in exclude]
+                candidates = sorted(
+                    remaining or self.backends, key=lambda b: b.ejected_until
+                )[:1]
+            least = min(b.in_flight for b in candidates)
+            chosen = None
+            if affinity_key:
+                preferred = self._affinity.get(affinity_key)
+                order = self._rendezvous(affinity_key)
+                if preferred:
+                    order = sorted(order, key=lambda b: b.url != preferred)
+                for b in order:
+                    if b in candidates and b.in_flight <= least + AFFINITY_SLACK:
+                        chosen = b
+                        break
+            if chosen is None:
+                chosen = min(candidates, key=lambda b: b.in_flight)
+            chosen.in_flight += 1
+            if affinity_key:
+                self._affinity[affinity_key] = chosen.url
+                self._affinity.move_to_end(affinity_key)
+                while len(self._affinity) > AFFINITY_CACHE_SIZE:
+                    self._affinity.popitem(last=False)
+        backend_in_flight.set(chosen.in_flight, backend=chosen.url)
+        return chosen
+
+    def release(self, backend: Backend, error: Exception | None = None) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+            if error is not None and _is_backend_failure(error):
+                backend.failures += 1
+                if backend.failures >= MAX_FAILURES:
+                    backend.ejected_until = time.monotonic() + EJECT_SECONDS
+            elif error is None:
+                backend.failures = 0
+            healthy = backend.ejected_until <= time.monotonic()
+        backend_in_flight.set(backend.in_flight, backend=backend.url)
+        backend_healthy.set(1 if healthy else 0, backend=backend.url)
+
+
+_pools: dict[tuple, BackendPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_backend_pool(urls: list[str]) -> BackendPool:
+    key = tuple(u.rstrip("/") for u in urls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = BackendPool(list(key))
+            _pools[key] = pool
+        return pool
+
+
+class OllamaRouter:
+    """OllamaClient と同じインターフェースで複数バックエンドに振り分ける。"""
+
+    def __init__(
+        self,
+        pool: BackendPool,
+        model: str,
+        default_params: dict | None = None,
+        keep_alive: str | int | None = None,
+        affinity_key: str | None = None,
+    ):
+        self.pool = pool
+        self.model = model
+        self.default_params = default_params or {}
+        self.keep_alive = keep_alive
+        self.affinity_key = affinity_key
+
+    def _client(self, backend: Backend) -> OllamaClient:
+        return OllamaClient(
+            backend.url, self.model, self.default_params, keep_alive=self.keep_alive
+        )
+
+    def chat(
+        self,
+        messages: list[dict],
+        options: dict | None = None,
+    ) -> ChatResult:
+        tried: tuple = ()
+        while True:
+            backend = self.pool.acquire(self.affinity_key, exclude=tried)
+            try:
+                result = self._client(backend).chat(messages, options=options)
+            except Exception as e:
+                self.pool.release(backend, e)
+                tried += (backend,)
+                # バックエンド障害なら別のバックエンドで 1 度だけ再試行
+                if (
+                    not _is_backend_failure(e)
+                    or len(tried) > 1
+                    or len(self.pool.backends) < 2
+                ):
+                    raise
+                continue
+            self.pool.release(backend)
+            return result
+
+    def stream_chat(
+        self,
+        messages: list[dict],
+        options: dict | None = None,
+    ) -> Iterator[ChatChunk]:
+        backend = self.pool.acquire(self.affinity_key)
+        error = None
+        try:
+            yield from self._client(backend).stream_chat(messages, options=options)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.pool.release(backend, error)
+
+    def embed(self, texts: list[str], model: str | None = None) -> list[list[float]]:
+        backend = self.pool.acquire(self.affinity_key)
+        error = None
+        try:
+            return self._client(backend).embed(texts, model=model)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.pool.release(backend, error)
+
+    def preload(self) -> None:
+        for backend in self.pool.backends:
+            self._client(backend).preload()
@@ -0,0 +1,219 @@
+"""言い換えられた質問に対するセマンティックキャッシュ。
+
+``LLM.extra["semantic_cache_threshold"]``（例 0.92）を設定した LLM で、
+最初のターン（セッションに system 以外のメッセージが無い）の質問を
+Ollama の埋め込み (``embedding_model``) でベクトル化し、同じ LLM・同じ system
+プロンプト・同じ options の過去の質問とのコサイン類似度が閾値以上なら、その
+回答を生成せずに返す。完全一致キャッシュ (core/response_cache.py) の後段。
+
+インデックスは LLM ごとにプロセス内の NumPy 行列（正規化済みベクトル）で、
+検索は 1 回の行列ベクトル積。``semantic_cache_max_entries`` 件を上限に
+最も長く使われていないエントリから置き換えるため、メモリは
+上限 × 次元数 × 4 バイトで頭打ちになる。NumPy が無い環境では無効。
+"""
+
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - requirements.txt には含まれる
+    np = None
+
+from .embeddings import EmbeddingService
+from .llm_clients import ChatResult, build_llm_client, llm_options
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 2048
+INITIAL_ROWS = 64
+
+semantic_requests = registry.counter(
+    "llm_semantic_cache_requests_total", "Semantic cache lookups by result"
+)
+semantic_lookup = registry.histogram(
+    "llm_semantic_cache_lookup_seconds",
+    "Semantic cache lookup latency (embedding + search)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, math.inf),
+)
+semantic_entries = registry.gauge(
+    "llm_semantic_cache_entries", "Entries held in the semantic cache index"
+)
+
+
+class SemanticIndex:
+    """正規化済みベクトルの行列と回答。容量超過時は LRU で置き換える。
+
+    ``partitions`` には system プロンプト / options のハッシュを持ち、
+    検索は同じパーティションの行だけを対象にする。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.vectors = None
+        self.partitions = np.zeros(0, dtype=np.int64)
+        self.last_used = np.zeros(0, dtype=np.float64)
+        self.answers: list[str] = []
+        self._lock = threading.Lock()
+
+    def _grow(self, dim: int) -> None:
+        if self.vectors is None or self.vectors.shape[1] != dim:
+            # 埋め込みモデルが変わった場合は作り直す
+            rows = min(INITIAL_ROWS, self.capacity)
+            self.vectors = np.zeros((rows, dim), dtype=np.float32)
+            self.partitions = np.zeros(rows, dtype=np.int64)
+            self.last_used = np.zeros(rows, dtype=np.float64)
+            self.answers = [""] * rows
+            self.size = 0
+            return
+        rows = min(len(self.answers) * 2, self.capacity)
+        extra = rows - len(self.answers)
+        self.vectors = np.vstack(
+            [self.vectors, np.zeros((extra, dim), dtype=np.float32)]
+        )
+        self.partitions = np.concatenate(
+            [self.partitions, np.zeros(extra, dtype=np.int64)]
+        )
+        self.last_used = np.concatenate([self.last_used, np.zeros(extra)])
+        self.answers.extend([""] * extra)
+
+    def search(
+        self, vector, partition: int, threshold: float
+    ) -> tuple[str, float] | None:
+        """類似度が threshold 以上で最も近い回答と類似度"""
+        with self._lock:
+            if not self.size or self.vectors.shape[1] != vector.shape[0]:
+                return None
+            sims = self.vectors[: self.size] @ vector
+            sims[self.partitions[: self.size] != partition] = -np.inf
+            i = int(np.argmax(sims))
+            if sims[i] < threshold:
+                return None
+            self.last_used[i] = time.monotonic()
+            return self.answers[i], float(sims[i])
+
+    def add(self, vector, partition: int, answer: str) -> None:
+        with self._lock:
+            if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+                self._grow(vector.shape[0])
+            if self.size < len(self.answers):
+                i = self.size
+                self.size += 1
+            elif self.size < self.capacity:
+                self._grow(vector.shape[0])
+                i = self.size
+                self.size += 1
+            else:
+                i = int(np.argmin(self.last_used))
+            self.vectors[i] = vector
+            self.partitions[i] = partition
+            self.last_used[i] = time.monotonic()
+            self.answers[i] = answer
+
+
+@dataclass
+class SemanticProbe:
+    """lookup の結果。ミス時は生成後に store() で登録する"""
+
+    llm_name: str
+    index: SemanticIndex
+    partition: int
+    vector: object
+    result: ChatResult | None
+
+
+_indexes: dict[int, SemanticIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _threshold(llm) -> float | None:
+    value = (llm.extra or {}).get("semantic_cache_threshold")
+    return float(value) if value else None
+
+
+def _index(llm) -> SemanticIndex:
+    capacity = int(
+        (llm.extra or {}).get("semantic_cache_max_entries", DEFAULT_MAX_ENTRIES)
+    )
+    with _indexes_lock:
+        index = _indexes.get(llm.pk)
+        if index is None or index.capacity != capacity:
+            index = SemanticIndex(capacity)
+            _indexes[llm.pk] = index
+        return index
+
+
+def _partition(llm, messages: list[dict], options: dict | None) -> int:
+    raw = json.dumps(
+        {
+            "model": llm.model,
+            "system": [m["content"] for m in messages[:-1]],
+            "options": {**llm_options(llm.extra), **(options or {})},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    digest = hashlib.sha256(raw.encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def _is_first_turn(session) -> bool:
+    """セッションにまだ会話（system 以外のメッセージ）が無いか。
+
+    送る履歴は予算や要約で切り詰められるため、履歴ではなくセッションで判定する。
+    今回の user メッセージは参照時点ではまだ保存されていない。
+    """
+    if not session.message_count:
+        return True
+    return not session.messages.exclude(role="system").exists()
+
+
+def _embed(llm, text: str):
+    model = (llm.extra or {}).get("embedding_model") or llm.model
+    service = EmbeddingService(build_llm_client(llm), model, persist=False)
+    vector = service.embed([text])[0]
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else None
+
+
+def lookup(session, messages: list[dict], options: dict | None = None):
+    """対象外なら None、対象なら SemanticProbe（ヒット時は result 付き）"""
+    llm = session.llm
+    threshold = _threshold(llm)
+    if threshold is None or np is None or not _is_first_turn(session):
+        return None
+    labels = {"llm": llm.name}
+    started = time.perf_counter()
+    try:
+        vector = _embed(llm, messages[-1]["content"])
+    except Exception:
+        # キャッシュの失敗で生成は止めない
+        logger.warning("semantic cache embedding failed", exc_info=True)
+        semantic_requests.inc(result="error", **labels)
+        return None
+    if vector is None:
+        return None
+    index = _index(llm)
+    partition = _partition(llm, messages, options)
+    found = index.search(vector, partition, threshold)
+    semantic_lookup.observe(time.perf_counter() - started, **labels)
+
+    result = None
+    if found is not None:
+        answer, similarity = found
+        usage = {"cache": {"hit": True, "tier": "semantic", "similarity": similarity}}
+        result = ChatResult(content=answer, usage=usage)
+    semantic_requests.inc(result="hit" if result else "miss", **labels)
+    return SemanticProbe(llm.name, index, partition, vector, result)
+
+
+def store(probe: SemanticProbe, result: ChatResult) -> None:
+    probe.index.add(probe.vector, probe.partition, result.content)
+    semantic_entries.set(probe.index.size, llm=probe.llm_name)
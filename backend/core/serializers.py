@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import LLM, ChatSession, Message
+from .models import LLM, ChatJob, ChatSession, Message
 
 
 class LLMSerializer(serializers.ModelSerializer):
@@ -38,7 +38,46 @@ class ChatSessionCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ["uuid"]
 
 
+class ChatSessionSerializer(serializers.ModelSerializer):
+    """一覧 / 詳細用。llm_name のため ``select_related("llm")`` した queryset で使う"""
+
+    llm_name = serializers.CharField(source="llm.name", read_only=True)
+
+    class Meta:
+        model = ChatSession
+        fields = [
+            "uuid",
+            "llm",
+            "llm_name",
+            "title",
+            "message_count",
+            "last_activity_at",
+            "last_message_preview",
+            "prompt_tokens",
+            "completion_tokens",
+            "archived_at",
+            "created_at",
+        ]
+        read_only_fields = fields
+
+
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = ["id", "role", "content", "created_at"]
+        fields = ["id", "role", "content", "status", "created_at"]
+
+
+class ChatJobSerializer(serializers.ModelSerializer):
+    session_uuid = serializers.UUIDField(source="session_id", read_only=True)
+
+    class Meta:
+        model = ChatJob
+        fields = [
+            "uuid",
+            "session_uuid",
+            "status",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
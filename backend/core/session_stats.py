@@ -0,0 +1,96 @@
+"""ChatSession の一覧表示用の集計値（件数・最終活動・プレビュー・トークン数）。
+
+Message が作成されるたびに ``post_save`` シグナルで ``F()`` による 1 回の
+UPDATE を行う。呼び出し側が ``transaction.atomic()`` の中で Message を作れば
+挿入と集計の更新は同時にコミット / ロールバックされる。同じセッションへの
+同時書き込みでも加算は DB 側で行うため取りこぼさない（行ロックで直列化）。
+
+``completed_message_count`` は完了した user / assistant の件数（要約の対象）。
+pending で作って ``update()`` で完了にするメッセージはシグナルが飛ばないため、
+完了にした側が ``completed()`` を呼ぶ。
+
+``bulk_create`` や生 SQL での挿入はシグナルが飛ばないため、その後に
+``refresh()`` で計算し直す。
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import ChatSession, Message
+
+PREVIEW_LENGTH = 100
+
+
+def _tokens(usage: dict | None) -> tuple[int, int]:
+    usage = usage or {}
+    return usage.get("prompt_eval_count") or 0, usage.get("eval_count") or 0
+
+
+def _summarizable(message: Message) -> bool:
+    return message.status == "completed" and message.role != "system"
+
+
+def _cached_session(message: Message) -> ChatSession | None:
+    return Message._meta.get_field("session").get_cached_value(message, None)
+
+
+def completed(message: Message) -> None:
+    """pending だったメッセージを完了にしたときに件数へ加える"""
+    if message.role == "system":
+        return
+    ChatSession.objects.filter(pk=message.session_id).update(
+        completed_message_count=F("completed_message_count") + 1
+    )
+    session = _cached_session(message)
+    if session is not None:
+        session.completed_message_count += 1
+
+
+@receiver(post_save, sender=Message)
+def _message_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    prompt, completion = _tokens(instance.usage)
+    done = int(_summarizable(instance))
+    ChatSession.objects.filter(pk=instance.session_id).update(
+        message_count=F("message_count") + 1,
+        completed_message_count=F("completed_message_count") + done,
+        last_activity_at=instance.created_at,
+        last_message_preview=instance.content[:PREVIEW_LENGTH],
+        prompt_tokens=F("prompt_tokens") + prompt,
+        completion_tokens=F("completion_tokens") + completion,
+    )
+    # 作成に使ったセッションのインスタンスにも反映する（チャット中の
+    # needs_compaction などが読み直さずに件数を使えるように）
+    session = _cached_session(instance)
+    if session is not None:
+        session.message_count += 1
+        session.completed_message_count += done
+        session.last_activity_at = instance.created_at
+        session.last_message_preview = instance.content[:PREVIEW_LENGTH]
+        session.prompt_tokens += prompt
+        session.completion_tokens += completion
+
+
+def refresh(session: ChatSession) -> None:
+    """メッセージから集計値を計算し直す"""
+    count = done = prompt = completion = 0
+    last = None
+    for m in session.messages.order_by("created_at", "id").only(
+        "role", "status", "content", "usage", "created_at"
+    ):
+        count += 1
+        done += _summarizable(m)
+        p, c = _tokens(m.usage)
+        prompt += p
+        completion += c
+        last = m
+    ChatSession.objects.filter(pk=session.pk).update(
+        message_count=count,
+        completed_message_count=done,
+        last_activity_at=last.created_at if last else session.created_at,
+        last_message_preview=last.content[:PREVIEW_LENGTH] if last else "",
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+    )
@@ -0,0 +1,147 @@
+"""長いセッションのローリング要約（コンパクション）。
+
+未要約のメッセージが ``LLM.extra["summary_trigger_messages"]`` 件を超えると、
+直近 ``summary_keep_messages`` 件を残して古いメッセージをセッションの LLM で
+要約し ``ChatSession.metadata["summary"]`` に保存する。要約は前回の要約と
+その後のメッセージだけから作る増分方式で、リクエスト処理とは別スレッドで動く。
+
+履歴選択 (core/history.py) は要約を system メッセージとして先頭に置き、
+ウォーターマーク (``until_id``) より後のメッセージだけを送る。
+"""
+
+import logging
+import threading
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .llm_clients import build_llm_client
+from .models import ChatSession
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUMMARY_KEEP_MESSAGES = 6
+
+SUMMARY_PROMPT = (
+    "あなたは会話の要約係です。以下の「これまでの要約」と「新しい会話」を統合し、"
+    "後続の回答に必要な事実・前提・ユーザーの目的・未解決の質問を漏らさず、"
+    "簡潔な日本語の箇条書きで要約してください。"
+)
+
+_running: set = set()
+_running_lock = threading.Lock()
+
+
+def get_summary(session) -> dict | None:
+    return (session.metadata or {}).get("summary")
+
+
+def summary_message(summary: dict) -> dict:
+    return {"role": "system", "content": "これまでの会話の要約:\n" + summary["content"]}
+
+
+def _settings(llm) -> tuple[int | None, int]:
+    extra = llm.extra or {}
+    trigger = extra.get("summary_trigger_messages")
+    keep = extra.get("summary_keep_messages", DEFAULT_SUMMARY_KEEP_MESSAGES)
+    return (int(trigger) if trigger else None), int(keep)
+
+
+def _unsummarized(session):
+    qs = session.messages.filter(status="completed").exclude(role="system")
+    summary = get_summary(session)
+    if summary:
+        qs = qs.filter(id__gt=summary["until_id"])
+    return qs
+
+
+def needs_compaction(session) -> bool:
+    """未要約のメッセージが閾値を超えていそうか（クエリなし）。
+
+    完了した user / assistant の件数 ``completed_message_count``
+    （core/session_stats.py）から要約済みの件数を引いた値で判定する。
+    compact_session が要約に使うメッセージと同じ条件で数えている。
+    """
+    trigger, keep = _settings(session.llm)
+    if trigger is None:
+        return False
+    summarized = (get_summary(session) or {}).get("message_count", 0)
+    return session.completed_message_count - summarized > trigger + keep
+
+
+def compact_session(session_uuid) -> bool:
+    """要約を 1 回進める。保存した場合 True。
+
+    LLM 呼び出しはトランザクション外で行い、保存時にセッション行をロックして
+    ウォーターマークが他の要約処理に進められていないことを確認する。
+    """
+    session = ChatSession.objects.select_related("llm").get(uuid=session_uuid)
+    trigger, keep = _settings(session.llm)
+    if trigger is None:
+        return False
+    previous = get_summary(session)
+
+    pending = list(_unsummarized(session).order_by("created_at", "id"))
+    to_summarize = pending[: len(pending) - keep] if keep else pending
+    if len(pending) <= trigger + keep or not to_summarize:
+        return False
+
+    conversation = "\n".join(f"{m.role}: {m.content}" for m in to_summarize)
+    prompt = (
+        "これまでの要約:\n"
+        + (previous["content"] if previous else "(なし)")
+        + "\n\n新しい会話:\n"
+        + conversation
+    )
+    client = build_llm_client(session.llm, affinity_key=str(session.uuid))
+    result = client.chat(
+        [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+    )
+
+    last = to_summarize[-1]
+    with transaction.atomic():
+        locked = ChatSession.objects.select_for_update().get(pk=session.pk)
+        current = get_summary(locked)
+        if (current or {}).get("until_id") != (previous or {}).get("until_id"):
+            return False  # 他の要約処理が先に進めた
+        locked.metadata = {
+            **locked.metadata,
+            "summary": {
+                "content": result.content,
+                "until_id": last.id,
+                "message_count": (previous or {}).get("message_count", 0)
+                + len(to_summarize),
+                "updated_at": timezone.now().isoformat(),
+            },
+        }
+        ChatSession.objects.filter(pk=session.pk).update(metadata=locked.metadata)
+    return True
+
+
+def _run_in_background(session_uuid) -> None:
+    try:
+        compact_session(session_uuid)
+    except Exception:
+        logger.exception("session compaction failed: %s", session_uuid)
+    finally:
+        with _running_lock:
+            _running.discard(session_uuid)
+        # スレッド専用の DB 接続を閉じる
+        connections.close_all()
+
+
+def schedule_compaction(session) -> bool:
+    """必要ならバックグラウンドで要約を開始する（同一セッションの多重起動はしない）"""
+    if not needs_compaction(session):
+        return False
+    with _running_lock:
+        if session.uuid in _running:
+            return False
+        _running.add(session.uuid)
+    threading.Thread(
+        target=_run_in_background, args=(session.uuid,), daemon=True
+    ).start()
+    return True
@@ -0,0 +1,204 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+
+from core.admission import (
+    LLMBusyError,
+    LocalLimiter,
+    PostgresLimiter,
+    _LockConnection,
+    acquire_slot,
+    get_limiter,
+)
+from core.llm_clients import ChatChunk, ChatResult
+from core.metrics import registry
+from core.models import LLM, ChatSession, Message
+
+
+def fake_client(*args, **kwargs):
+    class Dummy:
+        def chat(self_inner, messages, options=None):
+            return ChatResult(content="ok", usage={})
+
+    return Dummy()
+
+
+def fake_stream_client(*args, **kwargs):
+    class Dummy:
+        def stream_chat(self_inner, messages, options=None):
+            yield ChatChunk(content="ok", done=True, usage={})
+
+    return Dummy()
+
+
+class LocalLimiterTests(SimpleTestCase):
+    def test_queue_full_is_rejected_with_429(self):
+        limiter = LocalLimiter("Local", 1, 1, 5.0)
+        first = limiter.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(limiter.acquire()))
+        waiter.start()
+        while limiter._queued == 0:
+            pass
+
+        with self.assertRaises(LLMBusyError) as ctx:
+            limiter.acquire()
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+
+        # スロットが空けば待っていたリクエストが受け付けられる
+        first.release()
+        waiter.join(timeout=5)
+        self.assertEqual(len(acquired), 1)
+        acquired[0].release()
+        self.assertEqual(limiter._slots_used, 0)
+
+    def test_queue_timeout_is_rejected_with_503(self):
+        limiter = LocalLimiter("Local", 1, 1, 0.05)
+        slot = limiter.acquire()
+        with self.assertRaises(LLMBusyError) as ctx:
+            limiter.acquire()
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(limiter._queued, 0)
+        slot.release()
+
+    def test_release_is_idempotent(self):
+        limiter = LocalLimiter("Local", 1, 0, 1.0)
+        slot = limiter.acquire()
+        slot.release()
+        slot.release()
+        self.assertEqual(limiter._slots_used, 0)
+
+
+class FakeAdvisoryLocks:
+    """PostgreSQL のセッションレベル advisory lock の代わり（接続をまたいで共有）"""
+
+    def __init__(self):
+        self.owners: dict[tuple, object] = {}
+        self.queries = 0
+
+    def connection(self):
+        server = self
+
+        class Conn(_LockConnection):
+            def _query(self_inner, sql, params):
+                server.queries += 1
+                key = tuple(params)
+                owner = server.owners.get(key)
+                if "unlock" in sql:
+                    return server.owners.pop(key, None) is self_inner
+                # 同じ接続からは何度でも取れる（再入可能）
+                if owner is None or owner is self_inner:
+                    server.owners[key] = self_inner
+                    return True
+                return False
+
+        return Conn()
+
+
+class PostgresLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.locks = FakeAdvisoryLocks()
+        self.process = self.locks.connection()
+        patcher = patch("core.admission._lock_connection", self.process)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_threads_share_one_connection_without_reentering_locks(self):
+        limiter = PostgresLimiter(1, "Pg", 2, 0, 0.05)
+        first = limiter.acquire()
+        second = limiter.acquire()
+        self.assertNotEqual(first.handle, second.handle)
+        # 同じ接続でもロック済みのキーは取り直さない
+        with self.assertRaises(LLMBusyError) as ctx:
+            limiter.acquire()
+        self.assertEqual(ctx.exception.status_code, 429)
+        first.release()
+        second.release()
+        self.assertEqual(self.locks.owners, {})
+
+    def test_slots_are_shared_with_other_processes(self):
+        other = self.locks.connection()
+        with patch("core.admission._lock_connection", other):
+            held = PostgresLimiter(1, "Pg", 1, 1, 0.05).acquire()
+        with self.assertRaises(LLMBusyError) as ctx:
+            PostgresLimiter(1, "Pg", 1, 1, 0.05).acquire()
+        self.assertEqual(ctx.exception.status_code, 503)
+        with patch("core.admission._lock_connection", other):
+            held.release()
+
+    def test_local_release_wakes_waiter_and_polling_backs_off(self):
+        limiter = PostgresLimiter(1, "Pg", 1, 1, 30.0)
+        slot = limiter.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(limiter.acquire()))
+        waiter.start()
+        while limiter._waiting == 0:
+            pass
+        time.sleep(1.5)
+        # 0.1 秒間隔のままなら 15 回以上試している
+        self.assertLess(self.locks.queries, 12)
+        started = time.monotonic()
+        slot.release()
+        waiter.join(timeout=5)
+        self.assertLess(time.monotonic() - started, 0.5)
+        acquired[0].release()
+        self.assertEqual(self.locks.owners, {})
+
+
+@patch("core.admission._limiters", {})
+class AdmissionEndpointTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(
+            name="Busy",
+            provider="OLLAMA",
+            model="llama3",
+            extra={"max_concurrency": 1, "max_queue": 0},
+        )
+        self.session = ChatSession.objects.create(llm=self.llm, title="Test")
+        self.url = f"/api/sessions/{self.session.uuid}/chat/"
+
+    def test_saturated_llm_returns_429_with_retry_after(self):
+        slot = acquire_slot(self.llm)
+        try:
+            with patch("core.usecases.build_llm_client", fake_client):
+                res = self.client.post(
+                    self.url, {"message": "Hi"}, content_type="application/json"
+                )
+                stream = self.client.post(
+                    self.url + "stream/",
+                    {"message": "Hi"},
+                    content_type="application/json",
+                )
+        finally:
+            slot.release()
+
+        self.assertEqual(res.status_code, 429)
+        self.assertIn("Retry-After", res)
+        self.assertEqual(stream.status_code, 429)
+        # 受け付けなかったターンは保存しない
+        self.assertFalse(Message.objects.filter(session=self.session).exists())
+        self.assertIn(
+            'llm_admission_rejected_total{llm="Busy",reason="queue_full"}',
+            registry.render(),
+        )
+
+    def test_slot_is_released_after_chat(self):
+        with patch("core.usecases.build_llm_client", fake_client):
+            for _ in range(2):
+                res = self.client.post(
+                    self.url, {"message": "Hi"}, content_type="application/json"
+                )
+                self.assertEqual(res.status_code, 200)
+        with patch("core.usecases.build_llm_client", fake_stream_client):
+            res = self.client.post(
+                self.url + "stream/", {"message": "Hi"}, content_type="application/json"
+            )
+            b"".join(res.streaming_content)
+        self.assertEqual(get_limiter(self.llm)._slots_used, 0)
+
+    def test_unlimited_by_default(self):
+        llm = LLM.objects.create(name="Free", provider="OLLAMA", model="llama3")
+        self.assertIsNone(get_limiter(llm))
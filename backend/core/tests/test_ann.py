@@ -0,0 +1,135 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from core import ann
+from core.rag import VectorStore, normalize
+
+
+def clustered(rng, rows, dim=16, clusters=20):
+    centers = normalize(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(clusters, size=rows)
+    return normalize(centers[labels] + 0.1 * rng.standard_normal((rows, dim)))
+
+
+class TopKTests(SimpleTestCase):
+    def test_returns_sorted_top_k_with_ids(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+        self.assertEqual([i for i, _ in ann.top_k(scores, 2)], [1, 3])
+        ids = np.array([10, 11, 12, 13])
+        self.assertEqual([i for i, _ in ann.top_k(scores, 3, ids)], [11, 13, 12])
+        self.assertEqual(ann.top_k(scores[:0], 3), [])
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = VectorStore("lecture", tmp.name)
+        self.rng = np.random.default_rng(0)
+
+    def test_recall_against_exact_search(self):
+        self.store.append(clustered(self.rng, 2000), "emb")
+        matrix = self.store.matrix()
+        index = ann.IVFIndex.build(self.store.index_base, matrix, nlist=20)
+
+        hits = 0
+        for q in matrix[:50]:
+            exact = {i for i, _ in ann.top_k(matrix @ q, 5)}
+            approx = {i for i, _ in index.search(q, 5, nprobe=4)}
+            hits += len(exact & approx)
+        self.assertGreaterEqual(hits / 250, 0.9)
+
+    def test_appended_rows_are_searchable_before_and_after_merge(self):
+        self.store.append(clustered(self.rng, 500), "emb")
+        self.assertEqual(self.store.update_index(nlist=10, rebuild=True), "built")
+
+        new = normalize(self.rng.standard_normal((1, 16)))
+        self.store.append(new, "emb")
+        # インデックス作成後の末尾行は全件検索される
+        self.assertEqual(self.store.search(new[0], 1)[0][0], 500)
+
+        self.assertEqual(self.store.update_index(), "merged")
+        index = self.store.index()
+        self.assertEqual(index.rows, 501)
+        self.assertEqual(index.search(new[0], 1, nprobe=10)[0][0], 500)
+
+    def test_tombstoned_rows_are_skipped_and_dropped_on_merge(self):
+        self.store.append(clustered(self.rng, 500), "emb")
+        self.store.update_index(nlist=10, rebuild=True)
+        query = self.store.matrix()[0]
+        nearest = [row for row, _ in self.store.search(query, 20, nprobe=10)]
+
+        self.store.tombstone(nearest[:10])
+        # インデックスに残っていても検索結果からは除き、k 件を返す
+        hits = [row for row, _ in self.store.search(query, 5, nprobe=10)]
+        self.assertEqual(hits, nearest[10:15])
+
+        self.assertEqual(self.store.update_index(), "merged")
+        index = self.store.index()
+        self.assertEqual(index.rows, 500)
+        self.assertEqual(len(index.order), 490)
+        self.assertFalse(set(index.order.tolist()) & set(nearest[:10]))
+        self.assertEqual(self.store.update_index(), "unchanged")
+        hits = [row for row, _ in index.search(query, 5, nprobe=10)]
+        self.assertEqual(hits, nearest[10:15])
+
+    def test_persisted_index_is_reloaded(self):
+        self.store.append(clustered(self.rng, 300), "emb")
+        self.store.update_index(nlist=8, rebuild=True)
+        other = VectorStore("lecture", self.store.directory)
+        self.assertIsNotNone(other.index())
+        self.assertEqual(len(other.index().centroids), 8)
+
+    def test_rewrite_switches_generation_after_both_files(self):
+        self.store.append(clustered(self.rng, 500), "emb")
+        self.store.update_index(nlist=10, rebuild=True)
+        reader = self.store.index()
+        self.store.append(normalize(self.rng.standard_normal((5, 16))), "emb")
+
+        written = []
+        real_replace = os.replace
+
+        def replace(src, dst):
+            # ポインタの切り替え時点で新しい世代の 2 ファイルは揃っている
+            written.extend(os.path.exists(p) for p in ann.IVFIndex.paths(base, 1))
+            real_replace(src, dst)
+
+        base = self.store.index_base
+        with patch("core.ann.os.replace", replace):
+            self.store.update_index()
+        self.assertEqual(written, [True, True])
+
+        index = self.store.index()
+        self.assertEqual((index.generation, index.rows), (1, 505))
+        self.assertFalse(os.path.exists(ann.IVFIndex.paths(base, 0)[0]))
+        # 旧世代を開いていたプロセスはそのまま読める
+        self.assertEqual(reader.rows, 500)
+        self.assertEqual(len(reader.search(reader.vectors[0], 1, nprobe=10)), 1)
+
+    def test_load_retries_when_generation_changes_underneath(self):
+        self.store.append(clustered(self.rng, 300), "emb")
+        self.store.update_index(nlist=8, rebuild=True)
+        base = self.store.index_base
+        generations = iter([7, 0])
+        with patch.object(
+            ann.IVFIndex, "_generation", side_effect=lambda b: next(generations)
+        ):
+            # 世代 7 のファイルは無い（消えた）ので読み直して世代 0 を開く
+            index = ann.IVFIndex.load(base)
+        self.assertEqual(index.generation, 0)
+
+    def test_reset_removes_all_generations(self):
+        self.store.append(clustered(self.rng, 300), "emb")
+        self.store.update_index(nlist=8, rebuild=True)
+        self.store.update_index(rebuild=True)
+        self.store.reset()
+        self.assertEqual(os.listdir(self.store.directory), [])
+
+    def test_small_collection_uses_exact_search(self):
+        self.store.append(clustered(self.rng, 100), "emb")
+        self.assertEqual(self.store.update_index(), "unchanged")
+        self.assertIsNone(self.store.index())
@@ -0,0 +1,131 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core import archive
+from core.llm_clients import ChatResult
+from core.models import LLM, ChatSession, Message, MessageArchive
+from core.usecases import ChatInSessionUsecase
+
+
+def fake_client(*args, **kwargs):
+    class Dummy:
+        def chat(self_inner, messages, options=None):
+            fake_client.last_messages = messages
+            return ChatResult(content="ok", usage={})
+
+    return Dummy()
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        self.session = ChatSession.objects.create(llm=self.llm, title="Old")
+        self.msgs = [
+            Message.objects.create(
+                session=self.session,
+                role="user" if i % 2 == 0 else "assistant",
+                content=f"m{i} 改行\n",
+                usage={"eval_count": i},
+            )
+            for i in range(6)
+        ]
+        self.url = f"/api/sessions/{self.session.uuid}/messages/"
+
+    def test_archive_moves_messages_and_read_through_matches(self):
+        before = self.client.get(self.url).json()
+        archive.archive_session(self.session)
+
+        self.assertFalse(Message.objects.filter(session=self.session).exists())
+        stored = MessageArchive.objects.get(session=self.session)
+        self.assertEqual(stored.message_count, 6)
+        self.assertLess(len(stored.data), stored.raw_bytes)
+        self.assertEqual(self.client.get(self.url).json(), before)
+
+    def test_paginated_read_through(self):
+        archive.archive_session(self.session)
+        res = self.client.get(self.url, {"limit": 4}).json()
+        self.assertEqual(
+            [m["content"][:2] for m in res["results"]], ["m2", "m3", "m4", "m5"]
+        )
+        self.assertTrue(res["has_more"])
+        res = self.client.get(self.url, {"before": res["before"]}).json()
+        self.assertEqual([m["content"][:2] for m in res["results"]], ["m0", "m1"])
+        self.assertFalse(res["has_more"])
+        res = self.client.get(self.url, {"after": res["after"], "limit": 1}).json()
+        self.assertEqual([m["content"][:2] for m in res["results"]], ["m2"])
+
+    def test_pending_turn_is_not_archived(self):
+        Message.objects.create(
+            session=self.session, role="user", content="x", status="pending"
+        )
+        self.assertIsNone(archive.archive_session(self.session))
+        self.assertEqual(Message.objects.filter(session=self.session).count(), 7)
+
+    @patch("core.usecases.build_llm_client", fake_client)
+    def test_chat_restores_with_original_ids_and_timestamps(self):
+        archive.archive_session(self.session)
+        ChatInSessionUsecase(self.session.uuid).run("next")
+
+        restored = list(Message.objects.filter(session=self.session)[:6])
+        self.assertEqual([m.pk for m in restored], [m.pk for m in self.msgs])
+        self.assertEqual(
+            [m.created_at for m in restored], [m.created_at for m in self.msgs]
+        )
+        self.assertEqual(restored[1].usage, {"eval_count": 1})
+        self.assertEqual(len(fake_client.last_messages), 7)
+        self.session.refresh_from_db()
+        self.assertIsNone(self.session.archived_at)
+        self.assertEqual(self.session.message_count, 8)
+        self.assertFalse(MessageArchive.objects.exists())
+
+
+class ArchiveCommandTests(TestCase):
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", model="llama3")
+        self.old = ChatSession.objects.create(llm=llm, title="old")
+        self.closed = ChatSession.objects.create(
+            llm=llm, title="closed", is_active=False
+        )
+        self.recent = ChatSession.objects.create(llm=llm, title="recent")
+        for s in (self.old, self.closed, self.recent):
+            Message.objects.create(session=s, role="user", content="hi")
+        ChatSession.objects.filter(pk=self.old.pk).update(
+            last_activity_at=timezone.now() - timedelta(days=400)
+        )
+
+    def _call(self, *args):
+        out = StringIO()
+        call_command("archive_sessions", *args, stdout=out)
+        return out.getvalue()
+
+    def _archived(self):
+        return set(
+            ChatSession.objects.filter(archived_at__isnull=False).values_list(
+                "title", flat=True
+            )
+        )
+
+    def test_archives_old_and_inactive_sessions_in_batches(self):
+        self.assertIn("2 sessions would be archived", self._call("--dry-run"))
+        self.assertEqual(self._archived(), set())
+        out = self._call("--batch-size", "1")
+        self.assertIn("archived 2 sessions, 2 messages", out)
+        self.assertEqual(self._archived(), {"old", "closed"})
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_inactive_only_and_limit(self):
+        self._call("--inactive-only")
+        self.assertEqual(self._archived(), {"closed"})
+        self._call("--limit", "1", "--older-than", "0")
+        self.assertEqual(self._archived(), {"closed", "old"})
+
+    def test_restore(self):
+        self._call()
+        self._call("--restore", str(self.old.uuid))
+        self.assertEqual(self._archived(), {"closed"})
+        self.assertEqual(Message.objects.filter(session=self.old).count(), 1)
@@ -0,0 +1,240 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import include, path
+
+from core.admission import acquire_slot
+from core.llm_clients import (
+    AsyncOllamaClient,
+    ChatChunk,
+    ChatResult,
+    ThreadedAsyncClient,
+    build_async_llm_client,
+    close_http_sessions,
+)
+from core.models import LLM, ChatJob, ChatSession, Message
+from core.response_cache import _MemoryCache
+from core.views import chat_async, chat_stream_async
+
+# ASYNC_CHAT=true の core/urls.py と同じく /chat/ を async ビューで処理する URLconf
+urlpatterns = [
+    path("api/sessions/<uuid:pk>/chat/", chat_async),
+    path("api/sessions/<uuid:pk>/chat/stream/", chat_stream_async),
+    path("api/", include("core.urls")),
+]
+
+
+def fake_async_client(content="Hello async", error=None):
+    def factory(*args, **kwargs):  # noqa: D401 - simple factory
+        class Dummy:
+            async def chat(self_inner, messages, options=None):  # noqa: D401
+                if error is not None:
+                    raise error
+                return ChatResult(content=content, usage={"eval_count": 3})
+
+        return Dummy()
+
+    return factory
+
+
+class SyncClient:
+    def chat(self, messages, options=None):
+        return ChatResult(content="s", usage={})
+
+    def stream_chat(self, messages, options=None):
+        yield ChatChunk("s")
+        yield ChatChunk("", done=True)
+
+
+class AsyncOllamaClientTests(TestCase):
+    def tearDown(self):
+        close_http_sessions()
+
+    async def test_chat_and_stream_over_httpx(self):
+        def handler(request):
+            body = json.loads(request.content)
+            if body["stream"]:
+                lines = [
+                    {"message": {"content": "He"}, "done": False},
+                    {"message": {"content": "y"}, "done": False},
+                    {"message": {"content": ""}, "done": True, "eval_count": 2},
+                ]
+                text = "\n".join(json.dumps(x) for x in lines)
+                return httpx.Response(200, text=text)
+            return httpx.Response(
+                200, json={"message": {"content": "Hey"}, "eval_count": 2}
+            )
+
+        client = AsyncOllamaClient("http://ollama:11434", "llama3")
+        mock_http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(AsyncOllamaClient, "http", mock_http):
+            result = await client.chat([{"role": "user", "content": "Hi"}])
+            chunks = [
+                c async for c in client.stream_chat([{"role": "user", "content": "Hi"}])
+            ]
+
+        self.assertEqual(result.content, "Hey")
+        self.assertEqual(result.usage["eval_count"], 2)
+        self.assertEqual([c.content for c in chunks], ["He", "y", ""])
+        self.assertTrue(chunks[-1].done)
+
+
+class AsyncChatViewTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(
+            name="Local",
+            provider="OLLAMA",
+            model="llama3",
+        )
+        self.session = ChatSession.objects.create(llm=self.llm, title="Test")
+        self.factory = AsyncRequestFactory()
+
+    def _request(self, body):
+        return self.factory.post(
+            f"/api/sessions/{self.session.uuid}/chat/",
+            data=json.dumps(body),
+            content_type="application/json",
+        )
+
+    async def test_chat_async_persists_messages(self):
+        with patch("core.usecases.build_async_llm_client", fake_async_client()):
+            res = await chat_async(self._request({"message": "Hi"}), self.session.uuid)
+
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.content)
+        self.assertEqual(data["assistant_message"]["content"], "Hello async")
+        roles = await sync_to_async(
+            lambda: [
+                (m.role, m.status) for m in Message.objects.filter(session=self.session)
+            ]
+        )()
+        self.assertEqual(roles, [("user", "completed"), ("assistant", "completed")])
+
+    async def test_chat_async_failure_marks_turn_failed(self):
+        factory = fake_async_client(error=RuntimeError("down"))
+        with patch("core.usecases.build_async_llm_client", factory):
+            with self.assertRaises(RuntimeError):
+                await chat_async(self._request({"message": "Hi"}), self.session.uuid)
+
+        user = await Message.objects.aget(session=self.session)
+        self.assertEqual(user.status, "failed")
+
+    async def test_chat_async_uses_response_cache(self):
+        self.llm.extra = {"response_cache_ttl": 600, "temperature": 0}
+        await self.llm.asave()
+        session = await ChatSession.objects.acreate(llm=self.llm, title="Cached")
+        with (
+            patch("core.response_cache._memory", _MemoryCache(16)),
+            patch("core.usecases.build_async_llm_client", fake_async_client()),
+        ):
+            await chat_async(self._request({"message": "Hi"}), self.session.uuid)
+            with patch("core.usecases.build_async_llm_client") as build:
+                res = await chat_async(self._request({"message": "Hi"}), session.uuid)
+
+        build.assert_not_called()
+        data = json.loads(res.content)
+        self.assertEqual(data["assistant_message"]["content"], "Hello async")
+        self.assertEqual(data["usage"]["cache"]["tier"], "memory")
+
+    async def test_routed_and_resilient_llms_use_the_sync_client(self):
+        self.assertIsInstance(build_async_llm_client(self.llm), AsyncOllamaClient)
+        for extra in (
+            {"backends": ["http://ollama-1:11434"]},
+            {"first_token_deadline": 3},
+        ):
+            llm = LLM(name="Routed", model="llama3", extra=extra)
+            with patch("core.llm_clients.build_llm_client", return_value=SyncClient()):
+                client = build_async_llm_client(llm, affinity_key="a")
+                result = await client.chat([{"role": "user", "content": "Hi"}])
+                chunks = [c async for c in client.stream_chat([])]
+            self.assertIsInstance(client, ThreadedAsyncClient)
+            self.assertEqual(result.content, "s")
+            self.assertEqual([c.done for c in chunks], [False, True])
+
+    async def test_chat_async_validation(self):
+        res = await chat_async(self._request({"message": " "}), self.session.uuid)
+        self.assertEqual(res.status_code, 400)
+
+
+@override_settings(ROOT_URLCONF="core.tests.test_async_chat")
+class AsyncChatRouteTests(TestCase):
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        self.session = ChatSession.objects.create(llm=llm, title="Test")
+        self.url = f"/api/sessions/{self.session.uuid}/chat/"
+
+    async def test_background_request_is_queued_not_generated(self):
+        with patch("core.usecases.build_async_llm_client") as build:
+            res = await self.async_client.post(
+                self.url,
+                {"message": "Hi", "background": True},
+                content_type="application/json",
+            )
+        self.assertEqual(res.status_code, 202)
+        build.assert_not_called()
+        job = await ChatJob.objects.aget()
+        self.assertEqual(res.json()["uuid"], str(job.uuid))
+        self.assertEqual(job.status, "queued")
+        self.assertFalse(await Message.objects.filter(session=self.session).aexists())
+
+    async def test_background_for_unknown_session_is_404(self):
+        await ChatSession.objects.filter(pk=self.session.pk).aupdate(is_active=False)
+        res = await self.async_client.post(
+            self.url,
+            {"message": "Hi", "background": True},
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, 404)
+
+    async def test_stream_sends_first_delta_before_generation_finishes(self):
+        release = asyncio.Event()
+
+        class Streaming:
+            async def stream_chat(self, messages, options=None):
+                yield ChatChunk("He")
+                # テストが最初の delta を受け取るまで生成を止めておく
+                await release.wait()
+                yield ChatChunk("y", done=True, usage={"eval_count": 2})
+
+        with patch(
+            "core.usecases.build_async_llm_client", lambda *a, **kw: Streaming()
+        ):
+            res = await self.async_client.post(
+                self.url + "stream/", {"message": "Hi"}, content_type="application/json"
+            )
+            self.assertTrue(res.is_async)
+            chunks = aiter(res.streaming_content)
+            first = await asyncio.wait_for(anext(chunks), timeout=5)
+            self.assertIn(b"event: delta", first)
+            release.set()
+            rest = b"".join([c async for c in chunks])
+
+        self.assertIn(b"event: done", rest)
+        roles = await sync_to_async(
+            lambda: [(m.role, m.content, m.status) for m in self.session.messages.all()]
+        )()
+        self.assertEqual(
+            roles, [("user", "Hi", "completed"), ("assistant", "Hey", "completed")]
+        )
+
+    async def test_stream_saturated_llm_returns_429_before_sse(self):
+        llm = await LLM.objects.acreate(
+            name="Busy", model="llama3", extra={"max_concurrency": 1, "max_queue": 0}
+        )
+        session = await ChatSession.objects.acreate(llm=llm, title="Busy")
+        with patch("core.admission._limiters", {}):
+            slot = await sync_to_async(acquire_slot)(llm)
+            try:
+                res = await self.async_client.post(
+                    f"/api/sessions/{session.uuid}/chat/stream/",
+                    {"message": "Hi"},
+                    content_type="application/json",
+                )
+            finally:
+                await sync_to_async(slot.release)()
+        self.assertEqual(res.status_code, 429)
+        self.assertIn("Retry-After", res)
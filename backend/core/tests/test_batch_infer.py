@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from core.llm_clients import ChatResult
+from core.models import LLM
+
+
+class FakeClient:
+    def __init__(self, name: str, fail: set | None = None):
+        self.name = name
+        self.fail = fail or set()
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def chat(self, messages, options=None):
+        with self._lock:
+            self.calls.append((messages, options))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.01)
+            text = messages[-1]["content"]
+            if text in self.fail:
+                raise RuntimeError("boom")
+            return ChatResult(content=f"{self.name}:{text}", usage={"eval_count": 2})
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class BatchInferTests(TestCase):
+    def setUp(self):
+        self.a = LLM.objects.create(name="A", model="a")
+        self.b = LLM.objects.create(name="B", model="b")
+        self.clients = {"A": FakeClient("A", fail={"q3"}), "B": FakeClient("B")}
+        factory = patch(
+            "core.management.commands.batch_infer.build_llm_client",
+            lambda llm: self.clients[llm.name],
+        )
+        factory.start()
+        self.addCleanup(factory.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.input = os.path.join(tmp.name, "prompts.jsonl")
+        self.output = os.path.join(tmp.name, "out.jsonl")
+        with open(self.input, "w", encoding="utf-8") as f:
+            for i in range(6):
+                f.write(json.dumps({"id": f"q{i}", "prompt": f"q{i}"}) + "\n")
+
+    def _call(self, *args):
+        out = StringIO()
+        call_command(
+            "batch_infer",
+            self.input,
+            "--output",
+            self.output,
+            *args,
+            stdout=out,
+            stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def _rows(self):
+        with open(self.output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def test_fans_out_to_each_llm_and_reports(self):
+        out = self._call("--llm", "A", "--llm", str(self.b.pk), "--concurrency", "3")
+        rows = self._rows()
+        self.assertEqual(len(rows), 12)
+        by_key = {(r["id"], r["llm"]): r for r in rows}
+        self.assertEqual(by_key[("q0", "B")]["content"], "B:q0")
+        self.assertEqual(by_key[("q3", "A")]["error"], "boom")
+        self.assertIn("latency_ms", by_key[("q0", "A")])
+        self.assertLessEqual(self.clients["A"].max_active, 3)
+        self.assertIn("A: 5 ok, 1 failed", out)
+        self.assertIn("p95", out)
+
+    def test_resume_skips_done_and_retries_failed(self):
+        self._call("--llm", "A", "--limit", "4")
+        self.assertEqual(len(self._rows()), 4)
+        # 中断で途中まで書かれた行
+        with open(self.output, "a", encoding="utf-8") as f:
+            f.write('{"id": "q4", "llm')
+
+        out = self._call("--llm", "A")
+        self.assertIn("2 requests to run (4 already done)", out)
+        self.clients["A"].fail = set()
+        out = self._call("--llm", "A", "--retry-failed")
+        self.assertIn("1 requests to run", out)
+        with open(self.output, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 8)  # 4 + 途中の行 + 2 + 再実行 1
+        self.assertEqual(len(self.clients["A"].calls), 7)
+
+    def test_messages_system_and_options(self):
+        with open(self.input, "w", encoding="utf-8") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "id": 1,
+                        "system": "S",
+                        "messages": [{"role": "user", "content": "hi"}],
+                        "options": {"temperature": 0},
+                    }
+                )
+                + "\n"
+            )
+        self._call("--llm", "B", "--options", '{"temperature": 1, "num_predict": 8}')
+        messages, options = self.clients["B"].calls[0]
+        self.assertEqual([m["role"] for m in messages], ["system", "user"])
+        self.assertEqual(options, {"temperature": 0, "num_predict": 8})
+
+    def test_invalid_input(self):
+        with self.assertRaises(CommandError):
+            self._call("--llm", "missing")
+        with open(self.input, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "q0", "prompt": "dup"}) + "\n")
+        with self.assertRaises(CommandError):
+            self._call("--llm", "A")
@@ -0,0 +1,86 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from core.jobs import claim_next_job, process_job
+from core.llm_clients import ChatResult
+from core.models import LLM, ChatJob, ChatSession, Message
+
+
+def fake_client(content="Hello from job", error=None):
+    def factory(*args, **kwargs):  # noqa: D401 - simple factory
+        class Dummy:
+            def chat(self_inner, messages, options=None):  # noqa: D401
+                if error is not None:
+                    raise error
+                return ChatResult(content=content, usage={"eval_count": 1})
+
+        return Dummy()
+
+    return factory
+
+
+class ChatJobApiTests(TestCase):
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        self.session = ChatSession.objects.create(llm=llm, title="Test")
+
+    def test_background_chat_enqueues_and_polls_result(self):
+        res = self.client.post(
+            f"/api/sessions/{self.session.uuid}/chat/",
+            {"message": "Hi", "background": True},
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, 202)
+        job_id = res.json()["uuid"]
+        self.assertEqual(res.json()["status"], "queued")
+        self.assertFalse(Message.objects.exists())
+
+        res = self.client.get(f"/api/jobs/{job_id}/result/")
+        self.assertEqual(res.status_code, 202)
+
+        with patch("core.usecases.build_llm_client", fake_client()):
+            process_job(claim_next_job())
+
+        res = self.client.get(f"/api/jobs/{job_id}/")
+        self.assertEqual(res.json()["status"], "completed")
+        res = self.client.get(f"/api/jobs/{job_id}/result/")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["assistant_message"]["content"], "Hello from job")
+
+    def test_failed_job_reports_error(self):
+        job = ChatJob.objects.create(session=self.session, message="Hi")
+        with (
+            patch("core.usecases.build_llm_client", fake_client(error=OSError("x"))),
+            self.assertLogs("core.jobs", "ERROR"),
+        ):
+            process_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        res = self.client.get(f"/api/jobs/{job.uuid}/result/")
+        self.assertEqual(res.status_code, 502)
+
+    def test_claim_skips_non_queued_jobs(self):
+        ChatJob.objects.create(session=self.session, message="a", status="running")
+        queued = ChatJob.objects.create(session=self.session, message="b")
+        self.assertEqual(claim_next_job().uuid, queued.uuid)
+        self.assertIsNone(claim_next_job())
+
+
+class RunChatWorkerCommandTests(TransactionTestCase):
+    def test_worker_pool_drains_queue(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        session = ChatSession.objects.create(llm=llm, title="Test")
+        for i in range(3):
+            ChatJob.objects.create(session=session, message=f"q{i}")
+
+        out = StringIO()
+        with patch("core.usecases.build_llm_client", fake_client()):
+            call_command("run_chat_worker", "--workers", "1", "--once", stdout=out)
+
+        self.assertIn("processed=3", out.getvalue())
+        self.assertEqual(ChatJob.objects.filter(status="completed").count(), 3)
+        self.assertEqual(Message.objects.filter(role="assistant").count(), 3)
@@ -0,0 +1,129 @@
+import json
+from unittest.mock import patch, MagicMock
+
+from django.test import TestCase
+
+from core.models import LLM, ChatSession, Message
+from core.llm_clients import ChatChunk, OllamaClient
+
+
+def fake_stream_client(chunks, error=None):
+    def factory(*args, **kwargs):  # noqa: D401 - simple factory
+        class Dummy:
+            def stream_chat(self_inner, messages, options=None):  # noqa: D401
+                yield from chunks
+                if error is not None:
+                    raise error
+
+        return Dummy()
+
+    return factory
+
+
+def parse_sse(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class OllamaStreamChatTests(TestCase):
+    def test_stream_chat_parses_ndjson(self):
+        lines = [
+            b'{"message": {"content": "Hel"}, "done": false}',
+            b"",
+            b'{"message": {"content": "lo"}, "done": false}',
+            b'{"message": {"content": ""}, "done": true, "eval_count": 2,'
+            b' "prompt_eval_count": 5, "prompt_eval_duration": 100,'
+            b' "eval_duration": 500000000}',
+        ]
+        resp = MagicMock()
+        resp.iter_lines.return_value = iter(lines)
+        resp.__enter__.return_value = resp
+
+        client = OllamaClient("http://ollama:11434", "llama3")
+        with patch.object(client.http, "post", return_value=resp) as post:
+            chunks = list(client.stream_chat([{"role": "user", "content": "Hi"}]))
+
+        self.assertTrue(post.call_args.kwargs["json"]["stream"])
+        self.assertEqual([c.content for c in chunks], ["Hel", "lo", ""])
+        self.assertTrue(chunks[-1].done)
+        usage = chunks[-1].usage
+        self.assertEqual(usage["eval_count"], 2)
+        self.assertEqual(usage["prompt_eval_count"], 5)
+        self.assertEqual(usage["tokens_per_second"], 4.0)
+        # stream 時の TTFT は最初のチャンク受信までの実測値
+        self.assertIn("time_to_first_token_ms", usage)
+
+
+class ChatStreamEndpointTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(
+            name="Local",
+            provider="OLLAMA",
+            model="llama3",
+        )
+        self.session = ChatSession.objects.create(llm=self.llm, title="Test")
+        self.url = f"/api/sessions/{self.session.uuid}/chat/stream/"
+
+    def test_stream_relays_chunks_and_persists_assistant(self):
+        chunks = [
+            ChatChunk(content="Hello"),
+            ChatChunk(content=" world"),
+            ChatChunk(content="", done=True, usage={"eval_count": 2}),
+        ]
+        with patch("core.usecases.build_llm_client", fake_stream_client(chunks)):
+            res = self.client.post(
+                self.url, {"message": "Hi"}, content_type="application/json"
+            )
+            self.assertEqual(res["Content-Type"], "text/event-stream")
+            body = b"".join(res.streaming_content).decode()
+
+        events = parse_sse(body)
+        self.assertEqual([e for e, _ in events], ["delta", "delta", "done"])
+        done = events[-1][1]
+        self.assertEqual(done["assistant_message"]["content"], "Hello world")
+        self.assertEqual(done["usage"], {"eval_count": 2})
+
+        msgs = list(Message.objects.filter(session=self.session))
+        self.assertEqual([m.role for m in msgs], ["user", "assistant"])
+        self.assertEqual(msgs[-1].content, "Hello world")
+        self.assertEqual(msgs[-1].usage, {"eval_count": 2})
+
+    def test_client_disconnect_persists_partial_answer(self):
+        chunks = [ChatChunk(content="Hel"), ChatChunk(content="lo")]
+        with patch("core.usecases.build_llm_client", fake_stream_client(chunks)):
+            res = self.client.post(
+                self.url, {"message": "Hi"}, content_type="application/json"
+            )
+            stream = iter(res.streaming_content)
+            next(stream)
+            res.close()
+
+        assistant = Message.objects.get(session=self.session, role="assistant")
+        self.assertEqual(assistant.content, "Hel")
+        self.assertEqual(assistant.status, "aborted")
+        user = Message.objects.get(session=self.session, role="user")
+        self.assertEqual(user.status, "aborted")
+
+    def test_llm_error_emits_error_event(self):
+        chunks = [ChatChunk(content="partial")]
+        factory = fake_stream_client(chunks, error=RuntimeError("boom"))
+        with patch("core.usecases.build_llm_client", factory):
+            res = self.client.post(
+                self.url, {"message": "Hi"}, content_type="application/json"
+            )
+            body = b"".join(res.streaming_content).decode()
+
+        events = parse_sse(body)
+        self.assertEqual(events[-1], ("error", {"detail": "boom"}))
+        assistant = Message.objects.get(session=self.session, role="assistant")
+        self.assertEqual(assistant.status, "failed")
+        self.assertEqual(assistant.metadata, {"error": "boom"})
+
+    def test_empty_message_is_rejected(self):
+        res = self.client.post(
+            self.url, {"message": ""}, content_type="application/json"
+        )
+        self.assertEqual(res.status_code, 400)
@@ -1,6 +1,9 @@
+import time
+from contextlib import contextmanager
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
 
 from core.models import LLM, ChatSession, Message
 from core.usecases import ChatInSessionUsecase
@@ -39,3 +42,92 @@ class ChatUsecaseTests(TestCase):
         self.assertEqual(len(msgs), 2)  # user + assistant
         self.assertEqual(msgs[-1].role, "assistant")
         self.assertEqual(msgs[-1].content, "Hello from mock")
+        self.assertEqual([m.status for m in msgs], ["completed", "completed"])
+
+    def test_failed_generation_marks_user_message_failed(self):
+        def failing_client(*args, **kwargs):  # noqa: D401 - simple factory
+            class Dummy:
+                def chat(self_inner, messages, options=None):  # noqa: D401
+                    raise RuntimeError("ollama down")
+
+            return Dummy()
+
+        with patch("core.usecases.build_llm_client", failing_client):
+            uc = ChatInSessionUsecase(self.session.uuid)
+            with self.assertRaises(RuntimeError):
+                uc.run("Hi")
+
+        user = Message.objects.get(session=self.session)
+        self.assertEqual(user.status, "failed")
+        self.assertEqual(user.metadata, {"error": "ollama down"})
+
+    def test_history_excludes_unfinished_turns(self):
+        Message.objects.create(
+            session=self.session, role="user", content="lost", status="failed"
+        )
+        Message.objects.create(
+            session=self.session, role="user", content="stale", status="pending"
+        )
+        sent = []
+
+        def fake_client(*args, **kwargs):  # noqa: D401 - simple factory
+            class Dummy:
+                def chat(self_inner, messages, options=None):  # noqa: D401
+                    sent.extend(messages)
+                    return ChatResult(content="ok", usage={})
+
+            return Dummy()
+
+        with patch("core.usecases.build_llm_client", fake_client):
+            ChatInSessionUsecase(self.session.uuid).run("Hi")
+
+        self.assertEqual(sent, [{"role": "user", "content": "Hi"}])
+
+
+class ChatUsecaseTransactionTests(TransactionTestCase):
+    """LLM 生成中に DB トランザクションを保持しないことの確認（簡易負荷試験）"""
+
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        self.session = ChatSession.objects.create(llm=llm, title="Test")
+
+    def _run_turns(self, latency: float, turns: int = 5) -> list[float]:
+        held: list[float] = []
+        in_atomic_during_chat: list[bool] = []
+        real_atomic = transaction.atomic
+
+        @contextmanager
+        def timed_atomic(*args, **kwargs):
+            start = time.perf_counter()
+            with real_atomic(*args, **kwargs):
+                yield
+            held.append(time.perf_counter() - start)
+
+        def slow_client(*args, **kwargs):  # noqa: D401 - simple factory
+            class Dummy:
+                def chat(self_inner, messages, options=None):  # noqa: D401
+                    in_atomic_during_chat.append(connection.in_atomic_block)
+                    time.sleep(latency)
+                    return ChatResult(content="ok", usage={})
+
+            return Dummy()
+
+        with (
+            patch("core.usecases.build_llm_client", slow_client),
+            patch("core.usecases.transaction.atomic", timed_atomic),
+        ):
+            for i in range(turns):
+                ChatInSessionUsecase(self.session.uuid).run(f"turn {i}")
+
+        self.assertEqual(in_atomic_during_chat, [False] * turns)
+        return held
+
+    def test_transaction_hold_time_does_not_scale_with_latency(self):
+        fast = self._run_turns(latency=0.0)
+        slow = self._run_turns(latency=0.2)
+
+        # user 挿入と assistant 確定で 1 ターン 2 回
+        self.assertEqual(len(slow), 10)
+        # 生成に 200ms かかってもトランザクション保持時間は増えない
+        self.assertLess(max(slow), 0.1)
+        self.assertLess(max(slow), max(fast) + 0.05)
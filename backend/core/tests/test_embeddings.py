@@ -0,0 +1,178 @@
+import json as _json
+import tempfile
+import threading
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+import requests
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core import embeddings
+from core.embeddings import AdaptiveBatchSize, EmbeddingService
+from core.llm_clients import OllamaClient
+from core.models import EmbeddingCacheEntry
+
+
+class FakeClient:
+    """本文の長さをベクトルにする埋め込み。呼び出しを記録する"""
+
+    def __init__(self, fail_over: int | None = None):
+        self.calls: list[list[str]] = []
+        self.fail_over = fail_over
+        self._lock = threading.Lock()
+
+    def embed(self, texts, model=None):
+        with self._lock:
+            self.calls.append(list(texts))
+        if self.fail_over is not None and len(texts) > self.fail_over:
+            raise requests.ReadTimeout("too large")
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+class FakeOllamaHTTP:
+    """OllamaClient の HTTP セッションの代わり。大きいバッチは 500 を返す"""
+
+    def __init__(self, fail_over: int):
+        self.fail_over = fail_over
+        self.urls: list[str] = []
+
+    def post(self, url, json=None, timeout=None):
+        self.urls.append(url)
+        r = requests.Response()
+        r.url = url
+        if len(json["input"]) > self.fail_over:
+            r.status_code = 500
+            r._content = b'{"error": "batch too large"}'
+        else:
+            r.status_code = 200
+            r._content = _json.dumps(
+                {"embeddings": [[float(len(t)), 1.0] for t in json["input"]]}
+            ).encode()
+        return r
+
+
+class AdaptiveBatchSizeTests(SimpleTestCase):
+    def test_grows_when_fast_and_shrinks_when_slow(self):
+        size = AdaptiveBatchSize(8, maximum=32, target_seconds=1.0)
+        size.record(8, 0.1)
+        self.assertEqual(size.value, 16)
+        size.record(3, 0.1)  # 端数のバッチでは増やさない
+        self.assertEqual(size.value, 16)
+        size.record(16, 5.0)
+        self.assertEqual(size.value, 8)
+        for _ in range(5):
+            size.record(size.value, 0.1)
+        self.assertEqual(size.value, 32)
+
+
+class EmbeddingServiceTests(TestCase):
+    def setUp(self):
+        memory = patch("core.embeddings._memory", embeddings._MemoryCache(100))
+        memory.start()
+        self.addCleanup(memory.stop)
+
+    def test_deduplicates_and_caches_in_db(self):
+        client = FakeClient()
+        vectors = EmbeddingService(client, "emb").embed(["a", "bb", "a"])
+        self.assertEqual(vectors.tolist(), [[1, 1], [2, 1], [1, 1]])
+        self.assertEqual(client.calls, [["a", "bb"]])
+        self.assertEqual(EmbeddingCacheEntry.objects.count(), 2)
+
+        # 別プロセス相当（メモリ層が空）でも DB から読む
+        embeddings._memory._items.clear()
+        other = FakeClient()
+        vectors = EmbeddingService(other, "emb").embed(["bb", "ccc"])
+        self.assertEqual(vectors.tolist(), [[2, 1], [3, 1]])
+        self.assertEqual(other.calls, [["ccc"]])
+
+    def test_cache_is_per_model(self):
+        client = FakeClient()
+        EmbeddingService(client, "emb").embed(["a"])
+        EmbeddingService(client, "other").embed(["a"])
+        self.assertEqual(len(client.calls), 2)
+
+    def test_without_persist_uses_memory_only(self):
+        client = FakeClient()
+        service = EmbeddingService(client, "emb", persist=False)
+        service.embed(["q"])
+        service.embed(["q"])
+        self.assertEqual(len(client.calls), 1)
+        self.assertFalse(EmbeddingCacheEntry.objects.exists())
+
+    def test_parallel_batches_keep_input_order(self):
+        client = FakeClient()
+        texts = ["x" * n for n in range(1, 21)]
+        service = EmbeddingService(client, "emb", batch_size=3, workers=3)
+        vectors = service.embed(texts)
+        self.assertEqual(vectors[:, 0].tolist(), list(range(1, 21)))
+        self.assertGreater(len(client.calls), 1)
+
+    def test_splits_batches_that_time_out(self):
+        client = FakeClient(fail_over=2)
+        service = EmbeddingService(client, "emb", batch_size=8, workers=1)
+        vectors = service.embed(["a", "bb", "ccc", "dddd", "eeeee"])
+        self.assertEqual(vectors[:, 0].tolist(), [1, 2, 3, 4, 5])
+        self.assertLess(service.batch_size.value, 8)
+
+    def test_splits_on_http_errors_from_ollama_client(self):
+        http = FakeOllamaHTTP(fail_over=2)
+        with patch("core.llm_clients.get_http_session", return_value=http):
+            client = OllamaClient(None, "emb")
+            service = EmbeddingService(client, "emb", batch_size=8, workers=1)
+            vectors = service.embed(["a", "bb", "ccc", "dddd", "eeeee"])
+        self.assertEqual(vectors[:, 0].tolist(), [1, 2, 3, 4, 5])
+        self.assertGreater(len(http.urls), 1)
+
+    def test_ollama_embed_url_ignores_trailing_slash(self):
+        http = FakeOllamaHTTP(fail_over=10)
+        with patch("core.llm_clients.get_http_session", return_value=http):
+            OllamaClient("http://ollama:11434/", "emb").embed(["a"])
+        self.assertEqual(http.urls, ["http://ollama:11434/api/embed"])
+
+    def test_single_text_failure_is_raised(self):
+        service = EmbeddingService(FakeClient(fail_over=0), "emb")
+        with self.assertRaises(requests.ReadTimeout):
+            service.embed(["a"])
+
+    def test_embed_iter_streams_windows(self):
+        client = FakeClient()
+        texts = ("x" * n for n in range(1, 8))
+        windows = list(EmbeddingService(client, "emb").embed_iter(texts, window=3))
+        self.assertEqual([len(w) for w in windows], [3, 3, 1])
+        self.assertEqual(windows[2][0, 0], 7)
+
+
+class IngestCacheTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.docs = Path(tmp.name) / "docs"
+        self.docs.mkdir()
+        (self.docs / "a.md").write_text("docker run")
+        (self.docs / "b.md").write_text("git commit")
+        settings = override_settings(RAG_INDEX_DIR=str(Path(tmp.name) / "index"))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        memory = patch("core.embeddings._memory", embeddings._MemoryCache(100))
+        memory.start()
+        self.addCleanup(memory.stop)
+        self.client = FakeClient()
+        client = patch(
+            "core.management.commands.ingest_documents.OllamaClient",
+            lambda *args, **kwargs: self.client,
+        )
+        client.start()
+        self.addCleanup(client.stop)
+
+    def test_rebuild_reuses_cached_embeddings(self):
+        call_command("ingest_documents", str(self.docs), stdout=StringIO())
+        self.assertEqual(len(self.client.calls), 2)  # ファイルごと
+
+        embeddings._memory._items.clear()
+        (self.docs / "c.md").write_text("python -m venv")
+        call_command(
+            "ingest_documents", str(self.docs), rebuild=True, stdout=StringIO()
+        )
+        self.assertEqual(self.client.calls[2:], [["python -m venv"]])
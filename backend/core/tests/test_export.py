@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core import archive, export
+from core.models import LLM, ChatSession, Message
+
+
+class ExportTests(TestCase):
+    url = "/api/exports/messages/"
+
+    def setUp(self):
+        self.llm_a = LLM.objects.create(name="A", model="a")
+        self.llm_b = LLM.objects.create(name="B", model="b")
+        self.s1 = ChatSession.objects.create(llm=self.llm_a, title="s1")
+        self.s2 = ChatSession.objects.create(llm=self.llm_b, title="s2")
+        for s in (self.s1, self.s2):
+            for i in range(3):
+                Message.objects.create(session=s, role="user", content=f"{s.title}-{i}")
+        old = timezone.now() - timedelta(days=10)
+        Message.objects.filter(content="s1-0").update(created_at=old)
+
+    def _ndjson(self, res):
+        body = b"".join(res.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_ndjson_streams_all_messages_grouped_by_session(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("attachment", res["Content-Disposition"])
+        rows = self._ndjson(res)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(set(rows[0]), set(export.FIELDS))
+        by_session = [r["session_uuid"] for r in rows]
+        self.assertEqual(by_session, sorted(by_session))
+
+    def test_filters(self):
+        rows = self._ndjson(self.client.get(self.url, {"llm": self.llm_b.pk}))
+        self.assertEqual({r["llm"] for r in rows}, {"B"})
+        rows = self._ndjson(self.client.get(self.url, {"session": str(self.s1.uuid)}))
+        self.assertEqual([r["content"] for r in rows], ["s1-0", "s1-1", "s1-2"])
+        today = timezone.localdate().isoformat()
+        rows = self._ndjson(self.client.get(self.url, {"since": today}))
+        self.assertEqual(len(rows), 5)
+        before = (timezone.localdate() - timedelta(days=1)).isoformat()
+        rows = self._ndjson(self.client.get(self.url, {"until": before}))
+        self.assertEqual([r["content"] for r in rows], ["s1-0"])
+
+    def test_csv(self):
+        Message.objects.create(session=self.s2, role="assistant", content='a,"b"\nc')
+        res = self.client.get(self.url, {"format": "csv", "llm": self.llm_b.pk})
+        self.assertTrue(res["Content-Type"].startswith("text/csv"))
+        body = b"".join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(body, newline="")))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1]["content"], 'a,"b"\nc')
+
+    def test_archived_sessions_are_included(self):
+        archive.archive_session(self.s1)
+        rows = self._ndjson(self.client.get(self.url))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1]["content"], "s1-2")
+
+    def test_query_count_does_not_grow_with_messages(self):
+        with self.assertNumQueries(2):  # メッセージ + アーカイブ済みセッション
+            self._ndjson(self.client.get(self.url))
+
+    async def test_asgi_response_is_streamed_block_by_block(self):
+        # ASGI で同期イテレータを返すと Django が list にまとめてから送る
+        with patch("core.export.LINES_PER_WRITE", 2):
+            res = await self.async_client.get(self.url)
+            self.assertTrue(res.is_async)
+            blocks = [block async for block in res.streaming_content]
+        self.assertEqual(len(blocks), 3)
+        rows = [json.loads(line) for line in b"".join(blocks).decode().splitlines()]
+        self.assertEqual(len(rows), 6)
+
+    def test_invalid_parameters(self):
+        for params in (
+            {"format": "xml"},
+            {"llm": "x"},
+            {"session": "x"},
+            {"since": "x"},
+        ):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.csv")
+            call_command(
+                "export_chats",
+                "--format=csv",
+                f"--session={self.s2.uuid}",
+                f"--output={path}",
+                stderr=io.StringIO(),
+            )
+            with open(path, encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual([r["content"] for r in rows], ["s2-0", "s2-1", "s2-2"])
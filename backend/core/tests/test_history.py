@@ -0,0 +1,78 @@
+from django.test import TestCase
+
+from core.history import (
+    DEFAULT_HISTORY_TOKEN_BUDGET,
+    TokenBudgetHistorySelector,
+    estimate_tokens,
+    history_token_budget,
+)
+from core.llm_clients import build_llm_client
+from core.models import LLM, ChatSession, Message
+
+
+class HistoryBudgetTests(TestCase):
+    def test_budget_from_extra(self):
+        llm = LLM(model="llama3", extra={"history_token_budget": 1000})
+        self.assertEqual(history_token_budget(llm), 1000)
+        llm = LLM(model="llama3", extra={"num_ctx": 8192, "num_predict": 256})
+        self.assertEqual(history_token_budget(llm), 8192 - 256)
+        llm = LLM(model="llama3", extra={})
+        self.assertEqual(history_token_budget(llm), DEFAULT_HISTORY_TOKEN_BUDGET)
+
+    def test_budget_key_is_not_sent_as_ollama_option(self):
+        llm = LLM(
+            model="llama3", extra={"history_token_budget": 1000, "temperature": 0}
+        )
+        self.assertEqual(build_llm_client(llm).default_params, {"temperature": 0})
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens("こんにちは"), 5)
+
+
+class TokenBudgetHistorySelectorTests(TestCase):
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        self.session = ChatSession.objects.create(llm=llm, title="Test")
+
+    def _add(self, role, content, status="completed"):
+        return Message.objects.create(
+            session=self.session, role=role, content=content, status=status
+        )
+
+    def test_keeps_system_pinned_and_selects_recent_turns(self):
+        system = self._add("system", "You are a tutor.")  # 4 + 4 tokens
+        for i in range(10):
+            self._add("user", "q" * 40)  # 10 + 4 tokens
+            self._add("assistant", "a" * 40)
+        current = self._add("user", "now", status="pending")  # 1 + 4 tokens
+
+        selected = TokenBudgetHistorySelector(budget=8 + 5 + 14 * 3).select(
+            self.session, current
+        )
+
+        self.assertEqual(selected[0], system)
+        self.assertEqual(selected[-1], current)
+        self.assertEqual(
+            [m.role for m in selected[1:-1]], ["assistant", "user", "assistant"]
+        )
+
+    def test_current_message_always_included(self):
+        self._add("user", "old")
+        current = self._add("user", "x" * 400, status="pending")
+        selected = TokenBudgetHistorySelector(budget=10).select(self.session, current)
+        self.assertEqual(selected, [current])
+
+    def test_fetches_bounded_batches(self):
+        for _ in range(120):
+            self._add("user", "q")
+        current = self._add("user", "now", status="pending")
+        selector = TokenBudgetHistorySelector(budget=10_000)
+        # system 1 回 + 50 件ずつ 3 バッチ
+        with self.assertNumQueries(4):
+            selected = selector.select(self.session, current)
+        self.assertEqual(len(selected), 121)
+
+        # 予算が小さければ最初のバッチだけで終わる
+        with self.assertNumQueries(2):
+            TokenBudgetHistorySelector(budget=50).select(self.session, current)
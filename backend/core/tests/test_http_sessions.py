@@ -0,0 +1,37 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from core import llm_clients
+from core.llm_clients import OllamaClient, close_http_sessions, get_http_session
+
+
+class HttpSessionRegistryTests(SimpleTestCase):
+    def tearDown(self):
+        close_http_sessions()
+
+    def test_same_base_url_shares_session(self):
+        a = get_http_session("http://ollama:11434")
+        b = get_http_session("http://ollama:11434/")
+        self.assertIs(a, b)
+        self.assertIsNot(a, get_http_session("http://other:11434"))
+
+    def test_adapter_uses_configured_pool_size(self):
+        session = get_http_session("http://ollama:11434")
+        adapter = session.get_adapter("http://ollama:11434/api/chat")
+        self.assertEqual(adapter._pool_maxsize, llm_clients.HTTP_POOL_SIZE)
+
+    def test_clients_reuse_session_and_split_timeouts(self):
+        first = OllamaClient("http://ollama:11434", "llama3")
+        second = OllamaClient("http://ollama:11434", "llama3")
+        self.assertIs(first.http, second.http)
+
+        resp = MagicMock()
+        resp.json.return_value = {"message": {"content": "ok"}, "eval_count": 1}
+        with patch.object(first.http, "post", return_value=resp) as post:
+            first.chat([{"role": "user", "content": "Hi"}])
+
+        self.assertEqual(
+            post.call_args.kwargs["timeout"],
+            (llm_clients.HTTP_CONNECT_TIMEOUT, llm_clients.HTTP_READ_TIMEOUT),
+        )
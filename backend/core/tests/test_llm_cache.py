@@ -0,0 +1,92 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from core import llm_cache
+from core.llm_clients import (
+    AsyncOllamaClient,
+    ChatResult,
+    build_async_llm_client,
+    build_llm_client,
+)
+from core.models import LLM, ChatSession
+from core.usecases import ChatInSessionUsecase
+
+
+def fake_client(*args, **kwargs):
+    class Dummy:
+        def chat(self_inner, messages, options=None):
+            return ChatResult(content="ok", usage={})
+
+    return Dummy()
+
+
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        llm_cache.invalidate()
+        self.llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+
+    def test_get_llm_is_cached_until_saved(self):
+        self.assertEqual(llm_cache.get_llm(self.llm.pk).model, "llama3")
+        with self.assertNumQueries(0):
+            llm_cache.get_llm(self.llm.pk)
+
+        self.llm.model = "gemma"
+        self.llm.save()
+        self.assertEqual(llm_cache.get_llm(self.llm.pk).model, "gemma")
+
+    def test_delete_invalidates(self):
+        llm_cache.get_llm(self.llm.pk)
+        pk = self.llm.pk
+        self.llm.delete()
+        with self.assertRaises(LLM.DoesNotExist):
+            llm_cache.get_llm(pk)
+
+    def test_expired_entries_are_reloaded(self):
+        with patch("core.llm_cache.TTL", 0):
+            llm_cache.get_llm(self.llm.pk)
+        LLM.objects.filter(pk=self.llm.pk).update(model="gemma")  # シグナル無し
+        self.assertEqual(llm_cache.get_llm(self.llm.pk).model, "gemma")
+
+    def test_client_is_reused_until_llm_changes(self):
+        client = build_llm_client(self.llm)
+        self.assertIs(build_llm_client(self.llm), client)
+
+        self.llm.extra = {"temperature": 0}
+        self.llm.save()
+        rebuilt = build_llm_client(self.llm)
+        self.assertIsNot(rebuilt, client)
+        self.assertEqual(rebuilt.default_params, {"temperature": 0})
+
+    def test_async_client_is_cached_separately_and_invalidated(self):
+        client = build_async_llm_client(self.llm, affinity_key="s1")
+        self.assertIsInstance(client, AsyncOllamaClient)
+        self.assertIs(build_async_llm_client(self.llm, affinity_key="s2"), client)
+        self.assertIsNot(build_llm_client(self.llm), client)
+
+        self.llm.extra = {"temperature": 0}
+        self.llm.save()
+        rebuilt = build_async_llm_client(self.llm)
+        self.assertIsNot(rebuilt, client)
+        self.assertEqual(rebuilt.default_params, {"temperature": 0})
+
+    def test_router_gets_per_call_affinity(self):
+        self.llm.extra = {"backends": ["http://a:11434", "http://b:11434"]}
+        self.llm.save()
+        first = build_llm_client(self.llm, affinity_key="s1")
+        second = build_llm_client(self.llm, affinity_key="s2")
+        self.assertEqual((first.affinity_key, second.affinity_key), ("s1", "s2"))
+        self.assertIs(first.pool, second.pool)
+        self.assertIsNone(build_llm_client(self.llm).affinity_key)
+
+    def test_unsaved_llm_is_not_cached(self):
+        llm = LLM(model="llama3")
+        self.assertIsNot(build_llm_client(llm), build_llm_client(llm))
+
+    @patch("core.usecases.build_llm_client", fake_client)
+    def test_warm_session_skips_llm_lookup(self):
+        session = ChatSession.objects.create(llm=self.llm, title="T")
+        ChatInSessionUsecase(session.uuid)
+        with self.assertNumQueries(1):
+            uc = ChatInSessionUsecase(session.uuid)
+        self.assertEqual(uc.session.llm.model, "llama3")
@@ -0,0 +1,59 @@
+from django.test import TestCase
+
+from core.models import LLM, ChatSession, Message
+
+
+class MessagePaginationTests(TestCase):
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        self.session = ChatSession.objects.create(llm=llm, title="Test")
+        self.msgs = [
+            Message.objects.create(session=self.session, role="user", content=f"m{i}")
+            for i in range(7)
+        ]
+        self.url = f"/api/sessions/{self.session.uuid}/messages/"
+
+    def _contents(self, res):
+        return [m["content"] for m in res.json()["results"]]
+
+    def test_without_params_returns_full_list(self):
+        res = self.client.get(self.url)
+        self.assertEqual(len(res.json()), 7)
+
+    def test_latest_page_then_walk_backwards(self):
+        res = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(self._contents(res), ["m4", "m5", "m6"])
+        self.assertTrue(res.json()["has_more"])
+
+        res = self.client.get(self.url, {"limit": 3, "before": res.json()["before"]})
+        self.assertEqual(self._contents(res), ["m1", "m2", "m3"])
+
+        res = self.client.get(self.url, {"limit": 3, "before": res.json()["before"]})
+        self.assertEqual(self._contents(res), ["m0"])
+        self.assertFalse(res.json()["has_more"])
+
+    def test_after_cursor_fetches_only_new_messages(self):
+        res = self.client.get(self.url, {"limit": 10})
+        cursor = res.json()["after"]
+        Message.objects.create(session=self.session, role="assistant", content="new")
+
+        res = self.client.get(self.url, {"after": cursor})
+        self.assertEqual(self._contents(res), ["new"])
+        self.assertFalse(res.json()["has_more"])
+
+        res = self.client.get(self.url, {"after": res.json()["after"]})
+        self.assertEqual(self._contents(res), [])
+
+    def test_since_timestamp(self):
+        since = self.msgs[4].created_at.isoformat()
+        res = self.client.get(self.url, {"since": since})
+        self.assertEqual(self._contents(res), ["m5", "m6"])
+
+    def test_page_query_count_is_constant(self):
+        with self.assertNumQueries(2):  # session + page
+            self.client.get(self.url, {"limit": 3})
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"before": "@@"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"limit": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"since": "x"}).status_code, 400)
@@ -0,0 +1,74 @@
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+
+from core.llm_clients import OllamaClient
+from core.metrics import Registry, record_chat, registry
+from core.models import LLM
+
+
+class RegistryTests(TestCase):
+    def test_render_prometheus_text(self):
+        reg = Registry()
+        c = reg.counter("demo_total", "Demo counter")
+        h = reg.histogram("demo_seconds", "Demo latency", buckets=(0.1, 1))
+        c.inc(llm="a")
+        c.inc(2, llm="a")
+        h.observe(0.5, llm="a")
+
+        text = reg.render()
+        self.assertIn("# TYPE demo_total counter", text)
+        self.assertIn('demo_total{llm="a"} 3.0', text)
+        self.assertIn('demo_seconds_bucket{llm="a",le="0.1"} 0.0', text)
+        self.assertIn('demo_seconds_bucket{llm="a",le="1.0"} 1.0', text)
+        self.assertIn('demo_seconds_bucket{llm="a",le="+Inf"} 1.0', text)
+        self.assertIn('demo_seconds_count{llm="a"} 1.0', text)
+
+
+class OllamaUsageTests(TestCase):
+    def test_chat_captures_all_timings(self):
+        resp = MagicMock()
+        resp.json.return_value = {
+            "message": {"content": "ok"},
+            "eval_count": 100,
+            "prompt_eval_count": 20,
+            "total_duration": 3_000_000_000,
+            "load_duration": 500_000_000,
+            "prompt_eval_duration": 250_000_000,
+            "eval_duration": 2_000_000_000,
+        }
+        client = OllamaClient(None, "llama3")
+        client.http = MagicMock(post=MagicMock(return_value=resp))
+
+        usage = client.chat([{"role": "user", "content": "Hi"}]).usage
+
+        self.assertEqual(usage["total_duration"], 3_000_000_000)
+        self.assertEqual(usage["load_duration"], 500_000_000)
+        self.assertEqual(usage["tokens_per_second"], 50.0)
+        self.assertEqual(usage["time_to_first_token_ms"], 750.0)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_metrics_endpoint_exports_chat_metrics(self):
+        llm = LLM(name="MetricsLLM", model="llama3")
+        record_chat(
+            llm,
+            {"eval_count": 10, "prompt_eval_count": 5, "tokens_per_second": 20.0},
+            1.5,
+        )
+
+        res = self.client.get("/api/metrics/")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res["Content-Type"].startswith("text/plain"))
+        body = res.content.decode()
+        self.assertIn(
+            'llm_completion_tokens_total{llm="MetricsLLM",model="llama3"}', body
+        )
+        self.assertIn("llm_chat_duration_seconds_bucket", body)
+        self.assertEqual(
+            registry.counter("llm_chat_requests_total", "").value(
+                llm="MetricsLLM", model="llama3", status="completed"
+            ),
+            1,
+        )
@@ -0,0 +1,80 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.llm_clients import ChatResult
+from core.models import LLM, ChatSession
+from core.profiling import RequestProfile, _current, span
+
+
+def fake_client(*args, **kwargs):
+    class Dummy:
+        def chat(self_inner, messages, options=None):
+            return ChatResult(content="ok", usage={})
+
+    return Dummy()
+
+
+class SpanTests(SimpleTestCase):
+    def test_span_is_noop_without_profile(self):
+        with span("llm"):
+            pass
+
+    def test_span_accumulates_stage_time(self):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            for _ in range(2):
+                with span("history"):
+                    pass
+        finally:
+            _current.reset(token)
+        self.assertIn("history", profile.stages)
+        header = profile.server_timing()
+        self.assertTrue(header.startswith('db;dur=0.0;desc="0 queries"'))
+        self.assertIn("history;dur=", header)
+        self.assertIn("total;dur=", header)
+
+
+@patch("core.usecases.build_llm_client", fake_client)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        session = ChatSession.objects.create(llm=llm, title="T")
+        self.url = f"/api/sessions/{session.uuid}/chat/"
+
+    def _chat(self):
+        return self.client.post(
+            self.url, {"message": "Hi"}, content_type="application/json"
+        )
+
+    def test_disabled_by_default(self):
+        res = self._chat()
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("Server-Timing", res)
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_server_timing_has_chat_stages(self):
+        res = self._chat()
+        self.assertEqual(res.status_code, 200)
+        timing = res["Server-Timing"]
+        for stage in ("db", "session", "user_insert", "history", "llm", "total"):
+            self.assertIn(f"{stage};dur=", timing)
+        queries = int(timing.split('desc="')[1].split(" ")[0])
+        self.assertGreater(queries, 0)
+
+    def test_slow_requests_are_dumped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(
+                REQUEST_PROFILING=True,
+                REQUEST_PROFILING_SAMPLE_RATE=1.0,
+                REQUEST_PROFILING_SLOW_MS=0,
+                REQUEST_PROFILING_DIR=tmp,
+            ):
+                self._chat()
+            dumps = os.listdir(tmp)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].endswith("ms.prof"))
+        self.assertIn("POST-api_sessions_", dumps[0])
@@ -0,0 +1,137 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.llm_clients import ChatResult
+from core.models import LLM, ChatSession, Document, DocumentChunk
+from core.rag import VectorStore, chunk_text, get_store, normalize, retrieve
+from core.usecases import ChatInSessionUsecase
+
+VOCAB = ["docker", "git", "python"]
+
+
+def fake_embed(self, texts, model=None):
+    # 単語の出現数をベクトルにする簡易埋め込み
+    return [[t.lower().count(w) + 0.01 for w in VOCAB] for t in texts]
+
+
+def recording_client(sent):
+    def factory(*args, **kwargs):
+        class Dummy:
+            def chat(self_inner, messages, options=None):
+                sent.extend(messages)
+                return ChatResult(content="ok", usage={})
+
+        return Dummy()
+
+    return factory
+
+
+class ChunkTextTests(SimpleTestCase):
+    def test_packs_paragraphs_and_overlaps(self):
+        text = "a" * 50 + "\n\n" + "b" * 30 + "\n\n" + "c" * 150
+        chunks = chunk_text(text, size=100, overlap=10)
+        self.assertEqual(chunks[0], "a" * 50 + "\n\n" + "b" * 30)
+        self.assertEqual(chunks[1], "b" * 10 + "\n" + "c" * 100)
+        self.assertEqual(chunks[2], "c" * 10 + "\n" + "c" * 50)
+
+    def test_empty_text(self):
+        self.assertEqual(chunk_text("\n\n  \n\n"), [])
+
+
+class VectorStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = VectorStore("lecture", tmp.name)
+
+    def test_append_and_search(self):
+        self.assertEqual(self.store.append(normalize([[1, 0], [0, 1]]), "emb"), 0)
+        self.assertEqual(self.store.append(normalize([[1, 1]]), "emb"), 2)
+        self.assertEqual(self.store.meta()["rows"], 3)
+
+        hits = self.store.search(normalize([1, 0.1]), 2)
+        self.assertEqual([row for row, _ in hits], [0, 2])
+        self.assertIsInstance(self.store.matrix(), np.memmap)
+
+    def test_rejects_different_model(self):
+        self.store.append(normalize([[1, 0]]), "emb")
+        with self.assertRaises(ValueError):
+            self.store.append(normalize([[1, 0]]), "other")
+
+
+class IngestAndRetrieveTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.docs = Path(tmp.name) / "docs"
+        self.docs.mkdir()
+        (self.docs / "docker.md").write_text("Docker のコンテナを起動する。docker run")
+        (self.docs / "git.md").write_text("git commit で変更を記録する。")
+        settings = override_settings(RAG_INDEX_DIR=str(Path(tmp.name) / "index"))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        embed = patch("core.llm_clients.OllamaClient.embed", fake_embed)
+        embed.start()
+        self.addCleanup(embed.stop)
+
+    def _ingest(self):
+        call_command(
+            "ingest_documents", str(self.docs), collection="lecture", stdout=StringIO()
+        )
+
+    def test_ingest_is_incremental(self):
+        self._ingest()
+        self.assertEqual(Document.objects.filter(collection="lecture").count(), 2)
+        self.assertEqual(DocumentChunk.objects.count(), 2)
+
+        self._ingest()  # 変更なし
+        self.assertEqual(DocumentChunk.objects.count(), 2)
+
+        (self.docs / "git.md").write_text("git push と git pull")
+        self._ingest()
+        rows = sorted(DocumentChunk.objects.values_list("row", flat=True))
+        self.assertEqual(rows, [0, 2])
+
+    def test_reingest_tombstones_superseded_rows(self):
+        self._ingest()  # docker.md → 0, git.md → 1
+        for i in range(4):
+            (self.docs / "docker.md").write_text(f"docker build {i}。docker run")
+            self._ingest()
+        store = get_store("lecture")
+        self.assertEqual(store.meta()["rows"], 6)
+        self.assertEqual(np.flatnonzero(store.dead()).tolist(), [0, 2, 3, 4])
+
+        # 古い docker の行の方が近くても、生きている行で top_k 件そろえる
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        results = retrieve(llm, "lecture", "docker docker", top_k=2)
+        self.assertEqual([chunk.row for chunk, _ in results], [5, 1])
+
+    def test_chat_injects_retrieved_context(self):
+        self._ingest()
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        session = ChatSession.objects.create(
+            llm=llm, title="T", metadata={"rag": {"collection": "lecture", "top_k": 1}}
+        )
+        sent = []
+        with patch("core.usecases.build_llm_client", recording_client(sent)):
+            ChatInSessionUsecase(session.uuid).run("docker の使い方は？")
+
+        self.assertEqual([m["role"] for m in sent], ["system", "user"])
+        self.assertIn("docker run", sent[0]["content"])
+        self.assertNotIn("git commit", sent[0]["content"])
+
+    def test_missing_collection_leaves_messages_unchanged(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        session = ChatSession.objects.create(
+            llm=llm, title="T", metadata={"rag": {"collection": "none"}}
+        )
+        sent = []
+        with patch("core.usecases.build_llm_client", recording_client(sent)):
+            ChatInSessionUsecase(session.uuid).run("Hi")
+        self.assertEqual([m["role"] for m in sent], ["user"])
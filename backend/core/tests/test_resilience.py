@@ -0,0 +1,189 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+
+from core import llm_cache
+from core.admission import LLMBusyError
+from core.llm_clients import ChatChunk, OllamaClient, close_http_sessions
+from core.models import LLM, ChatSession, Message
+from core.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from core.usecases import ChatInSessionUsecase
+
+
+class FakeStreamClient:
+    def __init__(self, text: str, delay: float = 0.0, error: Exception | None = None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.closed = False
+
+    def stream_chat(self, messages, options=None):
+        self.calls += 1
+        try:
+            time.sleep(self.delay)
+            if self.error:
+                raise self.error
+            yield ChatChunk(content=self.text)
+            yield ChatChunk(content="", done=True, usage={"eval_count": 1})
+        finally:
+            self.closed = True
+
+
+class StalledOllama(ThreadingHTTPServer):
+    """/api/chat でヘッダだけ返して本文を送らない Ollama。切断されたら closed を立てる"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        self.closed = threading.Event()
+        super().__init__(("127.0.0.1", 0), _StalledHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _StalledHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+        # クライアントが接続を閉じると recv が b"" を返す
+        self.connection.settimeout(5)
+        try:
+            if self.connection.recv(1) == b"":
+                self.server.closed.set()
+        except OSError:
+            self.server.closed.set()
+
+    def log_message(self, *args):
+        pass
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_then_half_opens_and_closes(self):
+        breaker = CircuitBreaker("Local", failures=2, reset_seconds=0.05)
+        breaker.record(False)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record(False)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())  # 試行は 1 件だけ
+        breaker.record(True)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("Local", failures=1, reset_seconds=0)
+        breaker.record(False)
+        self.assertTrue(breaker.allow())
+        breaker.record(False)
+        self.assertEqual(breaker.state, OPEN)
+
+
+class HedgedChatTests(TestCase):
+    def setUp(self):
+        llm_cache.invalidate()
+        self.fallback = LLM.objects.create(name="Small", model="small")
+        self.primary = LLM.objects.create(
+            name="Large",
+            model="large",
+            extra={
+                "first_token_deadline": 0.05,
+                "fallback_llm": self.fallback.pk,
+                "breaker_failures": 2,
+            },
+        )
+        self.session = ChatSession.objects.create(llm=self.primary, title="T")
+        self.clients = {
+            "large": FakeStreamClient("large answer"),
+            "small": FakeStreamClient("small answer"),
+        }
+        factory = patch(
+            "core.llm_clients.create_llm_client",
+            lambda llm, affinity_key=None: self.clients[llm.model],
+        )
+        factory.start()
+        self.addCleanup(factory.stop)
+        # ブレーカーは設定ごとにプロセス内で共有されるためテストごとに空にする
+        breakers = patch("core.resilience._breakers", {})
+        breakers.start()
+        self.addCleanup(breakers.stop)
+
+    def _run(self):
+        res = ChatInSessionUsecase(self.session.uuid).run("Hi")
+        assistant = Message.objects.get(pk=res["assistant_message"]["id"])
+        return res, assistant.metadata["served_by"]
+
+    def test_fast_primary_is_used(self):
+        res, served_by = self._run()
+        self.assertEqual(res["assistant_message"]["content"], "large answer")
+        self.assertEqual(served_by["role"], "primary")
+        self.assertIsNone(served_by["reason"])
+        self.assertEqual(self.clients["small"].calls, 0)
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        self.clients["large"].delay = 0.5
+        res, served_by = self._run()
+        self.assertEqual(res["assistant_message"]["content"], "small answer")
+        self.assertEqual(served_by["role"], "fallback")
+        self.assertEqual(served_by["reason"], "hedge")
+        self.assertEqual(served_by["llm_id"], self.fallback.pk)
+        time.sleep(0.6)
+        self.assertTrue(self.clients["large"].closed)
+
+    def test_stalled_primary_connection_is_closed_by_hedge(self):
+        server = StalledOllama()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(close_http_sessions)
+        self.clients["large"] = OllamaClient(server.url, "large")
+        started = time.monotonic()
+        res, served_by = self._run()
+        self.assertEqual(served_by["reason"], "hedge")
+        # 読み取りタイムアウト（120 秒）を待たずに切断される
+        self.assertTrue(server.closed.wait(2))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_primary_failure_falls_back(self):
+        self.clients["large"].error = RuntimeError("down")
+        res, served_by = self._run()
+        self.assertEqual(served_by["reason"], "primary_failed")
+
+    def test_open_circuit_skips_primary(self):
+        self.clients["large"].error = RuntimeError("down")
+        self._run()
+        self._run()
+        self.clients["large"].calls = 0
+        _, served_by = self._run()
+        self.assertEqual(served_by["reason"], "circuit_open")
+        self.assertEqual(self.clients["large"].calls, 0)
+
+    def test_open_circuit_without_fallback_is_503(self):
+        self.primary.extra = {"breaker_failures": 1}
+        self.primary.save()
+        self.clients["large"].error = RuntimeError("down")
+        with self.assertRaises(RuntimeError):
+            ChatInSessionUsecase(self.session.uuid).run("Hi")
+        with self.assertRaises(LLMBusyError) as ctx:
+            ChatInSessionUsecase(self.session.uuid).run("Hi")
+        self.assertEqual(ctx.exception.status_code, 503)
+
+    def test_stream_records_served_by(self):
+        self.clients["large"].delay = 0.5
+        events = list(ChatInSessionUsecase(self.session.uuid).stream("Hi"))
+        self.assertEqual(events[-1]["event"], "done")
+        assistant = Message.objects.filter(role="assistant").get()
+        self.assertEqual(assistant.content, "small answer")
+        self.assertEqual(assistant.metadata["served_by"]["role"], "fallback")
@@ -0,0 +1,200 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core import response_cache
+from core.admission import LLMBusyError, acquire_slot
+from core.llm_clients import ChatChunk, ChatResult
+from core.models import LLM, ChatSession, Message, ResponseCacheEntry
+from core.response_cache import _MemoryCache, cache_key
+from core.usecases import ChatInSessionUsecase
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def counting_client(calls):
+    def factory(*args, **kwargs):
+        class Dummy:
+            def chat(self_inner, messages, options=None):
+                calls.append(messages)
+                return ChatResult(content="Hello", usage={"eval_count": 3})
+
+            def stream_chat(self_inner, messages, options=None):
+                calls.append(messages)
+                yield ChatChunk("Hel")
+                yield ChatChunk("lo", done=True, usage={"eval_count": 3})
+
+        return Dummy()
+
+    return factory
+
+
+class CacheKeyTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(
+            name="Local",
+            provider="OLLAMA",
+            model="llama3",
+            extra={"response_cache_ttl": 600, "temperature": 0},
+        )
+
+    def test_disabled_without_ttl(self):
+        llm = LLM.objects.create(
+            name="Plain", provider="OLLAMA", model="llama3", extra={"temperature": 0}
+        )
+        self.assertIsNone(cache_key(llm, MESSAGES))
+
+    def test_only_deterministic_options(self):
+        self.assertIsNotNone(cache_key(self.llm, MESSAGES))
+        self.assertIsNone(cache_key(self.llm, MESSAGES, {"temperature": 0.7}))
+        self.llm.extra = {"response_cache_ttl": 600}
+        self.assertIsNone(cache_key(self.llm, MESSAGES))
+
+    def test_key_normalizes_messages_and_includes_options(self):
+        key = cache_key(self.llm, MESSAGES)
+        self.assertEqual(
+            key, cache_key(self.llm, [{"role": "user", "content": " Hi\r\n"}])
+        )
+        self.assertNotEqual(key, cache_key(self.llm, MESSAGES, {"num_predict": 10}))
+        # バックエンド設定キーは options に含めない
+        self.llm.extra = {**self.llm.extra, "response_cache_ttl": 60}
+        self.assertEqual(key, cache_key(self.llm, MESSAGES))
+
+
+class ResponseCacheUsecaseTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(
+            name="Local",
+            provider="OLLAMA",
+            model="llama3",
+            extra={"response_cache_ttl": 600, "temperature": 0},
+        )
+        memory = patch("core.response_cache._memory", _MemoryCache(16))
+        memory.start()
+        self.addCleanup(memory.stop)
+
+    def _chat(self, calls, options=None):
+        session = ChatSession.objects.create(llm=self.llm, title="Test")
+        with patch("core.usecases.build_llm_client", counting_client(calls)):
+            return ChatInSessionUsecase(session.uuid).run("Hi", options=options)
+
+    def test_identical_request_is_served_from_memory(self):
+        calls = []
+        first = self._chat(calls)
+        second = self._chat(calls)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first["usage"], {"eval_count": 3})
+        self.assertEqual(second["assistant_message"]["content"], "Hello")
+        self.assertEqual(second["usage"]["cache"]["tier"], "memory")
+        assistant = Message.objects.get(pk=second["assistant_message"]["id"])
+        self.assertTrue(assistant.usage["cache"]["hit"])
+
+    def test_db_tier_is_shared_between_processes(self):
+        calls = []
+        self._chat(calls)
+        # 別プロセス相当: メモリ層が空
+        with patch("core.response_cache._memory", _MemoryCache(16)):
+            result = self._chat(calls)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(result["usage"]["cache"]["tier"], "db")
+        self.assertEqual(ResponseCacheEntry.objects.get().hits, 1)
+
+    @patch("core.admission._limiters", {})
+    def test_cache_hit_does_not_take_a_generation_slot(self):
+        calls = []
+        self._chat(calls)
+        self.llm.extra = {**self.llm.extra, "max_concurrency": 1, "max_queue": 0}
+        self.llm.save()
+        slot = acquire_slot(self.llm)
+        try:
+            result = self._chat(calls)
+            session = ChatSession.objects.create(llm=self.llm, title="Test")
+            with patch("core.usecases.build_llm_client", counting_client(calls)):
+                events = list(ChatInSessionUsecase(session.uuid).stream("Hi"))
+                # ミスは従来どおり拒否し、何も保存しない
+                with self.assertRaises(LLMBusyError):
+                    ChatInSessionUsecase(session.uuid).run("Other")
+        finally:
+            slot.release()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(result["usage"]["cache"]["tier"], "memory")
+        self.assertEqual([e["event"] for e in events], ["delta", "done"])
+        self.assertEqual(events[0]["data"]["content"], "Hello")
+        self.assertEqual(
+            [(m.role, m.status) for m in session.messages.all()],
+            [("user", "completed"), ("assistant", "completed")],
+        )
+
+    def test_streamed_answer_is_cached(self):
+        calls = []
+        session = ChatSession.objects.create(llm=self.llm, title="Test")
+        with patch("core.usecases.build_llm_client", counting_client(calls)):
+            list(ChatInSessionUsecase(session.uuid).stream("Hi"))
+        result = self._chat(calls)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(result["assistant_message"]["content"], "Hello")
+
+    def test_non_deterministic_request_is_not_cached(self):
+        calls = []
+        self._chat(calls, {"temperature": 0.8})
+        self._chat(calls, {"temperature": 0.8})
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(ResponseCacheEntry.objects.exists())
+
+    def test_expired_entry_is_ignored(self):
+        calls = []
+        self._chat(calls)
+        ResponseCacheEntry.objects.update(expires_at=timezone.now() - timedelta(1))
+        with patch("core.response_cache._memory", _MemoryCache(16)):
+            self._chat(calls)
+        self.assertEqual(len(calls), 2)
+
+    def test_invalidate_clears_both_tiers(self):
+        calls = []
+        self._chat(calls)
+        self.assertEqual(response_cache.invalidate(self.llm), 1)
+        self._chat(calls)
+        self.assertEqual(len(calls), 2)
+
+    @patch("core.response_cache.PRUNE_INTERVAL", 0)
+    def test_entries_are_capped_per_llm(self):
+        self.llm.extra = {**self.llm.extra, "response_cache_max_entries": 2}
+        self.llm.save()
+        for i in range(4):
+            key = f"{i:064d}"
+            response_cache.put(self.llm, key, ChatResult(content=str(i), usage={}))
+        self.assertEqual(ResponseCacheEntry.objects.count(), 2)
+
+    @patch("core.response_cache.PRUNE_INTERVAL", 0)
+    def test_eviction_keeps_recently_hit_entries(self):
+        self.llm.extra = {**self.llm.extra, "response_cache_max_entries": 2}
+        self.llm.save()
+        keys = [f"{i:064d}" for i in range(3)]
+        for key in keys[:2]:
+            response_cache.put(self.llm, key, ChatResult(content=key, usage={}))
+        # 最初に作ったエントリを DB 層で使うと、次の追加では 2 つ目が消える
+        with patch("core.response_cache._memory", _MemoryCache(16)):
+            self.assertIsNotNone(response_cache.get(self.llm, keys[0]))
+        response_cache.put(self.llm, keys[2], ChatResult(content="2", usage={}))
+        self.assertEqual(
+            set(ResponseCacheEntry.objects.values_list("key", flat=True)),
+            {keys[0], keys[2]},
+        )
+
+    @patch("core.response_cache._pruned_at", {})
+    def test_prune_runs_once_per_interval(self):
+        self.llm.extra = {**self.llm.extra, "response_cache_max_entries": 1}
+        self.llm.save()
+        with patch("core.response_cache._prune") as prune:
+            for i in range(3):
+                key = f"{i:064d}"
+                response_cache.put(self.llm, key, ChatResult(content=str(i), usage={}))
+            self.assertEqual(prune.call_count, 1)
+            # 間隔が過ぎたら次の書き込みで掃除する
+            response_cache._pruned_at[self.llm.pk] -= response_cache.PRUNE_INTERVAL
+            response_cache.put(self.llm, "f" * 64, ChatResult("x", usage={}))
+            self.assertEqual(prune.call_count, 2)
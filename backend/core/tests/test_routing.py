@@ -0,0 +1,134 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import requests
+from django.test import SimpleTestCase, TestCase
+
+from core import routing
+from core.llm_clients import ChatResult, build_llm_client
+from core.models import LLM
+from core.routing import BackendPool, OllamaRouter
+
+URLS = ["http://ollama-1:11434", "http://ollama-2:11434", "http://ollama-3:11434"]
+
+
+class BackendPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = BackendPool(URLS)
+
+    def test_picks_least_in_flight(self):
+        a = self.pool.acquire()
+        b = self.pool.acquire()
+        c = self.pool.acquire()
+        self.assertEqual({a.url, b.url, c.url}, set(URLS))
+        self.pool.release(b)
+        self.assertIs(self.pool.acquire(), b)
+
+    def test_session_affinity_within_slack(self):
+        first = self.pool.acquire("session-1")
+        self.pool.release(first)
+        # 他バックエンドより少し混んでいても同じバックエンドを選ぶ
+        for _ in range(routing.AFFINITY_SLACK):
+            first.in_flight += 1
+        self.assertIs(self.pool.acquire("session-1"), first)
+
+    def test_affinity_yields_to_load(self):
+        first = self.pool.acquire("session-1")
+        self.pool.release(first)
+        first.in_flight += routing.AFFINITY_SLACK + 1
+        other = self.pool.acquire("session-1")
+        self.assertIsNot(other, first)
+        # 次回は移った先を優先する
+        self.pool.release(other)
+        first.in_flight = 0
+        self.assertIs(self.pool.acquire("session-1"), other)
+
+    def test_failing_backend_is_ejected_until_health_check_passes(self):
+        bad = self.pool.acquire()
+        self.pool.release(bad, requests.ConnectionError("down"))
+        picked = {self.pool.acquire().url for _ in range(4)}
+        self.assertNotIn(bad.url, picked)
+
+        bad.ejected_until = time.monotonic() - 1
+        checking = threading.Event()
+        release = threading.Event()
+
+        def check_health(backend):
+            checking.set()
+            return release.wait(5)
+
+        with patch.object(self.pool, "check_health", side_effect=check_health):
+            # ヘルスチェックの完了を待たずに他のバックエンドを返す
+            self.assertIsNot(self.pool.acquire(), bad)
+            self.assertTrue(checking.wait(5))
+            self.assertIsNot(self.pool.acquire(), bad)
+            release.set()
+            deadline = time.monotonic() + 5
+            while not bad.available(time.monotonic()):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        self.assertEqual(bad.failures, 0)
+
+    def test_failed_health_check_keeps_backend_ejected(self):
+        bad = self.pool.acquire()
+        self.pool.release(bad, requests.ConnectionError("down"))
+        bad.ejected_until = time.monotonic() - 1
+        with patch.object(self.pool, "check_health", return_value=False) as check:
+            self.pool.acquire()
+            deadline = time.monotonic() + 5
+            while bad.probing or bad.ejected_until <= time.monotonic():
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        check.assert_called_once_with(bad)
+        self.assertFalse(bad.available(time.monotonic()))
+
+    def test_client_error_does_not_eject(self):
+        backend = self.pool.acquire()
+        response = MagicMock(status_code=400)
+        self.pool.release(backend, requests.HTTPError(response=response))
+        self.assertTrue(backend.available(time.monotonic()))
+
+
+class OllamaRouterTests(SimpleTestCase):
+    def test_retries_on_another_backend(self):
+        pool = BackendPool(URLS[:2])
+        router = OllamaRouter(pool, "llama3", affinity_key="s")
+        calls = []
+
+        def chat(client_self, messages, options=None):
+            calls.append(client_self.base_url)
+            if len(calls) == 1:
+                raise requests.ConnectionError("down")
+            return ChatResult(content="ok", usage={})
+
+        with patch("core.routing.OllamaClient.chat", chat):
+            result = router.chat([{"role": "user", "content": "Hi"}])
+
+        self.assertEqual(result.content, "ok")
+        self.assertEqual(len(set(calls)), 2)
+        failed = next(b for b in pool.backends if b.url == calls[0])
+        self.assertFalse(failed.available(time.monotonic()))
+        self.assertEqual([b.in_flight for b in pool.backends], [0, 0])
+
+    def test_stream_releases_backend(self):
+        pool = BackendPool(URLS[:1])
+        router = OllamaRouter(pool, "llama3")
+        with patch("core.routing.OllamaClient.stream_chat", return_value=iter([])):
+            list(router.stream_chat([{"role": "user", "content": "Hi"}]))
+        self.assertEqual(pool.backends[0].in_flight, 0)
+
+
+class RouterFactoryTests(TestCase):
+    def test_factory_returns_router_when_backends_configured(self):
+        llm = LLM.objects.create(
+            name="Pool",
+            provider="OLLAMA",
+            model="llama3",
+            extra={"backends": URLS, "temperature": 0.1},
+        )
+        client = build_llm_client(llm, affinity_key="abc")
+        self.assertIsInstance(client, OllamaRouter)
+        self.assertEqual(client.default_params, {"temperature": 0.1})
+        self.assertEqual(client.affinity_key, "abc")
+        self.assertIs(client.pool, build_llm_client(llm).pool)
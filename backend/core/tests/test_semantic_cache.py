@@ -0,0 +1,134 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from core.llm_clients import ChatResult
+from core.models import LLM, ChatSession
+from core.semantic_cache import SemanticIndex
+from core.usecases import ChatInSessionUsecase
+
+EMBEDDINGS = {
+    "What is Docker?": [1.0, 0.0, 0.0],
+    "Docker って何？": [0.98, 0.2, 0.0],
+    "How do I use git?": [0.0, 1.0, 0.0],
+}
+
+
+def unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+class SemanticIndexTests(SimpleTestCase):
+    def test_search_respects_partition_and_threshold(self):
+        index = SemanticIndex(8)
+        index.add(unit([1, 0]), 1, "a")
+        index.add(unit([0, 1]), 2, "b")
+
+        self.assertEqual(index.search(unit([1, 0.1]), 1, 0.9)[0], "a")
+        self.assertIsNone(index.search(unit([1, 0.1]), 2, 0.9))
+        self.assertIsNone(index.search(unit([1, 1]), 1, 0.9))
+
+    def test_grows_and_evicts_least_recently_used(self):
+        index = SemanticIndex(100)
+        for i in range(100):
+            index.add(unit([1, i]), 0, str(i))
+        self.assertEqual(index.size, 100)
+        self.assertEqual(index.vectors.shape, (100, 2))
+
+        index.search(unit([1, 0]), 0, 0.99)  # "0" を最近使用にする
+        index.add(unit([-1, 0]), 0, "new")
+        self.assertEqual(index.size, 100)
+        self.assertNotIn("1", index.answers)
+        self.assertIn("0", index.answers)
+
+
+def fake_embed_client(*args, **kwargs):
+    class Dummy:
+        def embed(self_inner, texts, model=None):
+            return [EMBEDDINGS[t] for t in texts]
+
+    return Dummy()
+
+
+def counting_client(calls):
+    def factory(*args, **kwargs):
+        class Dummy:
+            def chat(self_inner, messages, options=None):
+                calls.append(messages[-1]["content"])
+                return ChatResult(
+                    content=f"answer: {messages[-1]['content']}", usage={}
+                )
+
+        return Dummy()
+
+    return factory
+
+
+@patch("core.semantic_cache.build_llm_client", fake_embed_client)
+class SemanticCacheUsecaseTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(
+            name="Local",
+            provider="OLLAMA",
+            model="llama3",
+            extra={"semantic_cache_threshold": 0.9, "embedding_model": "emb"},
+        )
+        indexes = patch("core.semantic_cache._indexes", {})
+        indexes.start()
+        self.addCleanup(indexes.stop)
+
+    def _chat(self, calls, text, session=None):
+        session = session or ChatSession.objects.create(llm=self.llm, title="T")
+        with patch("core.usecases.build_llm_client", counting_client(calls)):
+            return ChatInSessionUsecase(session.uuid).run(text)
+
+    def test_paraphrase_is_served_from_cache(self):
+        calls = []
+        self._chat(calls, "What is Docker?")
+        result = self._chat(calls, "Docker って何？")
+
+        self.assertEqual(calls, ["What is Docker?"])
+        self.assertEqual(
+            result["assistant_message"]["content"], "answer: What is Docker?"
+        )
+        cache = result["usage"]["cache"]
+        self.assertEqual(cache["tier"], "semantic")
+        self.assertGreater(cache["similarity"], 0.9)
+
+    def test_dissimilar_question_is_generated(self):
+        calls = []
+        self._chat(calls, "What is Docker?")
+        self._chat(calls, "How do I use git?")
+        self.assertEqual(len(calls), 2)
+
+    def test_only_first_turn_is_cached(self):
+        calls = []
+        session = ChatSession.objects.create(llm=self.llm, title="T")
+        self._chat(calls, "What is Docker?")
+        self._chat(calls, "How do I use git?", session)
+        # 2 ターン目は履歴があるので対象外
+        self._chat(calls, "What is Docker?", session)
+        self.assertEqual(len(calls), 3)
+
+    def test_trimmed_history_is_not_treated_as_first_turn(self):
+        # 予算が小さく、送る履歴は今回の質問だけになる
+        self.llm.extra = {**self.llm.extra, "history_token_budget": 1}
+        self.llm.save()
+        calls = []
+        session = ChatSession.objects.create(llm=self.llm, title="T")
+        self._chat(calls, "What is Docker?")
+        self._chat(calls, "How do I use git?", session)
+        self._chat(calls, "What is Docker?", session)
+        self.assertEqual(len(calls), 3)
+
+    def test_embedding_failure_falls_back_to_generation(self):
+        def broken(*args, **kwargs):
+            raise RuntimeError("embed down")
+
+        calls = []
+        with patch("core.semantic_cache._embed", broken):
+            result = self._chat(calls, "What is Docker?")
+        self.assertEqual(calls, ["What is Docker?"])
+        self.assertEqual(result["usage"], {})
@@ -0,0 +1,136 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from core import session_stats
+from core.llm_clients import ChatResult
+from core.models import LLM, ChatSession, Message
+from core.usecases import ChatInSessionUsecase
+
+
+def fake_client(*args, **kwargs):
+    class Dummy:
+        def chat(self_inner, messages, options=None):
+            return ChatResult(
+                content="answer", usage={"prompt_eval_count": 12, "eval_count": 5}
+            )
+
+    return Dummy()
+
+
+class SessionStatsTests(TestCase):
+    def setUp(self):
+        llm = LLM.objects.create(name="Local", provider="OLLAMA", model="llama3")
+        self.session = ChatSession.objects.create(llm=llm, title="T")
+
+    @patch("core.usecases.build_llm_client", fake_client)
+    def test_chat_turn_updates_counters(self):
+        ChatInSessionUsecase(self.session.uuid).run("Hello")
+        ChatInSessionUsecase(self.session.uuid).run("Again")
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 4)
+        self.assertEqual(self.session.last_message_preview, "answer")
+        self.assertEqual(self.session.prompt_tokens, 24)
+        self.assertEqual(self.session.completion_tokens, 10)
+        last = self.session.messages.last()
+        self.assertEqual(self.session.last_activity_at, last.created_at)
+
+    def test_rolled_back_insert_does_not_count(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Message.objects.create(session=self.session, role="user", content="x")
+            raise RuntimeError
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 0)
+
+    def test_preview_is_truncated(self):
+        Message.objects.create(session=self.session, role="user", content="a" * 500)
+        self.session.refresh_from_db()
+        self.assertEqual(
+            len(self.session.last_message_preview), session_stats.PREVIEW_LENGTH
+        )
+
+    def test_refresh_after_bulk_create(self):
+        Message.objects.bulk_create(
+            [
+                Message(
+                    session=self.session, role="user", content="x", status="failed"
+                ),
+                Message(session=self.session, role="user", content="q"),
+                Message(
+                    session=self.session,
+                    role="assistant",
+                    content="a",
+                    usage={"prompt_eval_count": 3, "eval_count": 2},
+                ),
+            ]
+        )
+        session_stats.refresh(self.session)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 3)
+        self.assertEqual(self.session.completed_message_count, 2)
+        self.assertEqual(self.session.last_message_preview, "a")
+        self.assertEqual(self.session.completion_tokens, 2)
+
+
+class SessionListTests(TestCase):
+    url = "/api/sessions/"
+
+    def setUp(self):
+        now = timezone.now()
+        self.sessions = []
+        for i in range(5):
+            llm = LLM.objects.create(name=f"L{i}", model="m")
+            session = ChatSession.objects.create(llm=llm, title=f"s{i}")
+            Message.objects.create(session=session, role="user", content=f"hi {i}")
+            # s4 が最も新しい
+            ChatSession.objects.filter(pk=session.pk).update(
+                last_activity_at=now - timedelta(minutes=10 - i)
+            )
+            self.sessions.append(session)
+        ChatSession.objects.create(llm=llm, title="closed", is_active=False)
+
+    def _titles(self, rows):
+        return [s["title"] for s in rows]
+
+    def test_without_params_returns_list_by_recent_activity(self):
+        res = self.client.get(self.url)
+        self.assertEqual(self._titles(res.json()), ["s4", "s3", "s2", "s1", "s0"])
+        row = res.json()[0]
+        self.assertEqual(row["llm_name"], "L4")
+        self.assertEqual(row["message_count"], 1)
+        self.assertEqual(row["last_message_preview"], "hi 4")
+
+    def test_list_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {"limit": 2})
+
+    def test_walk_pages(self):
+        res = self.client.get(self.url, {"limit": 2}).json()
+        self.assertEqual(self._titles(res["results"]), ["s4", "s3"])
+        self.assertTrue(res["has_more"])
+        res = self.client.get(self.url, {"limit": 2, "before": res["before"]}).json()
+        self.assertEqual(self._titles(res["results"]), ["s2", "s1"])
+        res = self.client.get(self.url, {"limit": 2, "before": res["before"]}).json()
+        self.assertEqual(self._titles(res["results"]), ["s0"])
+        self.assertFalse(res["has_more"])
+
+    def test_same_timestamp_is_not_skipped(self):
+        ChatSession.objects.update(last_activity_at=timezone.now())
+        seen = []
+        params = {"limit": 2}
+        while True:
+            res = self.client.get(self.url, params).json()
+            seen += self._titles(res["results"])
+            if not res["has_more"]:
+                break
+            params["before"] = res["before"]
+        self.assertEqual(sorted(seen), ["s0", "s1", "s2", "s3", "s4"])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"before": "@@"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"limit": "x"}).status_code, 400)
@@ -0,0 +1,145 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from core.history import TokenBudgetHistorySelector
+from core.llm_clients import ChatResult
+from core.models import LLM, ChatSession, Message
+from core.summarization import compact_session, needs_compaction, schedule_compaction
+from core.usecases import ChatInSessionUsecase
+
+
+def fake_summary_client(calls):
+    def factory(*args, **kwargs):  # noqa: D401 - simple factory
+        class Dummy:
+            def chat(self_inner, messages, options=None):  # noqa: D401
+                calls.append(messages)
+                return ChatResult(content=f"summary {len(calls)}", usage={})
+
+        return Dummy()
+
+    return factory
+
+
+class SummarizationTests(TestCase):
+    def setUp(self):
+        self.llm = LLM.objects.create(
+            name="Local",
+            provider="OLLAMA",
+            model="llama3",
+            extra={"summary_trigger_messages": 4, "summary_keep_messages": 2},
+        )
+        self.session = ChatSession.objects.create(llm=self.llm, title="Test")
+
+    def _add_turns(self, n, start=0):
+        for i in range(start, start + n):
+            Message.objects.create(session=self.session, role="user", content=f"q{i}")
+            Message.objects.create(
+                session=self.session, role="assistant", content=f"a{i}"
+            )
+
+    def test_disabled_without_trigger_setting(self):
+        self.llm.extra = {}
+        self.llm.save()
+        self._add_turns(10)
+        self.session.refresh_from_db()
+        self.assertFalse(needs_compaction(self.session))
+        self.assertFalse(compact_session(self.session.uuid))
+
+    def test_needs_compaction_reads_message_count_without_queries(self):
+        self._add_turns(3)  # 6 件 = 4 + 2
+        with self.assertNumQueries(0):
+            self.assertFalse(needs_compaction(self.session))
+        # 作成時のシグナルで self.session.message_count も増えている
+        self._add_turns(1, start=3)
+        with self.assertNumQueries(0):
+            self.assertTrue(needs_compaction(self.session))
+        self.session.metadata = {"summary": {"until_id": 0, "message_count": 6}}
+        with self.assertNumQueries(0):
+            self.assertFalse(needs_compaction(self.session))
+
+    def test_failed_turns_do_not_count_toward_compaction(self):
+        class Flaky:
+            def __init__(self, fail):
+                self.fail = fail
+
+            def chat(self, messages, options=None):
+                if self.fail:
+                    raise RuntimeError("boom")
+                return ChatResult(content="ok", usage={})
+
+        def chat(text, fail=False):
+            with patch("core.usecases.build_llm_client", return_value=Flaky(fail)):
+                with patch("core.usecases.schedule_compaction"):
+                    try:
+                        ChatInSessionUsecase(self.session.uuid).run(text)
+                    except RuntimeError:
+                        pass
+
+        for i in range(5):
+            chat(f"fail{i}", fail=True)
+        chat("q0")
+        chat("q1")
+        session = ChatSession.objects.get(pk=self.session.pk)
+        # failed の user 5 件 + 完了した 2 ターン
+        self.assertEqual(session.message_count, 9)
+        self.assertEqual(session.completed_message_count, 4)
+        self.assertFalse(needs_compaction(session))
+
+        chat("q2")  # 完了 6 件 = 4 + 2
+        session = ChatSession.objects.get(pk=self.session.pk)
+        self.assertEqual(session.completed_message_count, 6)
+        self.assertFalse(needs_compaction(session))
+        chat("q3")
+        session = ChatSession.objects.get(pk=self.session.pk)
+        self.assertTrue(needs_compaction(session))
+
+    def test_compaction_is_incremental(self):
+        calls = []
+        self._add_turns(4)  # 8 件 > 4 + 2
+        with patch("core.summarization.build_llm_client", fake_summary_client(calls)):
+            self.assertTrue(compact_session(self.session.uuid))
+            self.session.refresh_from_db()
+            summary = self.session.metadata["summary"]
+            self.assertEqual(summary["content"], "summary 1")
+            self.assertEqual(summary["message_count"], 6)
+
+            # 閾値未満なら再要約しない
+            self.assertFalse(compact_session(self.session.uuid))
+
+            self._add_turns(3, start=4)  # 未要約 2 + 6 = 8 件
+            self.assertTrue(compact_session(self.session.uuid))
+
+        # 2 回目は前回の要約と新しい会話だけを渡す
+        prompt = calls[1][1]["content"]
+        self.assertIn("summary 1", prompt)
+        self.assertNotIn("q0", prompt)
+        self.assertIn("q3", prompt)
+        self.assertIn("q5", prompt)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.metadata["summary"]["message_count"], 12)
+
+    def test_history_uses_summary_and_watermark(self):
+        self._add_turns(4)
+        with patch("core.summarization.build_llm_client", fake_summary_client([])):
+            compact_session(self.session.uuid)
+        self.session.refresh_from_db()
+        current = Message.objects.create(
+            session=self.session, role="user", content="now", status="pending"
+        )
+
+        selected = TokenBudgetHistorySelector(budget=1000).select(self.session, current)
+
+        self.assertEqual(selected[0].role, "system")
+        self.assertIn("summary 1", selected[0].content)
+        self.assertEqual([m.content for m in selected[1:]], ["q3", "a3", "now"])
+
+    def test_schedule_starts_background_thread_once(self):
+        self._add_turns(4)
+        with (
+            patch("core.summarization._running", set()),
+            patch("core.summarization.threading.Thread") as thread,
+        ):
+            self.assertTrue(schedule_compaction(self.session))
+            self.assertFalse(schedule_compaction(self.session))
+        thread.return_value.start.assert_called_once()
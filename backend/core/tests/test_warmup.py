@@ -0,0 +1,51 @@
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.llm_clients import OllamaClient, build_llm_client
+from core.models import LLM
+
+
+class KeepAliveTests(TestCase):
+    def test_keep_alive_from_extra_is_sent_in_payload(self):
+        llm = LLM(model="llama3", extra={"keep_alive": "30m", "temperature": 0})
+        client = build_llm_client(llm)
+        self.assertEqual(client.default_params, {"temperature": 0})
+
+        payload = client._payload([], None, stream=False)
+        self.assertEqual(payload["keep_alive"], "30m")
+
+    def test_keep_alive_omitted_by_default(self):
+        client = OllamaClient(None, "llama3")
+        self.assertNotIn("keep_alive", client._payload([], None, stream=False))
+
+
+class WarmupCommandTests(TestCase):
+    def test_preloads_active_ollama_models(self):
+        LLM.objects.create(name="A", model="llama3", extra={"keep_alive": -1})
+        LLM.objects.create(name="B", model="gemma", is_active=False)
+        LLM.objects.create(name="C", model="gpt", provider="OPENAI")
+
+        posted = []
+        resp = MagicMock()
+
+        def fake_post(self_inner, url, json=None, **kwargs):
+            posted.append((url, json))
+            return resp
+
+        out = StringIO()
+        with patch("requests.Session.post", fake_post):
+            call_command("warmup_llms", stdout=out)
+
+        self.assertEqual(
+            posted,
+            [
+                (
+                    "http://ollama:11434/api/chat",
+                    {"model": "llama3", "messages": [], "keep_alive": -1},
+                )
+            ],
+        )
+        self.assertIn("warmed up", out.getvalue())
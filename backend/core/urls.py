@@ -1,13 +1,38 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import health, csrf_token, LLMViewSet, ChatSessionViewSet
+from .views import (
+    health,
+    csrf_token,
+    metrics,
+    export_messages,
+    chat_async,
+    chat_stream_async,
+    LLMViewSet,
+    ChatSessionViewSet,
+    ChatJobViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"llms", LLMViewSet, basename="llm")
 router.register(r"sessions", ChatSessionViewSet, basename="session")
+router.register(r"jobs", ChatJobViewSet, basename="job")
 
 urlpatterns = [
     path("health/", health, name="health"),
     path("csrf/", csrf_token, name="csrf-token"),
+    path("metrics/", metrics, name="metrics"),
+    path("exports/messages/", export_messages, name="export-messages"),
     path("", include(router.urls)),
 ]
+
+if settings.ASYNC_CHAT:
+    # ASGI モード: /chat/ と /chat/stream/ を async ビューで処理（router より先にマッチさせる）
+    urlpatterns[:0] = [
+        path("sessions/<uuid:pk>/chat/", chat_async, name="session-chat-async"),
+        path(
+            "sessions/<uuid:pk>/chat/stream/",
+            chat_stream_async,
+            name="session-chat-stream-async",
+        ),
+    ]
@@ -1,36 +1,92 @@
-from django.db import transaction
+import time
+from collections.abc import AsyncIterator, Iterator
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
 from .models import ChatSession, Message
-from .llm_clients import build_llm_client
+from .llm_clients import ChatResult, build_async_llm_client, build_llm_client
+from .llm_cache import get_llm
+from .history import HistorySelector, build_history_selector
+from .summarization import schedule_compaction
+from .metrics import record_chat
+from .admission import acquire_slot, admit
+from .profiling import span
+from . import archive, rag, response_cache, semantic_cache, session_stats
 
 
 class ChatInSessionUsecase:
-    def __init__(self, session_uuid):
-        self.session = ChatSession.objects.select_related("llm").get(
-            uuid=session_uuid, is_active=True
+    """セッション内で 1 ターンのチャットを実行する。
+
+    LLM 呼び出し中に DB トランザクション（コネクション）を保持しないよう、
+    1. user メッセージを pending で保存（短い書き込み）
+    2. トランザクション外で LLM 生成
+    3. assistant 保存と user の completed 化を短い atomic で確定
+    の 3 フェーズで処理する。履歴の選択とキャッシュ参照は 1 の前（生成スロットの
+    取得前）に行い、ヒットすればスロットを取らずに確定する。生成失敗・中断時は
+    ターンを failed / aborted に更新するため pending のまま残らない。
+    """
+
+    def __init__(self, session_uuid, history_selector: HistorySelector | None = None):
+        with span("session"):
+            self.session = ChatSession.objects.get(uuid=session_uuid, is_active=True)
+            # LLM は JOIN せずプロセス内キャッシュから（core/llm_cache.py）
+            self.session.llm = get_llm(self.session.llm_id)
+            if self.session.archived_at is not None:
+                # 履歴の選択・要約は Message テーブルを読むため先に戻す
+                archive.restore_session(self.session)
+        self.history_selector = history_selector or build_history_selector(
+            self.session.llm
         )
 
-    @transaction.atomic
-    def run(self, user_text: str, options: dict | None = None) -> dict:
-        Message.objects.create(
-            session=self.session,
-            role="user",
-            content=user_text,
+    def _new_message(self, user_text: str) -> Message:
+        # 保存は LLM 呼び出しの直前（キャッシュヒット / 拒否では保存しない）
+        return Message(
+            session=self.session, role="user", content=user_text, status="pending"
         )
 
-        messages = [
-            {"role": m.role, "content": m.content} for m in self.session.messages.all()
-        ]
+    def _begin(self, user_message: Message) -> Message:
+        # セッションの集計値（core/session_stats.py）も同じトランザクションで更新
+        with span("user_insert"), transaction.atomic():
+            user_message.save()
+        return user_message
 
-        client = build_llm_client(self.session.llm)
-        result = client.chat(messages, options=options)
+    def _history(self, user_message: Message) -> list[dict]:
+        with span("history"):
+            selected = self.history_selector.select(self.session, user_message)
+            messages = [{"role": m.role, "content": m.content} for m in selected]
+        # セッションで RAG が有効なら検索した資料を質問の直前に挿入
+        with span("rag"):
+            return rag.augment(self.session, messages)
 
-        assistant = Message.objects.create(
-            session=self.session,
-            role="assistant",
-            content=result.content,
-            usage=result.usage,
-        )
+    def _commit(
+        self,
+        user_message: Message,
+        content: str,
+        usage: dict,
+        status: str = "completed",
+        metadata: dict | None = None,
+    ) -> Message:
+        with span("assistant_insert"), transaction.atomic():
+            Message.objects.filter(pk=user_message.pk).update(status=status)
+            if status == "completed":
+                user_message.status = status
+                session_stats.completed(user_message)
+            return Message.objects.create(
+                session=self.session,
+                role="assistant",
+                content=content,
+                usage=usage,
+                status=status,
+                metadata=metadata or {},
+            )
+
+    def _fail(self, user_message: Message, status: str, detail: str = "") -> None:
+        fields = {"status": status}
+        if detail:
+            fields["metadata"] = {**user_message.metadata, "error": detail}
+        Message.objects.filter(pk=user_message.pk).update(**fields)
 
+    def _response(self, assistant: Message, usage: dict) -> dict:
         return {
             "session_uuid": str(self.session.uuid),
             "assistant_message": {
@@ -38,5 +94,300 @@ class ChatInSessionUsecase:
                 "role": "assistant",
                 "content": assistant.content,
             },
-            "usage": result.usage,
+            "usage": usage,
         }
+
+    def _lookup(self, messages: list[dict], options: dict | None):
+        """応答キャッシュ → セマンティックキャッシュの順に引く。
+
+        ``(cached, key, probe)`` を返す。key / probe はミス時の保存に使う。
+        """
+        llm = self.session.llm
+        with span("cache"):
+            key = response_cache.cache_key(llm, messages, options)
+            cached = response_cache.get(llm, key) if key else None
+            probe = None
+            if cached is None:
+                probe = semantic_cache.lookup(self.session, messages, options)
+                cached = probe.result if probe else None
+        return cached, key, probe
+
+    def _remember(self, key, probe, result) -> None:
+        if key:
+            response_cache.put(self.session.llm, key, result)
+        if probe:
+            semantic_cache.store(probe, result)
+
+    def _prepare(self, user_text: str, options: dict | None):
+        """履歴の組み立てとキャッシュ参照（DB への書き込みなし）"""
+        user_message = self._new_message(user_text)
+        messages = self._history(user_message)
+        return (user_message, messages, *self._lookup(messages, options))
+
+    def _commit_cached(self, user_message: Message, cached) -> Message:
+        # キャッシュヒットは生成していないので生成メトリクスには含めない
+        self._begin(user_message)
+        assistant = self._commit(
+            user_message, cached.content, cached.usage, metadata=cached.metadata
+        )
+        schedule_compaction(self.session)
+        return assistant
+
+    def run(self, user_text: str, options: dict | None = None) -> dict:
+        # キャッシュヒットは生成スロットを使わずに返す
+        user_message, messages, cached, key, probe = self._prepare(user_text, options)
+        if cached is not None:
+            assistant = self._commit_cached(user_message, cached)
+            return self._response(assistant, cached.usage)
+        # 同時生成数の上限に達していれば何も保存せず LLMBusyError
+        with admit(self.session.llm):
+            return self._run(user_message, messages, options, key, probe)
+
+    def _run(
+        self, user_message: Message, messages: list[dict], options, key, probe
+    ) -> dict:
+        self._begin(user_message)
+        llm = self.session.llm
+        started = time.perf_counter()
+        try:
+            client = build_llm_client(llm, affinity_key=str(self.session.uuid))
+            with span("llm"):
+                result = client.chat(messages, options=options)
+        except Exception as e:
+            record_chat(llm, {}, time.perf_counter() - started, "failed")
+            self._fail(user_message, "failed", str(e))
+            raise
+        except BaseException:
+            self._fail(user_message, "aborted")
+            raise
+
+        record_chat(llm, result.usage, time.perf_counter() - started)
+        self._remember(key, probe, result)
+        assistant = self._commit(
+            user_message, result.content, result.usage, metadata=result.metadata
+        )
+        schedule_compaction(self.session)
+        return self._response(assistant, result.usage)
+
+    def stream(self, user_text: str, options: dict | None = None) -> Iterator[dict]:
+        """チャンク単位で応答を返すストリーミング版 run。
+
+        ``{"event": "delta", "data": {...}}`` を順次 yield し、最後に
+        ``done`` イベントで run と同じ形のレスポンスを返す。クライアント切断
+        (GeneratorExit) や LLM エラー時は、それまでに受信したテキストを
+        aborted / failed の assistant メッセージとして保存する。
+        キャッシュヒットは delta 1 つと done をスロットを取らずに返す。
+        同時生成数の上限に達している場合は最初のイベントより前（呼び出し時）に
+        LLMBusyError を送出する。
+        """
+        user_message, messages, cached, key, probe = self._prepare(user_text, options)
+        if cached is not None:
+            return self._stream_cached(user_message, cached)
+        events = self._stream(user_message, messages, options, key, probe)
+        next(events)  # スロット取得まで進める
+        return events
+
+    def _stream_cached(self, user_message: Message, cached) -> Iterator[dict]:
+        assistant = self._commit_cached(user_message, cached)
+        yield {"event": "delta", "data": {"content": cached.content}}
+        yield {"event": "done", "data": self._response(assistant, cached.usage)}
+
+    def _stream(self, user_message, messages, options, key, probe) -> Iterator[dict]:
+        with admit(self.session.llm):
+            yield {}
+            yield from self._stream_turn(user_message, messages, options, key, probe)
+
+    def _stream_turn(
+        self, user_message: Message, messages: list[dict], options, key, probe
+    ) -> Iterator[dict]:
+        self._begin(user_message)
+
+        parts: list[str] = []
+        usage: dict = {}
+        metadata: dict = {}
+        status = "aborted"
+        detail = ""
+        started = time.perf_counter()
+        try:
+            client = build_llm_client(
+                self.session.llm, affinity_key=str(self.session.uuid)
+            )
+            for chunk in client.stream_chat(messages, options=options):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"event": "delta", "data": {"content": chunk.content}}
+                if chunk.done:
+                    usage, metadata = chunk.usage, chunk.metadata
+                    status = "completed"
+        except Exception as e:
+            status = "failed"
+            detail = str(e)
+            yield {"event": "error", "data": {"detail": detail}}
+        finally:
+            record_chat(self.session.llm, usage, time.perf_counter() - started, status)
+            assistant = None
+            if parts or status == "completed":
+                if detail:
+                    metadata = {**metadata, "error": detail}
+                assistant = self._commit(
+                    user_message, "".join(parts), usage, status, metadata
+                )
+            else:
+                self._fail(user_message, status, detail)
+        if status == "completed":
+            self._remember(key, probe, ChatResult("".join(parts), usage, metadata))
+            schedule_compaction(self.session)
+            yield {"event": "done", "data": self._response(assistant, usage)}
+
+
+def _release_db_connection() -> None:
+    # LLM 応答待ちの間は DB 接続を保持しない（トランザクション内では閉じない）
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+class AsyncChatInSessionUsecase:
+    """ChatInSessionUsecase.run / stream の async 版（ASGI モード用）。
+
+    DB 操作は同期版のフェーズをそのまま sync_to_async で実行し、LLM 応答待ちだけを
+    イベントループ上で行う。待機中は DB 接続も閉じるため、多数の待機中チャットを
+    少数のプロセス・DB 接続で保持できる。キャッシュ・ルーティング・レジリエンスは
+    同期版と同じく効く（後の 2 つは ThreadedAsyncClient でスレッド上で待つ）。
+    """
+
+    def __init__(self, usecase: ChatInSessionUsecase):
+        self.usecase = usecase
+        self.session = usecase.session
+
+    @classmethod
+    async def create(cls, session_uuid, **kwargs) -> "AsyncChatInSessionUsecase":
+        return cls(await sync_to_async(ChatInSessionUsecase)(session_uuid, **kwargs))
+
+    async def run(self, user_text: str, options: dict | None = None) -> dict:
+        uc = self.usecase
+        # 同期版と同じく、キャッシュヒットはスロットを取らずに返す
+        user_message, messages, cached, key, probe = await sync_to_async(uc._prepare)(
+            user_text, options
+        )
+        if cached is not None:
+            assistant = await sync_to_async(uc._commit_cached)(user_message, cached)
+            return uc._response(assistant, cached.usage)
+        # スロット待ちでイベントループを止めないよう別スレッドで取得する
+        slot = await sync_to_async(acquire_slot, thread_sensitive=False)(
+            self.session.llm
+        )
+        try:
+            return await self._run(user_message, messages, options, key, probe)
+        finally:
+            await sync_to_async(slot.release, thread_sensitive=False)()
+
+    async def _run(self, user_message, messages, options, key, probe) -> dict:
+        uc = self.usecase
+        await sync_to_async(uc._begin)(user_message)
+        started = time.perf_counter()
+        try:
+            client = build_async_llm_client(
+                self.session.llm, affinity_key=str(self.session.uuid)
+            )
+            await sync_to_async(_release_db_connection)()
+            result = await client.chat(messages, options=options)
+        except Exception as e:
+            record_chat(self.session.llm, {}, time.perf_counter() - started, "failed")
+            await sync_to_async(uc._fail)(user_message, "failed", str(e))
+            raise
+        except BaseException:
+            # asyncio.CancelledError（クライアント切断等）を含む
+            await sync_to_async(uc._fail)(user_message, "aborted")
+            raise
+
+        record_chat(self.session.llm, result.usage, time.perf_counter() - started)
+        await sync_to_async(uc._remember)(key, probe, result)
+        assistant = await sync_to_async(uc._commit)(
+            user_message, result.content, result.usage, metadata=result.metadata
+        )
+        await sync_to_async(schedule_compaction)(self.session)
+        return uc._response(assistant, result.usage)
+
+    async def stream(
+        self, user_text: str, options: dict | None = None
+    ) -> AsyncIterator[dict]:
+        """ChatInSessionUsecase.stream の async 版（イベントは同じ形）。
+
+        同期版と同じく、同時生成数の上限に達している場合は最初のイベントより前に
+        LLMBusyError を送出する。
+        """
+        uc = self.usecase
+        user_message, messages, cached, key, probe = await sync_to_async(uc._prepare)(
+            user_text, options
+        )
+        if cached is not None:
+            return self._stream_cached(user_message, cached)
+        events = self._stream(user_message, messages, options, key, probe)
+        await events.__anext__()  # スロット取得まで進める
+        return events
+
+    async def _stream_cached(self, user_message, cached) -> AsyncIterator[dict]:
+        uc = self.usecase
+        assistant = await sync_to_async(uc._commit_cached)(user_message, cached)
+        yield {"event": "delta", "data": {"content": cached.content}}
+        yield {"event": "done", "data": uc._response(assistant, cached.usage)}
+
+    async def _stream(
+        self, user_message, messages, options, key, probe
+    ) -> AsyncIterator[dict]:
+        slot = await sync_to_async(acquire_slot, thread_sensitive=False)(
+            self.session.llm
+        )
+        try:
+            yield {}
+            async for event in self._stream_turn(
+                user_message, messages, options, key, probe
+            ):
+                yield event
+        finally:
+            await sync_to_async(slot.release, thread_sensitive=False)()
+
+    async def _stream_turn(
+        self, user_message, messages, options, key, probe
+    ) -> AsyncIterator[dict]:
+        uc = self.usecase
+        llm = self.session.llm
+        await sync_to_async(uc._begin)(user_message)
+
+        parts: list[str] = []
+        usage: dict = {}
+        metadata: dict = {}
+        status = "aborted"
+        detail = ""
+        started = time.perf_counter()
+        try:
+            client = build_async_llm_client(llm, affinity_key=str(self.session.uuid))
+            await sync_to_async(_release_db_connection)()
+            async for chunk in client.stream_chat(messages, options=options):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"event": "delta", "data": {"content": chunk.content}}
+                if chunk.done:
+                    usage, metadata = chunk.usage, chunk.metadata
+                    status = "completed"
+        except Exception as e:
+            status = "failed"
+            detail = str(e)
+            yield {"event": "error", "data": {"detail": detail}}
+        finally:
+            # クライアント切断（GeneratorExit / CancelledError）でもターンを確定する
+            record_chat(llm, usage, time.perf_counter() - started, status)
+            assistant = None
+            if parts or status == "completed":
+                if detail:
+                    metadata = {**metadata, "error": detail}
+                assistant = await sync_to_async(uc._commit)(
+                    user_message, "".join(parts), usage, status, metadata
+                )
+            else:
+                await sync_to_async(uc._fail)(user_message, status, detail)
+        if status == "completed":
+            result = ChatResult("".join(parts), usage, metadata)
+            await sync_to_async(uc._remember)(key, probe, result)
+            await sync_to_async(schedule_compaction)(self.session)
+            yield {"event": "done", "data": uc._response(assistant, usage)}
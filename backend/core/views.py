@@ -1,15 +1,31 @@
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from rest_framework import viewsets, status
-from .models import LLM, ChatSession
+from .models import LLM, ChatJob, ChatSession
 from .serializers import (
     LLMSerializer,
     LLMCreateUpdateSerializer,
     ChatSessionCreateSerializer,
+    ChatSessionSerializer,
+    ChatJobSerializer,
     MessageSerializer,
 )
-from .usecases import ChatInSessionUsecase
+from .usecases import AsyncChatInSessionUsecase, ChatInSessionUsecase
+from .admission import LLMBusyError
+from .metrics import registry
+from .pagination import paginate_message_list, paginate_messages, paginate_sessions
+from .jobs import enqueue_chat_job
+from . import archive, export
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 
 
 @api_view(["GET"])
@@ -24,6 +40,44 @@ def csrf_token(request):
     return Response({"csrftoken": token})
 
 
+def metrics(request):
+    """Prometheus テキスト形式でプロセス内メトリクスを返す"""
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@require_GET
+def export_messages(request):
+    """全セッションのメッセージを NDJSON / CSV でストリーミングする（採点用）。
+
+    クエリ: ``format``（ndjson / csv）、``llm``、``session``（複数可）、
+    ``since`` / ``until``（ISO 日付 / 日時）
+    """
+    params = request.GET
+    fmt = params.get("format", "ndjson")
+    if fmt not in export.CONTENT_TYPES:
+        return JsonResponse({"detail": "format must be ndjson or csv"}, status=400)
+    try:
+        llm = int(params["llm"]) if params.get("llm") else None
+        sessions = [uuid.UUID(v) for v in params.getlist("session")]
+        since = export.parse_bound(params.get("since"))
+        until = export.parse_bound(params.get("until"), end=True)
+    except ValueError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    rows = export.rows(llm=llm, sessions=sessions, since=since, until=until)
+    content = export.render(rows, fmt)
+    if isinstance(request, ASGIRequest):
+        # ASGI では同期イテレータを list にまとめてから送られるため、
+        # 1 ブロックずつ取り出す async イテレータにする
+        content = _aiterate(content)
+    response = StreamingHttpResponse(content, content_type=export.CONTENT_TYPES[fmt])
+    filename = f"chats-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 class LLMViewSet(viewsets.ModelViewSet):
     queryset = LLM.objects.all()
 
@@ -37,14 +91,55 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
     queryset = ChatSession.objects.filter(is_active=True)
     serializer_class = ChatSessionCreateSerializer
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action in ["list", "retrieve"]:
+            # llm_name 用に JOIN（セッションごとの LLM 取得を避ける）
+            qs = qs.select_related("llm")
+        return qs
+
+    def get_serializer_class(self):
+        if self.action in ["list", "retrieve"]:
+            return ChatSessionSerializer
+        return ChatSessionCreateSerializer
+
+    def list(self, request):
+        qs = self.get_queryset()
+        params = request.query_params
+        if not any(k in params for k in ("limit", "before")):
+            # 後方互換: パラメータ無しは全件をリストで返す
+            qs = qs.order_by("-last_activity_at", "-uuid")
+            return Response(ChatSessionSerializer(qs, many=True).data)
+        try:
+            page = paginate_sessions(qs, params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        page["results"] = ChatSessionSerializer(page["results"], many=True).data
+        return Response(page)
+
     def perform_create(self, serializer):
         serializer.save()
 
     @action(detail=True, methods=["get"], url_path="messages")
     def messages(self, request, pk=None):
         session = self.get_object()
-        qs = session.messages.all()
-        return Response(MessageSerializer(qs, many=True).data)
+        if session.archived_at is not None:
+            # アーカイブ済みは圧縮した JSONL から読む（core/archive.py）
+            qs = archive.messages(session)
+            paginate = paginate_message_list
+        else:
+            qs = session.messages.all()
+            paginate = paginate_messages
+        params = request.query_params
+        if not any(k in params for k in ("limit", "before", "after", "since")):
+            # 後方互換: パラメータ無しは全件をリストで返す
+            return Response(MessageSerializer(qs, many=True).data)
+        try:
+            page = paginate(qs, params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        page["results"] = MessageSerializer(page["results"], many=True).data
+        return Response(page)
 
     @action(detail=True, methods=["post"], url_path="chat")
     def chat(self, request, pk=None):
@@ -55,6 +150,170 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         options = request.data.get("options", None)
+        if request.data.get("background"):
+            # ジョブとして登録して即座に返す（run_chat_worker が処理）
+            job = enqueue_chat_job(self.get_object(), message, options)
+            return Response(
+                ChatJobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+            )
         uc = ChatInSessionUsecase(pk)
-        result = uc.run(user_text=message, options=options)
+        try:
+            result = uc.run(user_text=message, options=options)
+        except LLMBusyError as e:
+            return _busy_response(e)
         return Response(result, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"], url_path="chat/stream")
+    def chat_stream(self, request, pk=None):
+        """chat と同じ入力で、応答を Server-Sent Events として逐次返す。"""
+        message = request.data.get("message", "").strip()
+        if not message:
+            return Response(
+                {"detail": "message is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        options = request.data.get("options", None)
+        uc = ChatInSessionUsecase(pk)
+        try:
+            events = uc.stream(user_text=message, options=options)
+        except LLMBusyError as e:
+            return _busy_response(e)
+        response = StreamingHttpResponse(
+            _sse_stream(events),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        # Nginx 等のリバースプロキシでバッファリングさせない
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+@csrf_exempt  # DRF の APIView と同じく未認証リクエストには CSRF を強制しない
+@require_POST
+async def chat_async(request, pk):
+    """ChatSessionViewSet.chat の async 版（ASGI モードで /chat/ を置き換える）"""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"detail": "invalid JSON"}, status=400)
+    message = (data.get("message") or "").strip()
+    if not message:
+        return JsonResponse({"detail": "message is required"}, status=400)
+    options = data.get("options", None)
+    if data.get("background"):
+        # 同期版と同じくジョブとして登録して即座に返す（run_chat_worker が処理）
+        try:
+            session = await ChatSession.objects.aget(uuid=pk, is_active=True)
+        except ChatSession.DoesNotExist:
+            return JsonResponse({"detail": "Not found."}, status=404)
+        job = await sync_to_async(enqueue_chat_job)(session, message, options)
+        return JsonResponse(ChatJobSerializer(job).data, status=202)
+    try:
+        uc = await AsyncChatInSessionUsecase.create(pk)
+    except ChatSession.DoesNotExist:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    try:
+        result = await uc.run(user_text=message, options=options)
+    except LLMBusyError as e:
+        response = JsonResponse({"detail": str(e)}, status=e.status_code)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+    return JsonResponse(result, status=200)
+
+
+@csrf_exempt
+@require_POST
+async def chat_stream_async(request, pk):
+    """ChatSessionViewSet.chat_stream の async 版（ASGI モードで /chat/stream/ を置き換える）
+
+    同期版のジェネレータは ASGI では全体を生成し終えてから送られるため、
+    AsyncOllamaClient のストリームを async ジェネレータのまま SSE にする。
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"detail": "invalid JSON"}, status=400)
+    message = (data.get("message") or "").strip()
+    if not message:
+        return JsonResponse({"detail": "message is required"}, status=400)
+    try:
+        uc = await AsyncChatInSessionUsecase.create(pk)
+    except ChatSession.DoesNotExist:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    try:
+        events = await uc.stream(user_text=message, options=data.get("options"))
+    except LLMBusyError as e:
+        response = JsonResponse({"detail": str(e)}, status=e.status_code)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+    response = StreamingHttpResponse(
+        _async_sse_stream(events), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class ChatJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ChatJob.objects.all()
+    serializer_class = ChatJobSerializer
+
+    @action(detail=True, methods=["get"], url_path="result")
+    def result(self, request, pk=None):
+        job = self.get_object()
+        if job.status == "completed":
+            return Response(job.result)
+        if job.status == "failed":
+            return Response(
+                {"detail": job.error or "job failed"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+        # まだ処理中: 202 で現在の状態を返す
+        return Response(ChatJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+def _busy_response(e: LLMBusyError) -> Response:
+    # 429（待ち行列が満杯）/ 503（待ち時間切れ）に再試行までの目安秒数を付ける
+    return Response(
+        {"detail": str(e)},
+        status=e.status_code,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _sse_stream(events):
+    # クライアント切断時に usecase 側ジェネレータも確実に close させる
+    try:
+        for e in events:
+            yield _sse(e["event"], e["data"])
+    finally:
+        events.close()
+
+
+async def _async_sse_stream(events):
+    try:
+        async for e in events:
+            yield _sse(e["event"], e["data"])
+    finally:
+        await events.aclose()
+
+
+async def _aiterate(iterator):
+    """同期イテレータを 1 要素ずつ取り出す async イテレータ。
+
+    DB カーソルを使うイテレータのため、リクエスト単位のスレッド
+    （thread_sensitive）で読む。
+    """
+    pull = sync_to_async(next)
+    try:
+        while (item := await pull(iterator, None)) is not None:
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def _sse(event: str, data: dict) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
@@ -32,6 +32,11 @@ fi
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput
 
+# 有効な LLM のモデルを Ollama に事前ロード（起動をブロックしないようバックグラウンド）
+if [ "${LLM_WARMUP:-true}" = "true" ]; then
+  python manage.py warmup_llms &
+fi
+
 # 初回の管理ユーザー自動作成（環境変数で制御）
 if [ "${DJANGO_CREATE_SUPERUSER:-true}" = "true" ]; then
   python manage.py shell <<'PYCODE'
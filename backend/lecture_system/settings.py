@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # REQUEST_PROFILING=true のときだけ有効（それ以外は MiddlewareNotUsed）
+    "core.profiling.ProfilingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     # WhiteNoise: Gunicorn配下で静的ファイルを提供（管理画面のCSS/JS含む）
@@ -84,3 +86,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 # 圧縮+ハッシュ付与でキャッシュ最適化
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# ASGI (lecture_system.asgi) で起動する場合に true にすると、
+# /api/sessions/{uuid}/chat/ を async ビュー + AsyncOllamaClient で処理する
+# (backends / ブレーカー / ヘッジを設定した LLM は同期クライアントをスレッドで呼ぶ)
+ASYNC_CHAT = os.getenv("ASYNC_CHAT", "false").lower() == "true"
+
+# RAG のベクトルファイル (core/rag.py, manage.py ingest_documents) の保存先
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(BASE_DIR, "rag_index"))
+
+# リクエストのプロファイリング (core/profiling.py)。Server-Timing ヘッダを付け、
+# SAMPLE_RATE の割合を cProfile で計測して SLOW_MS 以上のものを DIR に保存する
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "false").lower() == "true"
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv("REQUEST_PROFILING_SAMPLE_RATE", "0"))
+REQUEST_PROFILING_SLOW_MS = float(os.getenv("REQUEST_PROFILING_SLOW_MS", "1000"))
+REQUEST_PROFILING_DIR = os.getenv(
+    "REQUEST_PROFILING_DIR", os.path.join(BASE_DIR, "profiles")
+)